@@ -1,11 +1,12 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase
+import click
 import os
 import logging
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
@@ -14,95 +15,223 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 
 def create_app():
+    started = time.perf_counter()
+    timings = {}
     app = Flask(__name__, static_folder='static', static_url_path='')
 
+    # Logging: a default level, per-module overrides such as
+    # "app.routes=DEBUG,sqlalchemy.engine=INFO", and 'text' or 'json' lines
+    from app.logs import configure_logging
+    app.config['LOG_LEVEL'] = os.environ.get("LOG_LEVEL", "INFO")
+    app.config['LOG_LEVELS'] = os.environ.get("LOG_LEVELS", "")
+    app.config['LOG_FORMAT'] = os.environ.get("LOG_FORMAT", "text")
+    configure_logging(app)
+
     # Set secret key for sessions
     app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
     # Configure SQLAlchemy
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    # One connection pool per server process. The default size gives each
+    # request thread (WEB_THREADS, see gunicorn.conf.py) its own connection,
+    # with a little overflow for the background threads; a request waits at
+    # most DB_POOL_TIMEOUT seconds for a connection instead of piling up.
+    # Pre-ping costs a round trip on every checkout; recycling connections
+    # before the server's idle timeout avoids most stale ones without it,
+    # and SQLite never needs it. An in-memory SQLite database lives in one
+    # shared connection (StaticPool), which takes none of the sizing options.
+    database_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"] or "sqlite://")
+    in_memory = database_url.get_backend_name() == 'sqlite' and database_url.database in (None, '', ':memory:')
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 300)),
+        # Keep bound parameters (PINs, ID numbers) out of error messages and
+        # SQL logs
+        "hide_parameters": True,
+        "pool_pre_ping": (
+            os.environ.get("DB_POOL_PRE_PING", "1").lower() not in ('0', 'false', 'no')
+            and not (app.config["SQLALCHEMY_DATABASE_URI"] or "").startswith("sqlite")
+        ),
     }
+    if not in_memory:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", os.environ.get("WEB_THREADS", 4))),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 2)),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        })
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
     # Configure maximum content length for file uploads (16MB)
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+    # Page size for the paginated list endpoints
+    app.config['PAGE_SIZE_DEFAULT'] = int(os.environ.get("PAGE_SIZE_DEFAULT", 50))
+    app.config['PAGE_SIZE_MAX'] = int(os.environ.get("PAGE_SIZE_MAX", 500))
+
+    # Largest number of items accepted by the batch ingestion endpoint
+    app.config['BATCH_MAX_ITEMS'] = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+
+    # Responses stored for Idempotency-Key replays are kept this long
+    app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 7 * 24 * 3600))
+
+    # Apply pending schema migrations at startup; turn off to run
+    # `flask db upgrade` as a separate deploy step instead
+    app.config['AUTO_MIGRATE'] = os.environ.get("AUTO_MIGRATE", "1").lower() not in ('0', 'false', 'no')
+
+    # Longest series the dashboard may request, in buckets
+    app.config['ROLLUP_MAX_BUCKETS'] = int(os.environ.get("ROLLUP_MAX_BUCKETS", 1000))
+
     # Initialize the database
     db.init_app(app)
 
+    # Customer photos are kept on disk, the database only stores references
+    from app.photo_store import photo_store, migrate_photo_blobs
+    app.config['PHOTO_STORAGE_PATH'] = os.environ.get(
+        "PHOTO_STORAGE_PATH", os.path.join(app.instance_path, 'photos')
+    )
+    photo_store.init_app(app)
+
+    # Rendered thumbnails are kept in memory, bounded by this byte budget
+    from app.photo_cache import variant_cache
+    app.config['PHOTO_VARIANT_CACHE_BYTES'] = int(os.environ.get(
+        "PHOTO_VARIANT_CACHE_BYTES", 32 * 1024 * 1024
+    ))
+    variant_cache.init_app(app)
+
+    # Image decoding and encoding run in a bounded process pool
+    from app.images import image_pool
+    app.config['IMAGE_POOL_WORKERS'] = int(os.environ.get("IMAGE_POOL_WORKERS", min(os.cpu_count() or 1, 4)))
+    app.config['IMAGE_POOL_MAX_PENDING'] = int(os.environ.get(
+        "IMAGE_POOL_MAX_PENDING", max(app.config['IMAGE_POOL_WORKERS'], 1) * 4
+    ))
+    app.config['IMAGE_MAX_DIMENSION'] = int(os.environ.get("IMAGE_MAX_DIMENSION", 2048))
+    app.config['IMAGE_JPEG_QUALITY'] = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+    app.config['IMAGE_SPOOL_THRESHOLD'] = int(os.environ.get("IMAGE_SPOOL_THRESHOLD", 256 * 1024))
+    image_pool.init_app(app)
+
+    # Rendered responses of the read-mostly endpoints, bounded by this byte budget
+    from app.http_cache import response_cache
+    app.config['HTTP_CACHE_ENABLED'] = os.environ.get("HTTP_CACHE_ENABLED", "1").lower() not in ('0', 'false', 'no')
+    app.config['HTTP_CACHE_BYTES'] = int(os.environ.get("HTTP_CACHE_BYTES", 8 * 1024 * 1024))
+    response_cache.init_app(app)
+
+    # Expired internet sessions are marked, and announced, by a background sweeper
+    from app.internet import session_sweeper
+    app.config['INTERNET_SWEEP_INTERVAL'] = int(os.environ.get("INTERNET_SWEEP_INTERVAL", 60))
+    session_sweeper.init_app(app)
+
+    # WiFi passwords are pre-generated in batches and handed out from a pool
+    from app.internet import wifi_password_pool
+    app.config['WIFI_PASSWORD_POOL_SIZE'] = int(os.environ.get("WIFI_PASSWORD_POOL_SIZE", 256))
+    app.config['WIFI_PASSWORD_LENGTH'] = int(os.environ.get("WIFI_PASSWORD_LENGTH", 12))
+    wifi_password_pool.init_app(app)
+
+    # JSON is encoded with orjson when it is installed; 'stdlib' uses the
+    # standard library encoder
+    from app.wire import json_provider
+    app.config['JSON_ENCODER'] = os.environ.get("JSON_ENCODER", "orjson")
+    app.json = json_provider(app)
+
+    # API responses are brotli- or gzip-compressed for clients that accept it;
+    # RESPONSE_COMPRESSION lists the encodings to offer, empty turns it off
+    from app.wire import response_compressor
+    app.config['RESPONSE_COMPRESSION'] = os.environ.get("RESPONSE_COMPRESSION", "br,gzip")
+    app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+    app.config['GZIP_LEVEL'] = int(os.environ.get("GZIP_LEVEL", 6))
+    app.config['BROTLI_QUALITY'] = int(os.environ.get("BROTLI_QUALITY", 5))
+    response_compressor.init_app(app)
+
+    @app.cli.command('migrate-photos')
+    def migrate_photos_command():
+        """Move photo blobs out of the customer table into the photo store."""
+        migrate_photo_blobs()
+
+    @app.cli.group('db')
+    def db_command():
+        """Manage the database schema."""
+
+    @db_command.command('upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations."""
+        from app.migrations import upgrade
+        click.echo(f"Applied {upgrade()} migrations")
+
+    @db_command.command('current')
+    def db_current_command():
+        """Show the current schema version."""
+        from app.migrations import current_version, MIGRATIONS
+        click.echo(f"Schema version {current_version()} of {MIGRATIONS[-1][0]}")
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys_command():
+        """Delete stored Idempotency-Key responses older than the TTL."""
+        from app.idempotency import purge_expired
+        purge_expired()
+
+    @app.cli.command('backfill-rollups')
+    def backfill_rollups_command():
+        """Rebuild the dashboard usage rollups from the transaction history."""
+        from app.rollups import backfill_rollups
+        from app.http_cache import invalidate
+        backfill_rollups()
+        invalidate('transactions')
+        db.session.commit()
+
+    @app.cli.command('sweep-internet-sessions')
+    def sweep_internet_sessions_command():
+        """Mark expired internet sessions and send their expiry events."""
+        from app.internet import sweep_expired_sessions
+        sweep_expired_sessions(app)
+
+    @app.cli.command('reconcile-inventory')
+    def reconcile_inventory_command():
+        """Recompute the battery inventory counters from the battery units."""
+        from app.inventory import reconcile_inventory
+        from app.http_cache import invalidate
+        reconcile_inventory()
+        invalidate('batteries')
+        db.session.commit()
+
+    timings['extensions'] = time.perf_counter() - started
+
     with app.app_context():
         # Import models here to avoid circular imports
-        from app.models import Customer, BatteryRental, WaterSale, InternetAccess, BatteryType, Battery
+        from app import models
+        from app.migrations import upgrade, pending_migrations
+        from app.seed import seed_defaults
 
+        phase = time.perf_counter()
         try:
-            # Drop all tables and recreate them with the new schema
-            db.drop_all()
-            db.create_all()
-            logger.info("Database tables created successfully")
+            if app.config['AUTO_MIGRATE']:
+                upgrade()
+                pending = []
+            else:
+                pending = pending_migrations()
         except Exception as e:
-            logger.error(f"Error creating database tables: {str(e)}")
+            logger.error("Error migrating the database schema: %s", e)
             raise
-
-        # Initialize default battery types
-        try:
-            default_battery_types = [
-                {
-                    'name': 'Phone Charge at Waypoint',
-                    'type': 'charging',
-                    'capacity': None,
-                    'rental_price': 0.28,
-                    'delivery_fee': 0.00,
-                    'units': 0
-                },
-                {
-                    'name': '250 Wh Anker Battery',
-                    'type': 'battery',
-                    'capacity': '250 Wh',
-                    'rental_price': 0.56,
-                    'delivery_fee': 0.84,
-                    'units': 80
-                },
-                {
-                    'name': 'Small Portable Battery',
-                    'type': 'battery',
-                    'capacity': '100 Wh',
-                    'rental_price': 0.28,
-                    'delivery_fee': 0.84,
-                    'units': 5
-                }
-            ]
-
-            for battery_type_data in default_battery_types:
-                units = battery_type_data.pop('units')
-                battery_type = BatteryType(**battery_type_data)
-                db.session.add(battery_type)
-                db.session.flush()  # Get the ID of the battery type
-
-                # Create battery units if it's a physical battery
-                if battery_type.type == 'battery':
-                    for i in range(units):
-                        battery = Battery(
-                            battery_type_id=battery_type.id,
-                            unit_number=i + 1,
-                            status='available'
-                        )
-                        db.session.add(battery)
-
-            db.session.commit()
-            logger.info("Default battery types and units initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing default battery types: {str(e)}")
-            db.session.rollback()
+        timings['migrations'] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        if pending:
+            logger.warning("%s schema migrations are pending, run `flask db upgrade`", len(pending))
+        else:
+            try:
+                seed_defaults()
+            except Exception as e:
+                logger.error("Error initializing default battery types: %s", e)
+                db.session.rollback()
+        timings['seed'] = time.perf_counter() - phase
 
         # Import routes after models are initialized
+        phase = time.perf_counter()
         from app.routes import bp
         app.register_blueprint(bp)
 
         @app.route('/')
         def index():
             return app.send_static_file('index.html')
+        timings['routes'] = time.perf_counter() - phase
 
-    return app
\ No newline at end of file
+    breakdown = ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+    logger.info("Startup took %.1f ms (%s)", (time.perf_counter() - started) * 1000, breakdown)
+    return app
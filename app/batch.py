@@ -0,0 +1,207 @@
+from flask import current_app
+from app import db, http_cache, inventory, rollups
+from app.idempotency import IN_PROGRESS, conflicts, fingerprint, lookup
+from app.internet import calculate_expiration_date, wifi_password_pool
+from app.models import Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess, IdempotencyRecord
+from app.pagination import parse_datetime
+from sqlalchemy import insert
+from datetime import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchError(ValueError):
+    """Raised when a batch payload as a whole is malformed."""
+
+
+def _timestamp(data, field):
+    # Offline-queued items may carry the time the sale actually happened;
+    # one with an offset is stored, and rolled up, as naive UTC
+    value = data.get(field)
+    return parse_datetime(value, field) if value else datetime.utcnow()
+
+
+def _rental_row(data):
+    battery_type, battery = inventory.allocate(data.get('battery_id'), data.get('battery_type_id'))
+    return {
+        'customer_id': data['customer_id'],
+        'battery_id': battery.id if battery else None,
+        'battery_type_id': battery_type.id,
+        'rental_price': data.get('rental_price', 0.0),
+        'delivery_fee': data.get('delivery_fee', 0.0),
+        'rented_at': _timestamp(data, 'rented_at'),
+    }
+
+
+def _water_sale_row(data):
+    return {
+        'customer_id': data['customer_id'],
+        'size': data['size'],
+        'price': data['price'],
+        'sold_at': _timestamp(data, 'sold_at'),
+    }
+
+
+def _internet_access_row(data):
+    purchased_at = _timestamp(data, 'purchased_at')
+    return {
+        'customer_id': data['customer_id'],
+        'wifi_password': wifi_password_pool.take(),
+        'duration_type': data['duration_type'],
+        'price': data['price'],
+        'purchased_at': purchased_at,
+        'expires_at': calculate_expiration_date(purchased_at, data['duration_type']),
+    }
+
+
+def _health_record_row(data):
+    return {
+        'customer_id': data['customer_id'],
+        'symptoms': data['symptoms'],
+        'treatments': data['treatments'],
+        'notes': data.get('notes', ''),
+        'visit_date': _timestamp(data, 'visit_date'),
+    }
+
+
+# Transaction type -> (model, row builder, fields echoed back in the result)
+TRANSACTION_TYPES = {
+    'rental': (BatteryRental, _rental_row, ('battery_id',)),
+    'water_sale': (WaterSale, _water_sale_row, ()),
+    'internet_access': (InternetAccess, _internet_access_row, ('wifi_password', 'expires_at')),
+    'health_record': (HealthAccess, _health_record_row, ()),
+}
+
+# Endpoint each transaction type is posted to on its own, and its timestamp
+# field. Items take the endpoint as their idempotency scope, so a key
+# settles once whether it arrives in a batch or in a single request; the
+# timestamp, which only batches send, is left out of the fingerprint.
+SINGLE_ENDPOINTS = {
+    'rental': ('/api/rentals', 'rented_at'),
+    'water_sale': ('/api/water-sales', 'sold_at'),
+    'internet_access': ('/api/internet-access', 'purchased_at'),
+    'health_record': ('/api/health-access', 'visit_date'),
+}
+
+
+def _item_scope(transaction_type, data):
+    scope, timestamp_field = SINGLE_ENDPOINTS[transaction_type]
+    return scope, fingerprint({field: value for field, value in data.items() if field != timestamp_field})
+
+
+def process_batch(items):
+    """Insert a list of mixed transactions in one database transaction.
+
+    Each item is {"type", "idempotency_key", "data"}. Items whose key was
+    already processed return the stored result with status "duplicate",
+    unless the key was used for another type or payload, which is an error;
+    invalid items get status "error" without affecting the others, and
+    "retryable": true when the same item may succeed if sent again later. New rows
+    are inserted with one multi-row INSERT per transaction type. Returns the
+    per-item results in request order.
+    """
+    if not isinstance(items, list):
+        raise BatchError('items must be a list')
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 500)
+    if len(items) > max_items:
+        raise BatchError(f"A batch may contain at most {max_items} items")
+
+    results = [None] * len(items)
+
+    # Replays: look up every key in one query
+    keys = [item.get('idempotency_key') for item in items if isinstance(item, dict)]
+    stored = lookup([key for key in keys if key])
+    customer_ids = {
+        row.id for row in db.session.query(Customer.id).filter(Customer.id.in_(
+            [item['data'].get('customer_id') for item in items
+             if isinstance(item, dict) and isinstance(item.get('data'), dict)]
+        ))
+    }
+
+    pending = {name: [] for name in TRANSACTION_TYPES}
+    seen_keys = {}
+    for index, item in enumerate(items):
+        key = item.get('idempotency_key') if isinstance(item, dict) else None
+        if not key:
+            results[index] = {'status': 'error', 'error': 'idempotency_key is required'}
+            continue
+        transaction_type = item.get('type')
+        data = item.get('data')
+        if transaction_type not in TRANSACTION_TYPES or not isinstance(data, dict):
+            results[index] = {'idempotency_key': key, 'status': 'error',
+                              'error': f"Unknown transaction type: {transaction_type}"}
+            continue
+
+        scope, digest = _item_scope(transaction_type, data)
+        if key in stored:
+            if conflicts(stored[key], scope, digest):
+                results[index] = {'idempotency_key': key, 'status': 'error',
+                                  'error': 'This key was already used for a different request'}
+            elif stored[key].status_code == IN_PROGRESS:
+                # Not settled yet; the client keeps the item and sends it again later
+                results[index] = {'idempotency_key': key, 'status': 'error', 'retryable': True,
+                                  'error': 'A request with this key is still in progress'}
+            else:
+                results[index] = dict(json.loads(stored[key].response), status='duplicate')
+            continue
+        if key in seen_keys:
+            if seen_keys[key] != (scope, digest):
+                results[index] = {'idempotency_key': key, 'status': 'error',
+                                  'error': 'This key was already used for a different request'}
+            else:
+                results[index] = {'idempotency_key': key, 'status': 'duplicate'}
+            continue
+        seen_keys[key] = (scope, digest)
+
+        if data.get('customer_id') not in customer_ids:
+            results[index] = {'idempotency_key': key, 'status': 'error', 'error': 'Customer not found'}
+            continue
+
+        _, build_row, _ = TRANSACTION_TYPES[transaction_type]
+        try:
+            if transaction_type == 'rental':
+                # Rentals claim a battery; a savepoint undoes a failed claim on its own
+                with db.session.begin_nested():
+                    row = build_row(data)
+            else:
+                row = build_row(data)
+        except (KeyError, ValueError, inventory.BatteryUnavailable) as e:
+            message = f"Missing required field: {str(e)}" if isinstance(e, KeyError) else str(e)
+            results[index] = {'idempotency_key': key, 'status': 'error', 'error': message}
+            continue
+        pending[transaction_type].append((index, key, row))
+
+    records = []
+    if any(pending.values()):
+        versions = http_cache.invalidate('transactions', *(('batteries',) if pending['rental'] else ()))
+        for entries in pending.values():
+            for _, _, row in entries:
+                row['sync_version'] = versions['transactions']
+    for transaction_type, entries in pending.items():
+        if not entries:
+            continue
+        model, _, echoed = TRANSACTION_TYPES[transaction_type]
+        ids = db.session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, _, row in entries]
+        ).all()
+        for (index, key, row), new_id in zip(entries, ids):
+            result = {'idempotency_key': key, 'type': transaction_type, 'id': new_id}
+            for field in echoed:
+                value = row[field]
+                result[field] = value.isoformat() if isinstance(value, datetime) else value
+            scope, digest = seen_keys[key]
+            records.append({'key': key, 'scope': scope, 'fingerprint': digest,
+                            'status_code': 201, 'response': json.dumps(result)})
+            results[index] = dict(result, status='created')
+        rollups.record_many(transaction_type, [row for _, _, row in entries])
+
+    if records:
+        db.session.execute(insert(IdempotencyRecord), records)
+    db.session.commit()
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    logger.info("Processed batch of %s items, %s created", len(items), created)
+    return results
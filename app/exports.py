@@ -0,0 +1,125 @@
+from app import db
+from app.models import Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess
+from sqlalchemy import select
+from datetime import datetime
+import csv
+import io
+import json
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched from the database and written out per chunk
+CHUNK_ROWS = 1000
+
+
+def _customer_name_columns():
+    return (Customer.first_name.label('customer_first_name'), Customer.last_name.label('customer_last_name'))
+
+
+# Export name -> (model, timestamp column the date filter applies to, columns)
+EXPORTS = {
+    'rentals': (BatteryRental, BatteryRental.rented_at, (
+        BatteryRental.id, BatteryRental.customer_id, *_customer_name_columns(),
+        BatteryRental.battery_type_id, BatteryRental.battery_id, BatteryRental.rental_price,
+        BatteryRental.delivery_fee, BatteryRental.rented_at, BatteryRental.returned_at,
+    )),
+    'water-sales': (WaterSale, WaterSale.sold_at, (
+        WaterSale.id, WaterSale.customer_id, *_customer_name_columns(),
+        WaterSale.size, WaterSale.price, WaterSale.sold_at,
+    )),
+    'internet-access': (InternetAccess, InternetAccess.purchased_at, (
+        InternetAccess.id, InternetAccess.customer_id, *_customer_name_columns(),
+        InternetAccess.duration_type, InternetAccess.price, InternetAccess.wifi_password,
+        InternetAccess.purchased_at, InternetAccess.expires_at,
+    )),
+    'health-access': (HealthAccess, HealthAccess.visit_date, (
+        HealthAccess.id, HealthAccess.customer_id, *_customer_name_columns(),
+        HealthAccess.visit_date, HealthAccess.symptoms, HealthAccess.treatments, HealthAccess.notes,
+    )),
+    # No PIN, photo references or search text
+    'customers': (Customer, Customer.created_at, (
+        Customer.id, Customer.first_name, Customer.middle_name, Customer.last_name,
+        Customer.second_last_name, Customer.phone, Customer.email, Customer.address_line1,
+        Customer.address_line2, Customer.city, Customer.country, Customer.state_province,
+        Customer.postal_code, Customer.date_of_birth, Customer.birth_city, Customer.id_type,
+        Customer.id_number, Customer.created_at, Customer.updated_at,
+    )),
+}
+
+
+def build_export_query(name, start=None, end=None):
+    """Return the ordered SELECT for an export, filtered to [start, end]."""
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export: {name}")
+    model, timestamp, columns = EXPORTS[name]
+    statement = select(*columns)
+    if model is not Customer:
+        statement = statement.join(Customer, Customer.id == model.customer_id)
+    if start:
+        statement = statement.where(timestamp >= start)
+    if end:
+        statement = statement.where(timestamp <= end)
+    return statement.order_by(timestamp, model.id)
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Each chunk generator yields (text, number of rows in it)
+
+def _csv_chunks(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    for rows in result.partitions():
+        writer.writerows([_value(value) for value in row] for row in rows)
+        yield buffer.getvalue(), len(rows)
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header is left over when there were no rows
+    yield buffer.getvalue(), 0
+
+
+def _ndjson_chunks(result):
+    keys = list(result.keys())
+    for rows in result.partitions():
+        yield ''.join(
+            json.dumps(dict(zip(keys, (_value(value) for value in row))), ensure_ascii=False) + '\n'
+            for row in rows
+        ), len(rows)
+
+
+def stream_export(statement, fmt, compress=False):
+    """Yield the export as encoded chunks, one per CHUNK_ROWS rows.
+
+    yield_per makes the query use a server-side cursor where the driver
+    supports it (psycopg2), so only one chunk of rows is in memory at a
+    time however long the range, and the first bytes go out as soon as
+    the first chunk is read. With compress the chunks are gzip-compressed
+    as they are produced.
+    """
+    result = db.session.execute(statement.execution_options(yield_per=CHUNK_ROWS))
+    chunks = _csv_chunks(result) if fmt == 'csv' else _ndjson_chunks(result)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    exported = 0
+    try:
+        for chunk, rows in chunks:
+            data = chunk.encode('utf-8')
+            exported += rows
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+    finally:
+        result.close()
+    logger.info("Exported %s rows as %s", exported, fmt)
@@ -0,0 +1,160 @@
+from flask import current_app, make_response, request, Response
+from app import db
+from app.models import CacheVersion
+from app.photo_cache import VariantCache
+from app.wire import MIMETYPES, response_format
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+import functools
+import hashlib
+import os
+import threading
+import time
+
+# What the cached endpoints depend on. Every write handler calls
+# invalidate() with the scopes it changes.
+SCOPES = ('batteries', 'customers', 'transactions')
+
+
+def _initial_version():
+    # Counters start from the clock rather than 0, so a recreated database
+    # never reissues an ETag a browser still holds from the old one
+    return int(time.time())
+
+
+def create_versions():
+    """Insert the missing scope counters. Used by the migration."""
+    existing = set(db.session.scalars(select(CacheVersion.scope)))
+    for scope in SCOPES:
+        if scope not in existing:
+            db.session.add(CacheVersion(scope=scope, version=_initial_version()))
+    db.session.commit()
+
+
+def invalidate(*scopes):
+    """Bump the given scopes in the current transaction and return {scope: new version}.
+
+    Call before the write commits: the new version becomes visible together
+    with the data, in every server process at once. The bump locks the
+    scope's row until commit, so versions are handed out in commit order,
+    which lets the change feed (app/sync.py) stamp rows with them. Scopes
+    are bumped in sorted order whatever order they are passed in, so two
+    writes bumping the same scopes always lock them in the same order and
+    cannot deadlock on each other.
+    """
+    versions = {}
+    for scope in sorted(set(scopes)):
+        statement = update(CacheVersion).where(CacheVersion.scope == scope).values(
+            version=CacheVersion.version + 1
+        ).returning(CacheVersion.version).execution_options(synchronize_session=False)
+        version = db.session.scalar(statement)
+        if version is None:
+            try:
+                with db.session.begin_nested():
+                    version = _initial_version()
+                    db.session.execute(insert(CacheVersion).values(scope=scope, version=version))
+            except IntegrityError:
+                version = db.session.scalar(statement)
+        versions[scope] = version
+    return versions
+
+
+def current_versions(scopes):
+    rows = db.session.execute(
+        select(CacheVersion.scope, CacheVersion.version).where(CacheVersion.scope.in_(scopes))
+    ).all()
+    versions = dict(rows)
+    return tuple(versions.get(scope, 0) for scope in scopes)
+
+
+class ResponseCache(VariantCache):
+    """In-memory LRU of rendered GET responses, with hit counters.
+
+    Keys are ETags, which change whenever a scope the endpoint depends on
+    is bumped, so stale entries are never served and simply age out.
+    Counters are per server process.
+    """
+
+    def __init__(self, app=None):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(app)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.setdefault('HTTP_CACHE_BYTES', 8 * 1024 * 1024)
+        app.extensions['http_cache'] = self
+
+    def count(self, outcome):
+        with self._stats_lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._stats_lock:
+            requests = self.hits + self.misses + self.not_modified
+            return {
+                'pid': os.getpid(),
+                'hits': self.hits,
+                'not_modified': self.not_modified,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.not_modified) / requests if requests else None,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def cached(*scopes, period=None, sync_token=False):
+    """Serve a GET handler from the response cache with ETag revalidation.
+
+    The ETag is derived from the path, the query string, the negotiated
+    encoding and the current versions of the scopes, so checking it costs
+    one small query; a matching If-None-Match gets a 304 without running
+    the handler.
+    Responses say Cache-Control: no-cache so browsers always revalidate.
+    For handlers whose output also depends on the clock (default date
+    ranges), period adds the current period-second window to the key.
+    With sync_token the response carries the first scope's version as the
+    X-Sync-Token to pass to the endpoint's ?since= change feed.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('HTTP_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+
+            versions = current_versions(scopes)
+            fmt = response_format()
+            key = [request.path, request.query_string.decode(), fmt, *map(str, versions)]
+            if period:
+                key.append(str(int(time.time() // period)))
+            etag = hashlib.sha1('\0'.join(key).encode()).hexdigest()[:32]
+
+            if request.if_none_match.contains_weak(etag):
+                response_cache.count('not_modified')
+                response = Response(status=304)
+            else:
+                body = response_cache.get(etag)
+                if body is not None:
+                    response_cache.count('hits')
+                    response = Response(body, mimetype=MIMETYPES[fmt])
+                else:
+                    response_cache.count('misses')
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.put(etag, response.get_data())
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            if sync_token:
+                response.headers['X-Sync-Token'] = str(versions[0])
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,158 @@
+from flask import current_app, jsonify, make_response, request, Response
+from app import db
+from app.models import IdempotencyRecord
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import functools
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# status_code of a record whose request is still being handled
+IN_PROGRESS = 0
+
+_last_purge = 0.0
+
+
+def _ttl():
+    return timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL_SECONDS', 7 * 24 * 3600))
+
+
+def purge_expired():
+    """Delete stored responses older than IDEMPOTENCY_TTL_SECONDS."""
+    cutoff = datetime.utcnow() - _ttl()
+    result = db.session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff))
+    db.session.commit()
+    logger.info("Purged %s expired idempotency records", result.rowcount)
+    return result.rowcount
+
+
+def _maybe_purge():
+    # Evict expired keys at most once per interval in each process
+    global _last_purge
+    interval = current_app.config.get('IDEMPOTENCY_PURGE_INTERVAL', 3600)
+    if time.monotonic() - _last_purge >= interval:
+        _last_purge = time.monotonic()
+        purge_expired()
+
+
+def _is_stale(record):
+    now = datetime.utcnow()
+    if record.status_code == IN_PROGRESS:
+        # The request that claimed the key died without finishing
+        lock_timeout = current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60)
+        return record.created_at < now - timedelta(seconds=lock_timeout)
+    return record.created_at < now - _ttl()
+
+
+def fingerprint(payload):
+    """SHA-256 of a request payload (parsed JSON or form fields), independent of key order."""
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()
+    ).hexdigest()
+
+
+def _request_fingerprint():
+    if request.is_json:
+        return fingerprint(request.get_json(silent=True))
+    # Uploaded files are left out so they are not read a second time
+    return fingerprint(request.form.to_dict(flat=False))
+
+
+def conflicts(record, scope, digest):
+    """Whether a stored record was made for another endpoint or payload than the current one."""
+    # Records stored before keys were scoped carry neither, and match anything
+    return record.scope is not None and (record.scope != scope or record.fingerprint != digest)
+
+
+def lookup(keys):
+    """Return the live records for the given keys, dropping expired ones.
+
+    Like _claim(), a key left in progress longer than
+    IDEMPOTENCY_LOCK_TIMEOUT counts as expired, so its item can be written.
+    """
+    records = {}
+    for record in IdempotencyRecord.query.filter(IdempotencyRecord.key.in_(keys)):
+        if _is_stale(record):
+            db.session.delete(record)
+        else:
+            records[record.key] = record
+    db.session.flush()
+    return records
+
+
+def _claim(key, scope, digest):
+    """Reserve a key for this request. Returns None if claimed, else the existing record."""
+    record = db.session.get(IdempotencyRecord, key)
+    if record is not None and _is_stale(record):
+        db.session.delete(record)
+        db.session.commit()
+        record = None
+    if record is not None:
+        return record
+
+    db.session.add(IdempotencyRecord(key=key, scope=scope, fingerprint=digest, status_code=IN_PROGRESS, response=''))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request claimed the same key first
+        db.session.rollback()
+        return db.session.get(IdempotencyRecord, key)
+    return None
+
+
+def _finish(key, response):
+    db.session.rollback()
+    if response is None or response.status_code >= 500:
+        # Server errors are not stored so the client can retry with the same key
+        db.session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key == key))
+    else:
+        db.session.execute(update(IdempotencyRecord).where(IdempotencyRecord.key == key).values(
+            status_code=response.status_code,
+            response=response.get_data(as_text=True),
+            created_at=datetime.utcnow()
+        ))
+    db.session.commit()
+
+
+def idempotent(view):
+    """Make a POST handler safe to replay with an Idempotency-Key header.
+
+    The first request with a key runs the handler and its response is
+    stored; later requests with the same key get the stored response back
+    (with an Idempotent-Replayed header) instead of writing again. A key
+    reused for another endpoint or with a different payload gets a 422.
+    Requests without the header are handled as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 100:
+            return jsonify({'error': 'Idempotency-Key must be at most 100 characters'}), 400
+
+        _maybe_purge()
+        scope, digest = request.path, _request_fingerprint()
+        record = _claim(key, scope, digest)
+        if record is not None:
+            if conflicts(record, scope, digest):
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            if record.status_code == IN_PROGRESS:
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            response = Response(record.response, status=record.status_code, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        response = None
+        try:
+            response = make_response(view(*args, **kwargs))
+            return response
+        finally:
+            _finish(key, response)
+
+    return wrapper
@@ -0,0 +1,178 @@
+from flask import current_app
+from app.photo_store import guess_mimetype, save_photo
+from concurrent.futures import ProcessPoolExecutor
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Import PIL at the module level to avoid repeated imports. HEIF support is
+# optional on top of it; without it other formats are still converted.
+try:
+    from PIL import Image, ImageOps
+    have_pil = True
+except Exception as e:
+    Image = None
+    ImageOps = None
+    have_pil = False
+    logger.warning("PIL not available: %s", e)
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    have_heif = True
+    logger.debug("HEIF support available for image processing")
+except Exception as e:
+    have_heif = False
+    logger.warning("HEIF support not available: %s", e)
+
+# Image types served to the browser as stored, without conversion
+BROWSER_IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+
+# Longest edge in pixels for each derived variant; 'full' keeps the original size
+VARIANT_SIZES = {
+    'full': None,
+    'thumb': 400,
+    'avatar': 96,
+}
+
+
+class ImagePoolBusy(Exception):
+    """Raised when too many image jobs are already queued."""
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload is not an image we can decode."""
+
+
+def normalize_image(source, max_dimension, quality):
+    """Decode an uploaded image and re-encode it for storage.
+
+    source is either the image bytes or the path of a spooled upload. The
+    image is rotated according to its EXIF orientation, downscaled to fit
+    within max_dimension and saved without metadata, so GPS and camera
+    tags never reach the photo store. Images with transparency stay PNG,
+    everything else becomes JPEG.
+    """
+    if not have_pil:
+        if isinstance(source, bytes):
+            return source
+        with open(source, 'rb') as f:
+            return f.read()
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        original_format = img.format
+        # For JPEG, let the decoder skip detail we are about to throw away
+        # instead of decoding at full resolution
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension))
+
+        output_io = io.BytesIO()
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img.save(output_io, 'PNG', optimize=True)
+        else:
+            img.convert('RGB').save(output_io, 'JPEG', quality=quality)
+        logger.debug("Normalized %s upload to %s", original_format, img.size)
+        return output_io.getvalue()
+    except Exception as e:
+        raise InvalidImage(f"Could not decode image: {str(e)}")
+
+
+def render_variant(path, max_size, quality):
+    """Render a stored image as a JPEG no larger than max_size and return the bytes."""
+    img = Image.open(path)
+    if max_size:
+        img.draft('RGB', (max_size, max_size))
+        img.thumbnail((max_size, max_size))
+    output_io = io.BytesIO()
+    img.convert('RGB').save(output_io, 'JPEG', quality=quality)
+    return output_io.getvalue()
+
+
+class ImagePool:
+    """Bounded process pool for image decoding and encoding.
+
+    Decoding a large HEIC and re-encoding it takes seconds of CPU, so the
+    work runs in separate processes instead of inside the request thread.
+    At most IMAGE_POOL_MAX_PENDING jobs may be queued or running; callers
+    beyond that wait up to IMAGE_POOL_SUBMIT_TIMEOUT seconds for a slot and
+    then get ImagePoolBusy. With IMAGE_POOL_WORKERS set to 0 jobs run inline.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.setdefault('IMAGE_POOL_WORKERS', min(os.cpu_count() or 1, 4))
+        self.max_pending = app.config.setdefault('IMAGE_POOL_MAX_PENDING', max(self.workers, 1) * 4)
+        self.submit_timeout = app.config.setdefault('IMAGE_POOL_SUBMIT_TIMEOUT', 5)
+        self.result_timeout = app.config.setdefault('IMAGE_POOL_RESULT_TIMEOUT', 60)
+        self.max_dimension = app.config.setdefault('IMAGE_MAX_DIMENSION', 2048)
+        self.quality = app.config.setdefault('IMAGE_JPEG_QUALITY', 85)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        app.extensions['image_pool'] = self
+
+    def _get_executor(self):
+        with self._lock:
+            # Created lazily, and again after a fork, so each server worker
+            # process owns its own pool
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            raise ImagePoolBusy('Image processing is busy, please retry shortly')
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result(timeout=self.result_timeout)
+        finally:
+            self._slots.release()
+
+    def normalize(self, data):
+        return self.run(normalize_image, data, self.max_dimension, self.quality)
+
+    def render_variant(self, path, variant):
+        return self.run(render_variant, path, VARIANT_SIZES[variant], self.quality)
+
+
+image_pool = ImagePool()
+
+
+def ingest_photo(file):
+    """Validate, normalize and store one uploaded photo.
+
+    Uploads up to IMAGE_SPOOL_THRESHOLD bytes are handed to the image pool
+    in memory. Larger ones are copied in chunks to a temporary file and only
+    its path is sent to the pool, so a big upload is never held in memory
+    more than once. Returns the stored Photo row.
+    """
+    header = file.stream.read(32)
+    if guess_mimetype(header) == 'application/octet-stream':
+        raise InvalidImage(f"{file.filename} is not a supported image format")
+    file.stream.seek(0)
+
+    threshold = current_app.config.get('IMAGE_SPOOL_THRESHOLD', 256 * 1024)
+    head = file.stream.read(threshold + 1)
+    if len(head) <= threshold:
+        return save_photo(image_pool.normalize(head))
+
+    with tempfile.NamedTemporaryFile(prefix='upload-') as spool:
+        spool.write(head)
+        del head
+        shutil.copyfileobj(file.stream, spool, 64 * 1024)
+        spool.flush()
+        return save_photo(image_pool.normalize(spool.name))
@@ -0,0 +1,254 @@
+from app import db, http_cache
+from app.models import Customer, InternetAccess
+from blinker import Namespace
+from sqlalchemy import select, update
+from datetime import datetime, timedelta
+from collections import deque
+import logging
+import os
+import secrets
+import string
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_signals = Namespace()
+
+# Sent once per session when the sweeper marks it expired, with the
+# application as sender and session={'id', 'customer_id', 'wifi_password',
+# 'expires_at'}, e.g. to revoke the password on the captive portal
+session_expired = _signals.signal('internet-session-expired')
+
+
+def calculate_expiration_date(start_date, duration_type):
+    if duration_type == '24h':
+        return start_date + timedelta(days=1)
+    elif duration_type == '3d':
+        return start_date + timedelta(days=3)
+    elif duration_type == '1w':
+        return start_date + timedelta(weeks=1)
+    elif duration_type == '1m':
+        return start_date + timedelta(days=30)  # Approximating a month as 30 days
+    else:
+        raise ValueError(f"Invalid duration type: {duration_type}")
+
+
+WIFI_PASSWORD_ALPHABET = string.ascii_letters + string.digits
+
+# How many passwords a sale tries when the one it took belongs to a live session
+PASSWORD_ATTEMPTS = 5
+
+
+def generate_wifi_password(length=12):
+    # Generate password using secure random choice
+    return ''.join(secrets.choice(WIFI_PASSWORD_ALPHABET) for i in range(length))
+
+
+def generate_wifi_passwords(count, length=12):
+    """Return count random passwords, drawn from one block of random bytes.
+
+    Bytes at or above the largest multiple of the alphabet size are
+    discarded so every character stays uniformly distributed.
+    """
+    alphabet = WIFI_PASSWORD_ALPHABET
+    limit = 256 - 256 % len(alphabet)
+    chars = []
+    while len(chars) < count * length:
+        needed = count * length - len(chars)
+        chars.extend(alphabet[b % len(alphabet)] for b in secrets.token_bytes(needed + needed // 8 + 8) if b < limit)
+    return [''.join(chars[i:i + length]) for i in range(0, count * length, length)]
+
+
+def active_sessions(columns, now=None):
+    """SELECT of the given columns for sessions that have not expired yet.
+
+    Filters on expires_at in SQL, so with the expires_at index only live
+    sessions are read, however many have been sold.
+    """
+    now = now or datetime.utcnow()
+    return select(*columns).where(InternetAccess.expires_at > now).order_by(InternetAccess.expires_at)
+
+
+def active_session_rows():
+    return db.session.execute(active_sessions((
+        InternetAccess.id, InternetAccess.customer_id, Customer.first_name, Customer.last_name,
+        InternetAccess.wifi_password, InternetAccess.duration_type, InternetAccess.purchased_at,
+        InternetAccess.expires_at,
+    )).join(Customer, Customer.id == InternetAccess.customer_id)).mappings().all()
+
+
+def active_passwords():
+    # Served from the (expires_at, wifi_password) index alone
+    return db.session.execute(
+        active_sessions((InternetAccess.wifi_password, InternetAccess.expires_at))
+    ).mappings().all()
+
+
+class WifiPasswordPool:
+    """Pre-generated WiFi passwords, handed out at sale time.
+
+    take() pops a password from an in-memory queue. When the queue drops
+    below a quarter of WIFI_PASSWORD_POOL_SIZE a background thread refills
+    it with a batch from the generator, minus any password that an active
+    session already uses. The unique index on active passwords is the
+    final guarantee; once the sweeper expires a session its password no
+    longer blocks new ones. If the queue runs dry a password is generated
+    inline. The generator is any callable taking (count, length), so
+    deployments can plug in their own password scheme.
+    """
+
+    def __init__(self, app=None, generator=generate_wifi_passwords):
+        self.generator = generator
+        self.size = 0
+        self.length = 12
+        self._passwords = deque()
+        self._wanted = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = app.config.setdefault('WIFI_PASSWORD_POOL_SIZE', 256)
+        self.length = app.config.setdefault('WIFI_PASSWORD_LENGTH', 12)
+        self._app = app
+        app.extensions['wifi_password_pool'] = self
+
+    def take(self):
+        if not self.size:
+            return self.generator(1, self.length)[0]
+        self._start()
+        try:
+            password = self._passwords.popleft()
+        except IndexError:
+            logger.debug("WiFi password pool is empty, generating inline")
+            password = self.generator(1, self.length)[0]
+        if len(self._passwords) < self.size // 4:
+            self._wanted.set()
+        return password
+
+    def fill(self):
+        """Top the queue up to WIFI_PASSWORD_POOL_SIZE. Needs an app context."""
+        missing = self.size - len(self._passwords)
+        if missing <= 0:
+            return 0
+        candidates = set(self.generator(missing, self.length)) - set(self._passwords)
+        in_use = db.session.scalars(
+            select(InternetAccess.wifi_password)
+            .where(InternetAccess.status == 'active', InternetAccess.wifi_password.in_(candidates))
+        ).all()
+        db.session.rollback()
+        fresh = candidates.difference(in_use)
+        self._passwords.extend(fresh)
+        return len(fresh)
+
+    def _start(self):
+        # One refill thread per server process, started on first use
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._passwords.clear()
+            self._pid = os.getpid()
+            self._wanted.set()
+            self._thread = threading.Thread(target=self._run, name='wifi-password-pool', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            with self._app.app_context():
+                try:
+                    self.fill()
+                except Exception as e:
+                    logger.error("Error refilling WiFi password pool: %s", e)
+                finally:
+                    db.session.remove()
+
+
+wifi_password_pool = WifiPasswordPool()
+
+
+def sweep_expired_sessions(app):
+    """Mark sessions past their expiry as expired and send session_expired.
+
+    The status change is a conditional UPDATE ... RETURNING, so when several
+    server processes sweep at once each session is reported by exactly one.
+    """
+    expired = db.session.execute(
+        update(InternetAccess)
+        .where(InternetAccess.status == 'active', InternetAccess.expires_at <= datetime.utcnow())
+        .values(status='expired')
+        .returning(InternetAccess.id, InternetAccess.customer_id,
+                   InternetAccess.wifi_password, InternetAccess.expires_at)
+        .execution_options(synchronize_session=False)
+    ).mappings().all()
+    if expired:
+        # Stamp the sessions so the change feed sends their new status
+        version = http_cache.invalidate('transactions')['transactions']
+        db.session.execute(
+            update(InternetAccess).where(InternetAccess.id.in_([session['id'] for session in expired]))
+            .values(sync_version=version).execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    for session in expired:
+        try:
+            session_expired.send(app, session=dict(session))
+        except Exception as e:
+            logger.error("Error in session_expired receiver for session %s: %s", session['id'], e)
+    if expired:
+        logger.info("Marked %s internet sessions as expired", len(expired))
+    return len(expired)
+
+
+class SessionSweeper:
+    """Background thread that runs sweep_expired_sessions periodically.
+
+    Started on the first request of each server process (and again after a
+    fork), so CLI commands never start it. INTERNET_SWEEP_INTERVAL sets the
+    period in seconds; 0 disables the thread, for deployments that run
+    `flask sweep-internet-sessions` from cron instead.
+    """
+
+    def __init__(self, app=None):
+        self.interval = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.setdefault('INTERNET_SWEEP_INTERVAL', 60)
+        app.before_request(lambda: self.start(app))
+        app.extensions['internet_sweeper'] = self
+
+    def start(self, app):
+        if not self.interval or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='internet-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.interval)
+            with app.app_context():
+                try:
+                    sweep_expired_sessions(app)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Error sweeping expired internet sessions: %s", e)
+                finally:
+                    db.session.remove()
+
+
+session_sweeper = SessionSweeper()
@@ -0,0 +1,171 @@
+from app import db
+from app.models import Battery, BatteryInventory, BatteryType
+from sqlalchemy import func, update
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATTERY_STATUSES = ('available', 'rented', 'maintenance')
+
+# How often claim_any_battery retries when a candidate is taken under it
+CLAIM_ATTEMPTS = 10
+
+
+class BatteryUnavailable(Exception):
+    """Raised when a rental asks for a battery that cannot be handed out."""
+
+
+def _adjust(battery_type_id, deltas):
+    """Apply relative changes to a type's counters in the current transaction.
+
+    The update is expressed in SQL (available = available + 1, ...) so
+    concurrent writers never overwrite each other's counts.
+    """
+    values = {status: getattr(BatteryInventory, status) + delta for status, delta in deltas.items()}
+    statement = update(BatteryInventory).where(
+        BatteryInventory.battery_type_id == battery_type_id
+    ).values(**values).execution_options(synchronize_session=False)
+
+    if db.session.execute(statement).rowcount == 0:
+        # First units of this type: start the counters from zero
+        db.session.add(BatteryInventory(battery_type_id=battery_type_id, available=0, rented=0, maintenance=0))
+        db.session.flush()
+        db.session.execute(statement)
+
+
+def change_status(battery, status):
+    """Set a battery's status and move it between its type's counters."""
+    if status not in BATTERY_STATUSES:
+        raise ValueError(f"Invalid battery status: {status}")
+    if battery.status == status:
+        return
+    _adjust(battery.battery_type_id, {battery.status: -1, status: 1})
+    battery.status = status
+
+
+def _claim(battery_id):
+    """Mark one battery as rented if, and only if, it is still available.
+
+    The status check and the write are a single UPDATE, so two concurrent
+    checkouts of the same unit cannot both succeed: the second one matches
+    no row once the first has committed.
+    """
+    result = db.session.execute(
+        update(Battery).where(Battery.id == battery_id, Battery.status == 'available')
+        .values(status='rented').execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    battery = db.session.get(Battery, battery_id, populate_existing=True)
+    _adjust(battery.battery_type_id, {'available': -1, 'rented': 1})
+    return battery
+
+
+def claim_battery(battery_id):
+    """Claim a specific battery for a rental. Returns None if it is not available."""
+    return _claim(battery_id)
+
+
+def claim_any_battery(battery_type_id):
+    """Claim any available battery of a type. Returns None if none is left.
+
+    On PostgreSQL the candidate row is locked with FOR UPDATE SKIP LOCKED,
+    so concurrent checkouts each get a different unit without waiting on
+    one another. SQLite has no row locks; there we retry with the next
+    candidate when another writer claimed ours first.
+    """
+    candidates = Battery.query.with_entities(Battery.id).filter(
+        Battery.battery_type_id == battery_type_id,
+        Battery.status == 'available'
+    ).order_by(Battery.unit_number).limit(1)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        battery_id = candidates.with_for_update(skip_locked=True).scalar()
+        return _claim(battery_id) if battery_id is not None else None
+
+    for _ in range(CLAIM_ATTEMPTS):
+        battery_id = candidates.scalar()
+        if battery_id is None:
+            return None
+        battery = _claim(battery_id)
+        if battery is not None:
+            return battery
+    return None
+
+
+def allocate(battery_id=None, battery_type_id=None):
+    """Claim what a rental needs and return (battery_type, battery).
+
+    With a battery_id that unit is claimed. Otherwise the battery type is
+    looked up; physical battery types get any available unit, charging
+    services need no unit and battery is None.
+    """
+    if battery_id:
+        battery = claim_battery(battery_id)
+        if battery is None:
+            raise BatteryUnavailable('Battery is not available for rent')
+        return battery.battery_type, battery
+
+    battery_type = db.session.get(BatteryType, battery_type_id)
+    if battery_type is None:
+        raise BatteryUnavailable(f"Unknown battery type: {battery_type_id}")
+    if battery_type.type != 'battery':
+        return battery_type, None
+
+    battery = claim_any_battery(battery_type.id)
+    if battery is None:
+        raise BatteryUnavailable('No batteries of this type are available')
+    return battery_type, battery
+
+
+def release_battery(battery):
+    """Make a rented battery available again; a no-op if it already was."""
+    result = db.session.execute(
+        update(Battery).where(Battery.id == battery.id, Battery.status == 'rented')
+        .values(status='available').execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        _adjust(battery.battery_type_id, {'rented': -1, 'available': 1})
+    db.session.refresh(battery)
+
+
+def add_units(battery_type_id, count):
+    """Count newly created available units of a battery type."""
+    if count:
+        _adjust(battery_type_id, {'available': count})
+
+
+def remove_unit(battery):
+    """Stop counting a battery that is being deleted."""
+    _adjust(battery.battery_type_id, {battery.status: -1})
+
+
+def reconcile_inventory():
+    """Recompute every type's counters from the Battery rows."""
+    counts = {}
+    for battery_type_id, status, count in db.session.query(
+        Battery.battery_type_id, Battery.status, func.count(Battery.id)
+    ).group_by(Battery.battery_type_id, Battery.status):
+        counts.setdefault(battery_type_id, dict.fromkeys(BATTERY_STATUSES, 0))
+        if status in BATTERY_STATUSES:
+            counts[battery_type_id][status] = count
+        else:
+            logger.warning("Ignoring %s batteries with unknown status %s", count, status)
+
+    corrected = 0
+    inventories = {inv.battery_type_id: inv for inv in BatteryInventory.query.all()}
+    for battery_type_id in inventories:
+        counts.setdefault(battery_type_id, dict.fromkeys(BATTERY_STATUSES, 0))
+    for battery_type_id, type_counts in counts.items():
+        inventory = inventories.get(battery_type_id)
+        if inventory is None:
+            inventory = BatteryInventory(battery_type_id=battery_type_id)
+            db.session.add(inventory)
+        if any(getattr(inventory, status) != type_counts[status] for status in BATTERY_STATUSES):
+            corrected += 1
+            for status in BATTERY_STATUSES:
+                setattr(inventory, status, type_counts[status])
+
+    db.session.commit()
+    logger.info("Inventory reconciled, %s battery types corrected", corrected)
+    return corrected
@@ -0,0 +1,99 @@
+from sqlalchemy import String, bindparam, case, cast
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Customer, BatteryRental, BatteryType, WaterSale, InternetAccess, Battery, HealthAccess
+
+# Loader options for the list serializers that still load entities, so the
+# relationships they touch come in the same SELECT instead of one extra
+# query per row.
+
+BATTERY_LIST = (
+    joinedload(Battery.battery_type),
+)
+
+
+def field_names(columns):
+    return tuple(column.key for column in columns)
+
+
+# Column projections for the transaction lists. Each row comes back as one
+# flat tuple with its display fields computed by the database, and is
+# serialized as it is (wire.list_response), timestamps included. Customers
+# contribute only their name.
+def _customer_name():
+    return (Customer.first_name + ' ' + Customer.last_name).label('customer_name')
+
+
+RENTAL_LIST_COLUMNS = (
+    BatteryRental.id,
+    _customer_name(),
+    case(
+        (Battery.id.is_(None), BatteryType.name),
+        else_=BatteryType.name + ' (Unit #' + cast(Battery.unit_number, String) + ')',
+    ).label('battery_name'),
+    BatteryRental.rental_price, BatteryRental.delivery_fee, BatteryRental.rented_at, BatteryRental.returned_at,
+)
+
+WATER_SALE_LIST_COLUMNS = (
+    WaterSale.id, _customer_name(), WaterSale.size, WaterSale.price, WaterSale.sold_at,
+)
+
+# Status is worked out against the 'now' parameter rather than the status
+# column, which only changes when the sweeper runs
+INTERNET_ACCESS_LIST_COLUMNS = (
+    InternetAccess.id, _customer_name(), InternetAccess.purchased_at, InternetAccess.expires_at,
+    InternetAccess.wifi_password, InternetAccess.duration_type, InternetAccess.price,
+    case((InternetAccess.expires_at > bindparam('now'), 'Active'), else_='Expired').label('status'),
+)
+
+HEALTH_RECORD_LIST_COLUMNS = (
+    HealthAccess.id, _customer_name(), HealthAccess.visit_date, HealthAccess.symptoms,
+    HealthAccess.treatments, HealthAccess.notes,
+)
+
+RENTAL_LIST_FIELDS = field_names(RENTAL_LIST_COLUMNS)
+WATER_SALE_LIST_FIELDS = field_names(WATER_SALE_LIST_COLUMNS)
+INTERNET_ACCESS_LIST_FIELDS = field_names(INTERNET_ACCESS_LIST_COLUMNS)
+HEALTH_RECORD_LIST_FIELDS = field_names(HEALTH_RECORD_LIST_COLUMNS)
+
+
+def rental_list():
+    return (db.session.query(*RENTAL_LIST_COLUMNS).select_from(BatteryRental)
+            .join(BatteryRental.customer).join(BatteryRental.battery_type).outerjoin(BatteryRental.battery))
+
+
+def water_sale_list():
+    return db.session.query(*WATER_SALE_LIST_COLUMNS).select_from(WaterSale).join(WaterSale.customer)
+
+
+def internet_access_list(now):
+    return (db.session.query(*INTERNET_ACCESS_LIST_COLUMNS).select_from(InternetAccess)
+            .join(InternetAccess.customer).params(now=now))
+
+
+def health_record_list():
+    return db.session.query(*HEALTH_RECORD_LIST_COLUMNS).select_from(HealthAccess).join(HealthAccess.customer)
+
+
+# Column projections for the customer endpoints, which serialize plain rows
+# instead of loading whole Customer entities
+CUSTOMER_LIST_COLUMNS = (
+    Customer.id, Customer.first_name, Customer.middle_name, Customer.last_name,
+    Customer.second_last_name, Customer.phone, Customer.address_line1, Customer.city,
+)
+CUSTOMER_LIST_FIELDS = field_names(CUSTOMER_LIST_COLUMNS)
+
+CUSTOMER_DETAIL_COLUMNS = (
+    Customer.id, Customer.first_name, Customer.middle_name, Customer.last_name,
+    Customer.second_last_name, Customer.phone, Customer.email,
+    Customer.address_line1, Customer.address_line2, Customer.city, Customer.country,
+    Customer.state_province, Customer.postal_code, Customer.date_of_birth,
+    Customer.birth_city, Customer.id_type, Customer.id_number,
+)
+
+# Photo presence is answered by the database, never by reading the photo
+CUSTOMER_PHOTO_FLAGS = (
+    Customer.selfie_photo_sha256.is_not(None).label('has_selfie'),
+    Customer.id_photo_sha256.is_not(None).label('has_id_photo'),
+    Customer.bill_photo_sha256.is_not(None).label('has_bill_photo'),
+)
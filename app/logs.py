@@ -0,0 +1,100 @@
+from collections.abc import Mapping
+from datetime import datetime, timezone
+import json
+import logging
+
+# Request fields that never reach a log line in clear text
+REDACTED_FIELDS = frozenset({'pin', 'id_number'})
+REDACTED = '[redacted]'
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+
+def redact(data):
+    """Return a copy of a mapping with the REDACTED_FIELDS masked.
+
+    Accepts request form data (a MultiDict) as well as plain dicts and
+    recurses into nested mappings and lists.
+    """
+    if isinstance(data, Mapping):
+        return {
+            key: REDACTED if key in REDACTED_FIELDS and value not in (None, '') else redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, (list, tuple)):
+        return [redact(value) for value in data]
+    return data
+
+
+class RedactingFilter(logging.Filter):
+    """Mask sensitive fields in mapping arguments of any log record.
+
+    Log calls pass payloads as %-style arguments, so this runs only for
+    records at an enabled level and never for disabled debug calls.
+    """
+
+    def filter(self, record):
+        if isinstance(record.args, Mapping):
+            record.args = redact(record.args)
+        elif record.args:
+            record.args = tuple(
+                redact(arg) if isinstance(arg, (Mapping, list)) else arg for arg in record.args
+            )
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed through extra=."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def parse_levels(spec):
+    """Parse "app.routes=DEBUG,sqlalchemy.engine=INFO" into a dict."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, level = item.partition('=')
+        if not sep or not isinstance(logging.getLevelName(level.strip().upper()), int):
+            raise ValueError(f"Invalid LOG_LEVELS entry: {item}")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(app):
+    """Set up the root handler and per-module levels from the app config.
+
+    LOG_LEVEL is the default level, LOG_LEVELS overrides it per logger and
+    LOG_FORMAT picks 'text' or 'json' output. When the root logger already
+    has handlers (e.g. under a test runner) only the levels are applied.
+    """
+    root = logging.getLogger()
+    root.setLevel(app.config['LOG_LEVEL'].upper())
+    for name, level in parse_levels(app.config['LOG_LEVELS']).items():
+        logging.getLogger(name).setLevel(level)
+
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        if app.config['LOG_FORMAT'] == 'json':
+            handler.setFormatter(JSONFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+    for handler in root.handlers:
+        if not any(isinstance(f, RedactingFilter) for f in handler.filters):
+            handler.addFilter(RedactingFilter())
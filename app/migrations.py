@@ -0,0 +1,182 @@
+from app import db
+from app.models import SchemaMigration
+from sqlalchemy import func, inspect, select, text, update
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7_302_114
+
+
+def _create_tables():
+    # Creates only the tables that are missing; existing ones are left alone
+    db.create_all()
+
+
+def _move_photo_blobs():
+    from app.photo_store import migrate_photo_blobs
+    migrate_photo_blobs()
+
+
+def _create_index(name, table, columns, unique=False, where=None):
+    # Migrations spell out the indexes they add instead of reading them from
+    # the models, which may already index columns a later migration adds
+    statement = f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    if where:
+        statement += f" WHERE {where}"
+    db.session.execute(text(statement))
+
+
+# Indexes of the list, filter and checkout paths, as first released.
+# create_all() only indexes the tables it creates, so migration 3 adds them
+# to tables that already existed.
+INITIAL_INDEXES = (
+    ('ix_battery_type_status', 'battery', ('battery_type_id', 'status')),
+    ('ix_battery_rental_rented_at', 'battery_rental', ('rented_at', 'id')),
+    ('ix_battery_rental_customer_rented_at', 'battery_rental', ('customer_id', 'rented_at', 'id')),
+    ('ix_battery_rental_battery_id', 'battery_rental', ('battery_id',)),
+    ('ix_water_sale_sold_at', 'water_sale', ('sold_at', 'id')),
+    ('ix_water_sale_customer_sold_at', 'water_sale', ('customer_id', 'sold_at', 'id')),
+    ('ix_internet_access_purchased_at', 'internet_access', ('purchased_at', 'id')),
+    ('ix_internet_access_customer_purchased_at', 'internet_access', ('customer_id', 'purchased_at', 'id')),
+    ('ix_health_access_visit_date', 'health_access', ('visit_date', 'id')),
+    ('ix_health_access_customer_visit_date', 'health_access', ('customer_id', 'visit_date', 'id')),
+    ('ix_idempotency_record_created_at', 'idempotency_record', ('created_at',)),
+)
+
+
+def _create_initial_indexes():
+    for name, table, columns in INITIAL_INDEXES:
+        _create_index(name, table, columns)
+    # Rentals still out, newest first
+    _create_index('ix_battery_rental_open', 'battery_rental', ('rented_at', 'id'), where='returned_at IS NULL')
+    db.session.commit()
+
+
+def _build_inventory_counters():
+    from app.inventory import reconcile_inventory
+    reconcile_inventory()
+
+
+def _build_usage_rollups():
+    from app.rollups import backfill_rollups
+    backfill_rollups()
+
+
+def _build_customer_search_index():
+    from app.search import build_search_index
+    build_search_index()
+
+
+def _add_internet_session_status():
+    from app.models import InternetAccess
+
+    columns = {c['name'] for c in inspect(db.engine).get_columns(InternetAccess.__tablename__)}
+    if 'status' not in columns:
+        db.session.execute(text(
+            "ALTER TABLE internet_access ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'active'"
+        ))
+    # Sessions that ran out before there was a sweeper expire without events
+    db.session.execute(
+        update(InternetAccess)
+        .where(InternetAccess.status == 'active', InternetAccess.expires_at <= datetime.utcnow())
+        .values(status='expired')
+    )
+    _create_index('ix_internet_access_expires_at', 'internet_access', ('expires_at', 'wifi_password'))
+    _create_index('ix_internet_access_status_expires_at', 'internet_access', ('status', 'expires_at'))
+    db.session.commit()
+
+
+def _create_active_password_index():
+    # Passwords are 12 random characters, so existing active sessions
+    # practically never share one
+    _create_index('ix_internet_access_active_password', 'internet_access', ('wifi_password',),
+                  unique=True, where="status = 'active'")
+    db.session.commit()
+
+
+def _create_cache_versions():
+    from app.http_cache import create_versions
+    _create_tables()
+    create_versions()
+
+
+def _add_sync_versions():
+    from app.models import Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess
+
+    for model in (Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess):
+        table = model.__tablename__
+        columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+        if 'sync_version' not in columns:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN sync_version INTEGER NOT NULL DEFAULT 0"))
+        _create_index(f'ix_{table}_sync_version', table, ('sync_version', 'id'))
+    db.session.commit()
+
+
+def _scope_idempotency_keys():
+    columns = {c['name'] for c in inspect(db.engine).get_columns('idempotency_record')}
+    if 'scope' not in columns:
+        db.session.execute(text("ALTER TABLE idempotency_record ADD COLUMN scope VARCHAR(200)"))
+    if 'fingerprint' not in columns:
+        db.session.execute(text("ALTER TABLE idempotency_record ADD COLUMN fingerprint VARCHAR(64)"))
+    db.session.commit()
+
+
+# Ordered list of (version, name, function). Append new migrations at the
+# end with the next version number; never renumber or remove one that has
+# shipped. Each must be safe on a fresh database as well as an old one.
+MIGRATIONS = [
+    (1, 'create tables', _create_tables),
+    (2, 'move photo blobs to the photo store', _move_photo_blobs),
+    (3, 'create indexes', _create_initial_indexes),
+    (4, 'build battery inventory counters', _build_inventory_counters),
+    (5, 'build usage rollups', _build_usage_rollups),
+    (6, 'build customer search index', _build_customer_search_index),
+    (7, 'add internet session status', _add_internet_session_status),
+    (8, 'make active WiFi passwords unique', _create_active_password_index),
+    (9, 'create response cache versions', _create_cache_versions),
+    (10, 'add change feed versions', _add_sync_versions),
+    (11, 'scope idempotency keys', _scope_idempotency_keys),
+]
+
+
+def current_version():
+    """Return the highest applied migration version, or 0 for a new database."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return db.session.scalar(select(func.max(SchemaMigration.version))) or 0
+
+
+def pending_migrations():
+    version = current_version()
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def upgrade():
+    """Apply every pending migration in order. Returns how many ran.
+
+    On PostgreSQL an advisory lock makes concurrent server workers wait for
+    the first one to finish instead of migrating twice. With nothing
+    pending this is a single query.
+    """
+    if not pending_migrations():
+        return 0
+
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        lock = db.engine.connect()
+        lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+    try:
+        # Another worker may have migrated while we waited for the lock
+        pending = pending_migrations()
+        for version, name, migrate in pending:
+            logger.info("Applying migration %s: %s", version, name)
+            migrate()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+        return len(pending)
+    finally:
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            lock.close()
@@ -1,5 +1,5 @@
 from app import db
-from sqlalchemy import Integer, String, Float, DateTime, ForeignKey, LargeBinary, Text
+from sqlalchemy import Integer, String, Float, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime, timedelta
 
@@ -32,20 +32,41 @@ class Customer(db.Model):
     id_type: Mapped[str] = mapped_column(String(50), nullable=True)  # 'passport', 'national_id', 'drivers_license'
     id_number: Mapped[str] = mapped_column(String(50), nullable=True)
 
-    # Photo storage - explicitly marked as nullable
-    selfie_photo: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
-    id_photo: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
-    bill_photo: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    # Photo references - the image bytes live in the photo store, keyed by hash
+    selfie_photo_sha256: Mapped[str] = mapped_column(String(64), ForeignKey('photo.sha256'), nullable=True)
+    id_photo_sha256: Mapped[str] = mapped_column(String(64), ForeignKey('photo.sha256'), nullable=True)
+    bill_photo_sha256: Mapped[str] = mapped_column(String(64), ForeignKey('photo.sha256'), nullable=True)
+
+    # Normalized names, phone and ID number, maintained by app/search.py
+    search_text: Mapped[str] = mapped_column(Text, nullable=True, deferred=True)
 
     # Metadata
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Version of the cache scope bumped by the write that last changed the
+    # row; the ?since= change feed of app/sync.py reads rows in this order
+    sync_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     rentals: Mapped[list["BatteryRental"]] = relationship("BatteryRental", back_populates="customer")
     water_purchases: Mapped[list["WaterSale"]] = relationship("WaterSale", back_populates="customer")
     internet_purchases: Mapped[list["InternetAccess"]] = relationship("InternetAccess", back_populates="customer")
     health_visits: Mapped[list["HealthAccess"]] = relationship("HealthAccess", back_populates="customer")
+    selfie_photo: Mapped["Photo"] = relationship("Photo", foreign_keys=[selfie_photo_sha256])
+    id_photo: Mapped["Photo"] = relationship("Photo", foreign_keys=[id_photo_sha256])
+    bill_photo: Mapped["Photo"] = relationship("Photo", foreign_keys=[bill_photo_sha256])
+
+    __table_args__ = (
+        Index('ix_customer_sync_version', 'sync_version', 'id'),
+    )
+
+
+class Photo(db.Model):
+    # Content-addressed: the primary key is the SHA-256 of the stored bytes
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    mime_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
 class BatteryType(db.Model):
@@ -58,6 +79,7 @@ class BatteryType(db.Model):
 
     # Relationship with batteries
     batteries: Mapped[list["Battery"]] = relationship("Battery", back_populates="battery_type")
+    inventory: Mapped["BatteryInventory"] = relationship("BatteryInventory")
 
 class Battery(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -69,6 +91,19 @@ class Battery(db.Model):
     battery_type: Mapped["BatteryType"] = relationship("BatteryType", back_populates="batteries")
     rentals: Mapped[list["BatteryRental"]] = relationship("BatteryRental", back_populates="battery")
 
+    __table_args__ = (
+        # Checkout looks for an available unit of a type
+        Index('ix_battery_type_status', 'battery_type_id', 'status'),
+    )
+
+class BatteryInventory(db.Model):
+    # Per-type unit counts by status, kept in step with Battery.status by the
+    # write paths in app/inventory.py so availability is read without scanning units
+    battery_type_id: Mapped[int] = mapped_column(Integer, ForeignKey('battery_type.id'), primary_key=True)
+    available: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rented: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    maintenance: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
 class BatteryRental(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('customer.id'), nullable=False)
@@ -78,20 +113,41 @@ class BatteryRental(db.Model):
     delivery_fee: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
     rented_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     returned_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    sync_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     customer: Mapped["Customer"] = relationship("Customer", back_populates="rentals")
     battery: Mapped["Battery"] = relationship("Battery", back_populates="rentals")
     battery_type: Mapped["BatteryType"] = relationship("BatteryType")
 
+    # Lists are paged newest first, optionally for one customer, so each
+    # transaction table has (timestamp, id) and (customer_id, timestamp, id)
+    __table_args__ = (
+        Index('ix_battery_rental_rented_at', 'rented_at', 'id'),
+        Index('ix_battery_rental_customer_rented_at', 'customer_id', 'rented_at', 'id'),
+        Index('ix_battery_rental_battery_id', 'battery_id'),
+        Index('ix_battery_rental_sync_version', 'sync_version', 'id'),
+        # Rentals still out, newest first; only covers the few open rows
+        Index('ix_battery_rental_open', 'rented_at', 'id',
+              postgresql_where=text('returned_at IS NULL'),
+              sqlite_where=text('returned_at IS NULL')),
+    )
+
 class WaterSale(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('customer.id'), nullable=False)
     size: Mapped[float] = mapped_column(Float, nullable=False)
     price: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
     sold_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sync_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
     customer: Mapped["Customer"] = relationship("Customer", back_populates="water_purchases")
 
+    __table_args__ = (
+        Index('ix_water_sale_sold_at', 'sold_at', 'id'),
+        Index('ix_water_sale_customer_sold_at', 'customer_id', 'sold_at', 'id'),
+        Index('ix_water_sale_sync_version', 'sync_version', 'id'),
+    )
+
 class InternetAccess(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('customer.id'), nullable=False)
@@ -100,8 +156,25 @@ class InternetAccess(db.Model):
     wifi_password: Mapped[str] = mapped_column(String(20), nullable=False)
     duration_type: Mapped[str] = mapped_column(String(20), nullable=False)  # '24h', '3d', '1w', '1m'
     price: Mapped[float] = mapped_column(Float, nullable=False)
+    # 'active' until the expiry sweeper in app/internet.py marks it 'expired'
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='active', server_default='active')
+    sync_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
     customer: Mapped["Customer"] = relationship("Customer", back_populates="internet_purchases")
 
+    __table_args__ = (
+        Index('ix_internet_access_purchased_at', 'purchased_at', 'id'),
+        Index('ix_internet_access_customer_purchased_at', 'customer_id', 'purchased_at', 'id'),
+        Index('ix_internet_access_sync_version', 'sync_version', 'id'),
+        # Live sessions: a range scan over expires_at > now that also covers the password
+        Index('ix_internet_access_expires_at', 'expires_at', 'wifi_password'),
+        # The sweeper only visits sessions still marked active
+        Index('ix_internet_access_status_expires_at', 'status', 'expires_at'),
+        # No two active sessions share a password; expired ones free theirs
+        Index('ix_internet_access_active_password', 'wifi_password', unique=True,
+              postgresql_where=text("status = 'active'"),
+              sqlite_where=text("status = 'active'")),
+    )
+
 class HealthAccess(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('customer.id'), nullable=False)
@@ -110,4 +183,49 @@ class HealthAccess(db.Model):
     treatments: Mapped[str] = mapped_column(Text, nullable=False)
     notes: Mapped[str] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    customer: Mapped["Customer"] = relationship("Customer", back_populates="health_visits")
\ No newline at end of file
+    sync_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    customer: Mapped["Customer"] = relationship("Customer", back_populates="health_visits")
+
+    __table_args__ = (
+        Index('ix_health_access_visit_date', 'visit_date', 'id'),
+        Index('ix_health_access_customer_visit_date', 'customer_id', 'visit_date', 'id'),
+        Index('ix_health_access_sync_version', 'sync_version', 'id'),
+    )
+
+
+class IdempotencyRecord(db.Model):
+    # Result of a write that was sent with an idempotency key, so a replay of
+    # the same key returns the stored result instead of writing again
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    # Endpoint path the key was used with, and a hash of the request payload;
+    # reusing the key for anything else is rejected
+    scope: Mapped[str] = mapped_column(String(200), nullable=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=True)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    response: Mapped[str] = mapped_column(Text, nullable=False)  # JSON body
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)  # TTL purge
+
+
+class UsageRollup(db.Model):
+    # Transaction counts and revenue per service and time bucket, kept up to
+    # date by app/rollups.py so the dashboard never scans the transaction tables
+    granularity: Mapped[str] = mapped_column(String(10), primary_key=True)  # 'hour' or 'day'
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    service: Mapped[str] = mapped_column(String(20), primary_key=True)  # 'rental', 'water_sale', ...
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    revenue: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)  # water volume sold
+
+
+class CacheVersion(db.Model):
+    # Version counters of the cached read endpoints, bumped by app/http_cache.py
+    # in the same transaction as every write that changes what they return
+    scope: Mapped[str] = mapped_column(String(20), primary_key=True)  # 'batteries', 'customers', ...
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(db.Model):
+    # One row per migration in app/migrations.py that has been applied
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
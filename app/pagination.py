@@ -0,0 +1,93 @@
+from flask import current_app
+from sqlalchemy import and_, or_
+from datetime import datetime, timezone
+import base64
+import json
+
+
+def _encode_cursor(timestamp, row_id):
+    payload = json.dumps({'ts': timestamp.isoformat() if timestamp else None, 'id': row_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = datetime.fromisoformat(payload['ts']) if payload['ts'] else None
+        return timestamp, int(payload['id'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_datetime(value, name):
+    """Parse an ISO date from a request into the naive UTC the columns store."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} date: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_page_args(args):
+    """Read limit, cursor, date range and customer filters from the query string."""
+    default_size = current_app.config.get('PAGE_SIZE_DEFAULT', 50)
+    max_size = current_app.config.get('PAGE_SIZE_MAX', 500)
+
+    try:
+        limit = int(args.get('limit', default_size))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    customer_id = args.get('customer_id')
+    if customer_id is not None:
+        try:
+            customer_id = int(customer_id)
+        except ValueError:
+            raise ValueError('customer_id must be an integer')
+
+    return {
+        'limit': min(limit, max_size),
+        'cursor': _decode_cursor(args['cursor']) if args.get('cursor') else None,
+        'start': parse_datetime(args['start'], 'start') if args.get('start') else None,
+        'end': parse_datetime(args['end'], 'end') if args.get('end') else None,
+        'customer_id': customer_id,
+    }
+
+
+def paginate(query, model, timestamp_column, page):
+    """Apply filters and keyset pagination, newest first.
+
+    Rows are ordered by (timestamp, id) descending so the cursor is the last
+    row of the previous page and the next page starts strictly after it.
+    Returns the rows of this page and the cursor token for the next one, or
+    None when there are no more rows.
+    """
+    if page['customer_id'] is not None:
+        query = query.filter(model.customer_id == page['customer_id'])
+    if page['start'] is not None:
+        query = query.filter(timestamp_column >= page['start'])
+    if page['end'] is not None:
+        query = query.filter(timestamp_column <= page['end'])
+
+    if page['cursor'] is not None:
+        cursor_ts, cursor_id = page['cursor']
+        query = query.filter(or_(
+            timestamp_column < cursor_ts,
+            and_(timestamp_column == cursor_ts, model.id < cursor_id)
+        ))
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(timestamp_column.desc(), model.id.desc()).limit(page['limit'] + 1).all()
+
+    next_cursor = None
+    if len(rows) > page['limit']:
+        rows = rows[:page['limit']]
+        last = rows[-1]
+        next_cursor = _encode_cursor(getattr(last, timestamp_column.key), last.id)
+
+    return rows, next_cursor
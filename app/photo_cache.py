@@ -0,0 +1,46 @@
+from collections import OrderedDict
+import threading
+
+
+class VariantCache:
+    """In-memory LRU cache of rendered photo variants with a byte budget.
+
+    Keys are (sha256, variant). The stored photo is content-addressed, so a
+    new upload gets a new hash and old entries simply age out.
+    """
+
+    def __init__(self, app=None):
+        self.max_bytes = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.setdefault('PHOTO_VARIANT_CACHE_BYTES', 32 * 1024 * 1024)
+        app.extensions['photo_variant_cache'] = self
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        # Entries larger than the whole budget are not worth caching
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+variant_cache = VariantCache()
@@ -0,0 +1,151 @@
+from app import db
+from sqlalchemy import inspect, text
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Customer photo fields; also the names of the legacy columns that held the raw bytes
+PHOTO_FIELDS = ('selfie_photo', 'id_photo', 'bill_photo')
+
+
+def guess_mimetype(data):
+    """Guess an image mimetype from its leading magic bytes."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    elif data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    elif data[:4] == b'GIF8':
+        return 'image/gif'
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    elif data[:2] == b'BM':
+        return 'image/bmp'
+    elif data[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'image/tiff'
+    elif (b'ftypheic' in data[:32] or b'ftypmif1' in data[:32] or
+          b'ftyphevc' in data[:32] or b'ftypheix' in data[:32] or
+          b'ftypheif' in data[:32] or b'ftypmsf1' in data[:32]):
+        return 'image/heic'
+    return 'application/octet-stream'
+
+
+class PhotoStore:
+    """File-system blob store addressed by the SHA-256 of the content.
+
+    Files are laid out as <root>/ab/cd/abcd... so no directory grows too
+    large. Writing the same bytes twice is a no-op.
+    """
+
+    def __init__(self, app=None):
+        self.root = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config.setdefault(
+            'PHOTO_STORAGE_PATH', os.path.join(app.instance_path, 'photos')
+        )
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions['photo_store'] = self
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def put(self, data):
+        """Store bytes and return their SHA-256 hex digest."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        target = self.path(sha256)
+        if os.path.exists(target):
+            return sha256
+
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file in the same directory then rename, so a
+        # reader never sees a partially written blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return sha256
+
+    def read(self, sha256):
+        with open(self.path(sha256), 'rb') as f:
+            return f.read()
+
+
+photo_store = PhotoStore()
+
+
+def save_photo(data):
+    """Write image bytes to the store and return the matching Photo row."""
+    from app.models import Photo
+
+    sha256 = photo_store.put(data)
+    photo = db.session.get(Photo, sha256)
+    if photo is None:
+        photo = Photo(sha256=sha256, size=len(data), mime_type=guess_mimetype(data))
+        db.session.add(photo)
+    return photo
+
+
+def migrate_photo_blobs():
+    """Move photo bytes out of the legacy Customer LargeBinary columns.
+
+    Each blob is written to the photo store, referenced from the new
+    *_photo_sha256 column, and the legacy columns are dropped once every
+    row has been copied. Safe to run on a database that is already migrated.
+    """
+    from app.images import image_pool, InvalidImage
+    from app.models import Customer
+
+    columns = {c['name'] for c in inspect(db.engine).get_columns(Customer.__tablename__)}
+    legacy = [name for name in PHOTO_FIELDS if name in columns]
+    if not legacy:
+        logger.info("No legacy photo columns found, nothing to migrate")
+        return 0
+
+    for name in legacy:
+        if f"{name}_sha256" not in columns:
+            db.session.execute(text(
+                f"ALTER TABLE customer ADD COLUMN {name}_sha256 VARCHAR(64) REFERENCES photo (sha256)"
+            ))
+
+    moved = 0
+    customer_ids = db.session.execute(text("SELECT id FROM customer")).scalars().all()
+    # Read one customer at a time so only a single row of blobs is in memory
+    for customer_id in customer_ids:
+        row = db.session.execute(
+            text(f"SELECT {', '.join(legacy)} FROM customer WHERE id = :id"),
+            {'id': customer_id}
+        ).mappings().one()
+        for name in legacy:
+            if row[name]:
+                data = bytes(row[name])
+                try:
+                    data = image_pool.normalize(data)
+                except InvalidImage:
+                    logger.warning("Keeping undecodable %s of customer %s as is", name, customer_id)
+                photo = save_photo(data)
+                db.session.flush()
+                db.session.execute(
+                    text(f"UPDATE customer SET {name}_sha256 = :sha256 WHERE id = :id"),
+                    {'sha256': photo.sha256, 'id': customer_id}
+                )
+                moved += 1
+        db.session.commit()
+
+    for name in legacy:
+        db.session.execute(text(f"ALTER TABLE customer DROP COLUMN {name}"))
+    db.session.commit()
+    logger.info("Moved %s photos from customer rows to the photo store", moved)
+    return moved
@@ -0,0 +1,202 @@
+from flask import current_app
+from app import db
+from app.models import BatteryRental, WaterSale, InternetAccess, HealthAccess, UsageRollup
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Granularities kept in the rollup table; coarser ones are folded from 'day'
+STORED_GRANULARITIES = ('hour', 'day')
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# Service -> (model, timestamp field, fields summed into revenue, quantity field)
+SERVICES = {
+    'rental': (BatteryRental, 'rented_at', ('rental_price', 'delivery_fee'), None),
+    'water_sale': (WaterSale, 'sold_at', ('price',), 'size'),
+    'internet_access': (InternetAccess, 'purchased_at', ('price',), None),
+    'health_record': (HealthAccess, 'visit_date', (), None),
+}
+
+
+def truncate(moment, granularity):
+    """Return the start of the bucket that contains moment."""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Invalid granularity: {granularity}")
+
+
+def _next_bucket(bucket, granularity):
+    if granularity == 'hour':
+        return bucket + timedelta(hours=1)
+    if granularity == 'day':
+        return bucket + timedelta(days=1)
+    if granularity == 'week':
+        return bucket + timedelta(weeks=1)
+    return (bucket + timedelta(days=32)).replace(day=1)
+
+
+def _bump(granularity, bucket_start, service, count, revenue, quantity):
+    """Add to one rollup row in the current transaction, creating it if needed.
+
+    Like the inventory counters the update is relative (count = count + n),
+    so concurrent writers to the same bucket never lose each other's sales.
+    """
+    statement = update(UsageRollup).where(
+        UsageRollup.granularity == granularity,
+        UsageRollup.bucket_start == bucket_start,
+        UsageRollup.service == service
+    ).values(
+        count=UsageRollup.count + count,
+        revenue=UsageRollup.revenue + revenue,
+        quantity=UsageRollup.quantity + quantity
+    ).execution_options(synchronize_session=False)
+
+    if db.session.execute(statement).rowcount:
+        return
+    try:
+        # First sale in this bucket; a savepoint keeps a lost race from
+        # aborting the caller's transaction
+        with db.session.begin_nested():
+            db.session.execute(insert(UsageRollup).values(
+                granularity=granularity, bucket_start=bucket_start, service=service,
+                count=count, revenue=revenue, quantity=quantity
+            ))
+    except IntegrityError:
+        db.session.execute(statement)
+
+
+def _usage(service, get):
+    # (moment, revenue, quantity) of one transaction, read through get(field)
+    _, timestamp, revenue_fields, quantity_field = SERVICES[service]
+    revenue = sum(get(field) or 0.0 for field in revenue_fields)
+    quantity = (get(quantity_field) or 0.0) if quantity_field else 0.0
+    return get(timestamp), revenue, quantity
+
+
+def _add(totals, moment, revenue, quantity):
+    for granularity in STORED_GRANULARITIES:
+        bucket = totals[(granularity, truncate(moment, granularity))]
+        bucket[0] += 1
+        bucket[1] += revenue
+        bucket[2] += quantity
+
+
+def record(service, transaction):
+    """Count one flushed transaction (a model instance) in the rollups."""
+    moment, revenue, quantity = _usage(service, lambda field: getattr(transaction, field))
+    for granularity in STORED_GRANULARITIES:
+        _bump(granularity, truncate(moment, granularity), service, 1, revenue, quantity)
+
+
+def record_many(service, rows):
+    """Count several transactions of a service given as column dicts.
+
+    Rows falling in the same bucket are summed first, so a batch of offline
+    sales touches each bucket once.
+    """
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in rows:
+        _add(totals, *_usage(service, row.get))
+    for (granularity, bucket_start), (count, revenue, quantity) in totals.items():
+        _bump(granularity, bucket_start, service, count, revenue, quantity)
+
+
+def backfill_rollups():
+    """Rebuild every rollup row from the transaction history.
+
+    Transactions are streamed in chunks and summed in memory per bucket, so
+    this works the same on SQLite and PostgreSQL and never loads a whole
+    table at once. Run it once after upgrading, or to repair drift.
+    """
+    db.session.execute(delete(UsageRollup))
+    rows = []
+    for service, (model, timestamp, revenue_fields, quantity_field) in SERVICES.items():
+        totals = defaultdict(lambda: [0, 0.0, 0.0])
+        columns = [getattr(model, timestamp)] + [getattr(model, field) for field in revenue_fields]
+        if quantity_field:
+            columns.append(getattr(model, quantity_field))
+        result = db.session.execute(
+            select(*columns).where(getattr(model, timestamp).is_not(None))
+            .execution_options(yield_per=1000)
+        )
+        for row in result.mappings():
+            _add(totals, *_usage(service, row.get))
+        rows.extend({
+            'granularity': granularity, 'bucket_start': bucket_start, 'service': service,
+            'count': count, 'revenue': total_revenue, 'quantity': total_quantity
+        } for (granularity, bucket_start), (count, total_revenue, total_quantity) in totals.items())
+    if rows:
+        db.session.execute(insert(UsageRollup), rows)
+    db.session.commit()
+    logger.info("Rebuilt %s rollup rows from transaction history", len(rows))
+    return len(rows)
+
+
+def query_rollups(start, end, granularity='day', services=None):
+    """Return per-bucket and total usage between start and end.
+
+    Hourly series are read from the hourly rollups; daily, weekly and
+    monthly ones from the daily rollups, so the cost depends on the number
+    of buckets in the range, not on the number of transactions. Every
+    bucket in the range is present, with zeros where nothing was sold.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity: {granularity}")
+    services = list(services or SERVICES)
+    unknown = [service for service in services if service not in SERVICES]
+    if unknown:
+        raise ValueError(f"Invalid service: {', '.join(unknown)}")
+    if start > end:
+        raise ValueError('start must be before end')
+
+    first = truncate(start, granularity)
+    buckets = []
+    bucket = first
+    max_buckets = current_app.config.get('ROLLUP_MAX_BUCKETS', 1000)
+    while bucket <= end:
+        buckets.append(bucket)
+        if len(buckets) > max_buckets:
+            raise ValueError(f"Range spans more than {max_buckets} {granularity} buckets, use a coarser granularity")
+        bucket = _next_bucket(bucket, granularity)
+
+    series = {bucket: {service: {'count': 0, 'revenue': 0.0, 'quantity': 0.0} for service in services}
+              for bucket in buckets}
+    stored = 'hour' if granularity == 'hour' else 'day'
+    rows = db.session.execute(
+        select(UsageRollup.bucket_start, UsageRollup.service, UsageRollup.count,
+               UsageRollup.revenue, UsageRollup.quantity)
+        .where(UsageRollup.granularity == stored,
+               UsageRollup.bucket_start >= first,
+               UsageRollup.bucket_start <= end,
+               UsageRollup.service.in_(services))
+    )
+    for bucket_start, service, count, revenue, quantity in rows:
+        values = series[truncate(bucket_start, granularity)][service]
+        values['count'] += count
+        values['revenue'] += revenue
+        values['quantity'] += quantity
+
+    totals = {service: {'count': 0, 'revenue': 0.0, 'quantity': 0.0} for service in services}
+    for values in series.values():
+        for service, service_values in values.items():
+            for field, value in service_values.items():
+                totals[service][field] += value
+
+    return {
+        'granularity': granularity,
+        'start': first.isoformat(),
+        'end': end.isoformat(),
+        'buckets': [{'start': bucket.isoformat(), 'services': series[bucket]} for bucket in buckets],
+        'totals': totals,
+    }
@@ -1,46 +1,46 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
 from app import db
-from app.models import Customer, BatteryRental, WaterSale, InternetAccess, Battery, BatteryType, HealthAccess
+from app.models import Customer, BatteryRental, WaterSale, InternetAccess, Battery, BatteryType, BatteryInventory, HealthAccess
+from app.pagination import parse_page_args, parse_datetime, paginate
+from app.photo_store import photo_store, PHOTO_FIELDS
+from app.photo_cache import variant_cache
+from app.images import image_pool, ingest_photo, have_pil, ImagePoolBusy, InvalidImage, BROWSER_IMAGE_MIMETYPES, VARIANT_SIZES
+from app import exports, http_cache, inventory, loading, rollups, search, sync, timeline, wire
+from app.internet import calculate_expiration_date, wifi_password_pool, active_session_rows, active_passwords, PASSWORD_ATTEMPTS
+from app.batch import process_batch, BatchError
+from app.idempotency import idempotent
+from app.http_cache import cached, response_cache
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 import logging
 import io
-import secrets
-import string
-
-# Import PIL at the module level to avoid repeated imports
-try:
-    from PIL import Image
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-    have_pil = True
-    logging.debug("PIL and HEIF support available for image processing")
-except Exception as e:
-    have_pil = False
-    logging.warning(f"PIL or HEIF support not available: {str(e)}")
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/api/battery-types', methods=['GET'])
+@cached('batteries')
 def list_battery_types():
     try:
-        battery_types = BatteryType.query.all()
-        return jsonify([{
+        # Availability comes from the per-type counters, not from the units
+        battery_types = db.session.query(BatteryType, BatteryInventory.available).outerjoin(
+            BatteryInventory, BatteryInventory.battery_type_id == BatteryType.id
+        ).all()
+        return wire.render([{
             'id': bt.id,
             'name': bt.name,
             'type': bt.type,
             'capacity': bt.capacity,
-            'available_units': len([b for b in bt.batteries if b.status == 'available'])
-        } for bt in battery_types])
+            'available_units': available_units or 0
+        } for bt, available_units in battery_types])
     except Exception as e:
-        logger.error(f"Error listing battery types: {str(e)}")
+        logger.error("Error listing battery types: %s", e)
         return jsonify({'error': 'Failed to load battery types'}), 500
 
 @bp.route('/api/battery-types', methods=['POST'])
+@idempotent
 def create_battery_type():
     try:
         data = request.get_json()
@@ -61,7 +61,9 @@ def create_battery_type():
                     status='available'
                 )
                 db.session.add(battery)
+            inventory.add_units(battery_type.id, data['quantity'])
 
+        http_cache.invalidate('batteries')
         db.session.commit()
         return jsonify({
             'message': 'Battery type created successfully',
@@ -69,15 +71,16 @@ def create_battery_type():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating battery type: {str(e)}")
+        logger.error("Error creating battery type: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/batteries', methods=['GET'])
+@cached('batteries')
 def list_available_batteries():
     try:
-        batteries = Battery.query.all()
-        logger.debug(f"Found {len(batteries)} batteries")
-        return jsonify([{
+        batteries = Battery.query.options(*loading.BATTERY_LIST).all()
+        logger.debug("Found %s batteries", len(batteries))
+        return wire.render([{
             'id': b.id,
             'type_id': b.battery_type_id,
             'type_name': b.battery_type.name,
@@ -87,7 +90,7 @@ def list_available_batteries():
             'status': b.status
         } for b in batteries])
     except Exception as e:
-        logger.error(f"Error listing batteries: {str(e)}")
+        logger.error("Error listing batteries: %s", e)
         return jsonify({'error': 'Failed to load batteries'}), 500
 
 @bp.route('/api/batteries/<int:battery_id>', methods=['PUT'])
@@ -99,13 +102,19 @@ def update_battery(battery_id):
         if 'status' in data:
             if battery.status == 'rented':
                 return jsonify({'error': 'Cannot update status of rented battery'}), 400
-            battery.status = data['status']
+            if data['status'] == 'rented':
+                return jsonify({'error': 'Batteries are rented through the rentals endpoint'}), 400
+            inventory.change_status(battery, data['status'])
 
+        http_cache.invalidate('batteries')
         db.session.commit()
         return jsonify({'message': 'Battery updated successfully'})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error updating battery: {str(e)}")
+        logger.error("Error updating battery: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/batteries/<int:battery_id>', methods=['DELETE'])
@@ -121,191 +130,206 @@ def delete_battery(battery_id):
         if BatteryRental.query.filter_by(battery_id=battery_id).first():
             return jsonify({'error': 'Cannot delete battery with rental history'}), 400
 
+        inventory.remove_unit(battery)
         db.session.delete(battery)
+        http_cache.invalidate('batteries')
         db.session.commit()
         return jsonify({'message': 'Battery deleted successfully'})
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error deleting battery: {str(e)}")
+        logger.error("Error deleting battery: %s", e)
         return jsonify({'error': str(e)}), 500
 
+def _change_feed(query, model, fields):
+    """Answer ?since=<token> on a list endpoint with the rows changed after the token."""
+    page = parse_page_args(request.args)
+    rows, token, has_more = sync.changes(query.add_columns(model.sync_version), model, request.args['since'], page['limit'])
+    return wire.list_response({'items': rows, 'sync_token': token, 'has_more': has_more}, fields)
+
+def _listed(body, token, fields):
+    response = wire.list_response(body, fields)
+    response.headers['X-Sync-Token'] = token
+    return response
+
 @bp.route('/api/rentals', methods=['GET'])
 def get_rentals():
     try:
-        rentals = BatteryRental.query.all()
-        rental_list = [{
-            'id': rental.id,
-            'customer_name': f"{rental.customer.first_name} {rental.customer.last_name}",
-            'battery_name': f"{rental.battery.battery_type.name} (Unit #{rental.battery.unit_number})" if rental.battery else rental.battery_type.name,
-            'rental_price': rental.rental_price,
-            'delivery_fee': rental.delivery_fee,
-            'rented_at': rental.rented_at.isoformat(),
-            'returned_at': rental.returned_at.isoformat() if rental.returned_at else None
-        } for rental in rentals]
-        return jsonify(rental_list)
+        query = loading.rental_list()
+        if 'since' in request.args:
+            return _change_feed(query, BatteryRental, loading.RENTAL_LIST_FIELDS)
+        # Read before the list, so a write racing with it is sent again by the feed
+        token = sync.current_token('transactions')
+        page = parse_page_args(request.args)
+        rentals, next_cursor = paginate(query, BatteryRental, BatteryRental.rented_at, page)
+        return _listed({'items': rentals, 'next_cursor': next_cursor}, token, loading.RENTAL_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting rentals: {str(e)}")
+        logger.error("Error getting rentals: %s", e)
         return jsonify({'error': 'Failed to load rentals'}), 500
 
 @bp.route('/api/rentals', methods=['POST'])
+@idempotent
 def create_rental():
     try:
         data = request.get_json()
-        logger.debug(f"Received rental data: {data}")
+        logger.debug("Received rental data: %s", data)
 
         customer = Customer.query.get_or_404(data['customer_id'])
-        battery_type_id = data.get('battery_type_id')
 
-        # Check if this is a battery rental or a charging service
+        # A specific unit, any unit of a battery type, or a charging service
         if data.get('battery_id'):
-            # This is a physical battery rental
-            battery = Battery.query.get_or_404(data['battery_id'])
-
-            if battery.status != 'available':
-                return jsonify({'error': 'Battery is not available for rent'}), 400
-
-            rental = BatteryRental(
-                customer_id=customer.id,
-                battery_id=battery.id,
-                battery_type_id=battery.battery_type_id,
-                rental_price=data.get('rental_price', 0.0),
-                delivery_fee=data.get('delivery_fee', 0.0)
-            )
-
-            # Update battery status
-            battery.status = 'rented'
-
+            Battery.query.get_or_404(data['battery_id'])
         else:
-            # This is a charging service (no physical battery)
-            battery_type = BatteryType.query.get_or_404(data['battery_type_id'])
+            BatteryType.query.get_or_404(data['battery_type_id'])
+        try:
+            battery_type, battery = inventory.allocate(data.get('battery_id'), data.get('battery_type_id'))
+        except inventory.BatteryUnavailable as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
 
-            rental = BatteryRental(
-                customer_id=customer.id,
-                battery_id=None,
-                battery_type_id=battery_type.id,
-                rental_price=data.get('rental_price', 0.0),
-                delivery_fee=data.get('delivery_fee', 0.0)
-            )
+        versions = http_cache.invalidate('batteries', 'transactions')
+        rental = BatteryRental(
+            customer_id=customer.id,
+            battery_id=battery.id if battery else None,
+            battery_type_id=battery_type.id,
+            rental_price=data.get('rental_price', 0.0),
+            delivery_fee=data.get('delivery_fee', 0.0),
+            sync_version=versions['transactions']
+        )
 
         db.session.add(rental)
+        db.session.flush()
+        rollups.record('rental', rental)
         db.session.commit()
 
         return jsonify({
             'message': 'Rental created successfully',
-            'rental_id': rental.id
+            'rental_id': rental.id,
+            'battery_id': rental.battery_id,
+            'unit_number': battery.unit_number if battery else None
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating rental: {str(e)}")
+        logger.error("Error creating rental: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/rentals/<int:rental_id>/return', methods=['POST'])
+@idempotent
 def return_rental(rental_id):
     try:
         rental = BatteryRental.query.get_or_404(rental_id)
-        if rental.returned_at:
-            return jsonify({'error': 'Rental already returned'}), 400
 
-        rental.returned_at = datetime.utcnow()
+        # Only the first of two concurrent returns may succeed
+        result = db.session.execute(
+            update(BatteryRental).where(BatteryRental.id == rental_id, BatteryRental.returned_at.is_(None))
+            .values(returned_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return jsonify({'error': 'Rental already returned'}), 400
 
         # If this is a physical battery rental, update the battery status
         if rental.battery:
-            rental.battery.status = 'available'
+            inventory.release_battery(rental.battery)
 
+        # Counters last, like create_rental, so both take their locks in the same order
+        versions = http_cache.invalidate('batteries', 'transactions')
+        db.session.execute(
+            update(BatteryRental).where(BatteryRental.id == rental_id)
+            .values(sync_version=versions['transactions']).execution_options(synchronize_session=False)
+        )
         db.session.commit()
         return jsonify({'message': 'Rental returned successfully'})
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error returning rental: {str(e)}")
+        logger.error("Error returning rental: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/dashboard/stats')
+@cached('transactions', period=3600)
 def get_dashboard_stats():
-    try:
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-
-        rentals = BatteryRental.query.filter(
-            BatteryRental.rented_at >= start_date,
-            BatteryRental.rented_at <= end_date
-        ).count()
-
-        water_sales = WaterSale.query.filter(
-            WaterSale.sold_at >= start_date,
-            WaterSale.sold_at <= end_date
-        ).count()
+    """Usage and revenue per service over a range, answered from the rollups.
 
-        internet_accesses = InternetAccess.query.filter(
-            InternetAccess.purchased_at >= start_date,
-            InternetAccess.purchased_at <= end_date
-        ).count()
+    Query parameters: start and end (ISO dates, default the last 30 days),
+    granularity (hour, day, week or month) and services (comma separated).
+    """
+    try:
+        end_date = parse_datetime(request.args['end'], 'end') if request.args.get('end') else datetime.utcnow()
+        start_date = (parse_datetime(request.args['start'], 'start') if request.args.get('start')
+                      else end_date - timedelta(days=30))
+        services = request.args.get('services')
+        stats = rollups.query_rollups(
+            start_date, end_date,
+            granularity=request.args.get('granularity', 'day'),
+            services=services.split(',') if services else None
+        )
 
-        return jsonify({
-            'rentals': rentals,
-            'water_sales': water_sales,
-            'internet_accesses': internet_accesses
-        })
+        totals = stats['totals']
+        # Flat counts kept for clients of the original endpoint
+        stats['rentals'] = totals.get('rental', {}).get('count', 0)
+        stats['water_sales'] = totals.get('water_sale', {}).get('count', 0)
+        stats['internet_accesses'] = totals.get('internet_access', {}).get('count', 0)
+        stats['revenue'] = sum(values['revenue'] for values in totals.values())
+        return wire.render(stats)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting dashboard stats: {str(e)}")
+        logger.error("Error getting dashboard stats: %s", e)
         return jsonify({'error': 'Failed to load dashboard statistics'}), 500
 
 @bp.route('/api/customers')
+@cached('customers', sync_token=True)
 def list_customers():
     try:
-        customers = Customer.query.all()
-        return jsonify([{
-            'id': customer.id,
-            'first_name': customer.first_name,
-            'middle_name': customer.middle_name,
-            'last_name': customer.last_name,
-            'second_last_name': customer.second_last_name,
-            'phone': customer.phone,
-            'address_line1': customer.address_line1,
-            'city': customer.city
-        } for customer in customers])
+        if 'since' in request.args:
+            return _change_feed(db.session.query(*loading.CUSTOMER_LIST_COLUMNS), Customer, loading.CUSTOMER_LIST_FIELDS)
+        rows = db.session.execute(select(*loading.CUSTOMER_LIST_COLUMNS).order_by(Customer.id)).all()
+        return wire.list_response(rows, loading.CUSTOMER_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error listing customers: {str(e)}")
+        logger.error("Error listing customers: %s", e)
         return jsonify({'error': 'Failed to load customers'}), 500
 
+@bp.route('/api/customers/search')
+def search_customers():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        limit = int(request.args.get('limit', search.DEFAULT_LIMIT))
+        results = search.search_customers(query, limit)
+        return jsonify({'items': [dict(row) for row in results]})
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    except Exception as e:
+        logger.error("Error searching customers: %s", e)
+        return jsonify({'error': 'Failed to search customers'}), 500
+
 @bp.route('/api/customers/<int:customer_id>')
 def get_customer(customer_id):
     try:
-        customer = Customer.query.get_or_404(customer_id)
-        return jsonify({
-            'id': customer.id,
-            'first_name': customer.first_name,
-            'middle_name': customer.middle_name,
-            'last_name': customer.last_name,
-            'second_last_name': customer.second_last_name,
-            'phone': customer.phone,
-            'address_line1': customer.address_line1,
-            'address_line2': customer.address_line2,
-            'city': customer.city,
-            'country': customer.country,
-            'state_province': customer.state_province,
-            'postal_code': customer.postal_code,
-            'email': customer.email,
-            'date_of_birth': customer.date_of_birth,
-            'birth_city': customer.birth_city,
-            'id_type': customer.id_type,
-            'id_number': customer.id_number
-        })
+        customer = db.session.execute(
+            select(*loading.CUSTOMER_DETAIL_COLUMNS).where(Customer.id == customer_id)
+        ).mappings().first()
+        if customer is None:
+            return jsonify({'error': 'Customer not found'}), 404
+        return jsonify(dict(customer))
     except Exception as e:
-        logger.error(f"Error getting customer {customer_id}: {str(e)}")
+        logger.error("Error getting customer %s: %s", customer_id, e)
         return jsonify({'error': f'Failed to load customer {customer_id}'}), 500
 
 @bp.route('/api/customers', methods=['POST'])
+@idempotent
 def create_customer():
     logger.info("Received POST request to create customer")
     try:
         # Get form data
         data = request.form.to_dict()
-        logger.debug(f"Received form data: {data}")
-        
-        # Debug files
-        logger.debug(f"Request files: {request.files}")
-        for key in request.files:
-            logger.debug(f"File key: {key}, Filename: {request.files[key].filename}")
+        logger.debug("Received form data: %s", data)
+        # FileStorage reprs show each field's filename and content type
+        logger.debug("Request files: %s", request.files)
 
         # Fix special value issues
         if not data.get('middle_name'):
@@ -333,12 +357,12 @@ def create_customer():
             # Remove any non-digit characters except the leading +
             phone = '+' + ''.join(c for c in phone[1:] if c.isdigit())
             data['phone'] = phone
-            logger.debug(f"Normalized phone number: {phone}")
+            logger.debug("Normalized phone number: %s", phone)
             
             # Check if this phone number already exists
             existing_customer = Customer.query.filter_by(phone=phone).first()
             if existing_customer:
-                logger.warning(f"Customer with phone {phone} already exists (ID: {existing_customer.id})")
+                logger.warning("Customer with phone %s already exists (ID: %s)", phone, existing_customer.id)
                 return jsonify({'error': 'A customer with this phone number already exists'}), 400
 
         # Create new customer instance
@@ -362,133 +386,59 @@ def create_customer():
             id_number=data.get('id_number')
         )
 
-        # Use the PIL modules that were imported at the top level
-        logger.debug("Using PIL libraries for image processing")
-
-        # Process selfie photo
-        if 'selfie_photo' in request.files and request.files['selfie_photo'].filename:
-            file = request.files['selfie_photo']
-            logger.debug(f"Processing selfie photo: {file.filename}")
-            
-            if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                logger.debug("Processing HEIC/HEIF selfie image")
-                try:
-                    # Read the file into memory and convert to JPEG
-                    file_data = file.read()
-                    img_io = io.BytesIO(file_data)
-                    img = Image.open(img_io)
-                    
-                    # Convert to JPEG
-                    output_io = io.BytesIO()
-                    img = img.convert('RGB')
-                    img.save(output_io, 'JPEG')
-                    customer.selfie_photo = output_io.getvalue()
-                    logger.debug("Successfully converted HEIC selfie to JPEG")
-                except Exception as e:
-                    logger.error(f"Error converting HEIC selfie image: {str(e)}")
-                    # If conversion fails, save the original
-                    file.seek(0)
-                    customer.selfie_photo = file.read()
-            else:
-                # For other formats, just read the bytes
-                customer.selfie_photo = file.read()
-        
-        # Process ID photo
-        if 'id_photo' in request.files and request.files['id_photo'].filename:
-            file = request.files['id_photo']
-            logger.debug(f"Processing ID photo: {file.filename}")
-            
-            if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                logger.debug("Processing HEIC/HEIF ID image")
-                try:
-                    # Read the file into memory and convert to JPEG
-                    file_data = file.read()
-                    img_io = io.BytesIO(file_data)
-                    img = Image.open(img_io)
-                    
-                    # Convert to JPEG
-                    output_io = io.BytesIO()
-                    img = img.convert('RGB')
-                    img.save(output_io, 'JPEG')
-                    customer.id_photo = output_io.getvalue()
-                    logger.debug("Successfully converted HEIC ID to JPEG")
-                except Exception as e:
-                    logger.error(f"Error converting HEIC ID image: {str(e)}")
-                    # If conversion fails, save the original
-                    file.seek(0)
-                    customer.id_photo = file.read()
-            else:
-                # For other formats, just read the bytes
-                customer.id_photo = file.read()
-        
-        # Process bill photo
-        if 'bill_photo' in request.files and request.files['bill_photo'].filename:
-            file = request.files['bill_photo']
-            logger.debug(f"Processing bill photo: {file.filename}")
-            
-            if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                logger.debug("Processing HEIC/HEIF bill image")
-                try:
-                    # Read the file into memory and convert to JPEG
-                    file_data = file.read()
-                    img_io = io.BytesIO(file_data)
-                    img = Image.open(img_io)
-                    
-                    # Convert to JPEG
-                    output_io = io.BytesIO()
-                    img = img.convert('RGB')
-                    img.save(output_io, 'JPEG')
-                    customer.bill_photo = output_io.getvalue()
-                    logger.debug("Successfully converted HEIC bill to JPEG")
-                except Exception as e:
-                    logger.error(f"Error converting HEIC bill image: {str(e)}")
-                    # If conversion fails, save the original
-                    file.seek(0)
-                    customer.bill_photo = file.read()
-            else:
-                # For other formats, just read the bytes
-                customer.bill_photo = file.read()
+        # Process uploaded photos
+        for field in PHOTO_FIELDS:
+            file = request.files.get(field)
+            if file and file.filename:
+                logger.debug("Processing %s: %s", field, file.filename)
+                setattr(customer, field, ingest_photo(file))
 
+        search.index_customer(customer)
+        customer.sync_version = http_cache.invalidate('customers')['customers']
         db.session.add(customer)
         db.session.commit()
-        logger.info(f"Customer created successfully with ID: {customer.id}")
+        logger.info("Customer created successfully with ID: %s", customer.id)
 
         return jsonify({
             'message': 'Customer created successfully',
             'customer_id': customer.id
         }), 201
 
+    except ImagePoolBusy as e:
+        db.session.rollback()
+        logger.warning("Image pool busy while creating customer: %s", e)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except InvalidImage as e:
+        db.session.rollback()
+        logger.warning("Rejected photo upload while creating customer: %s", e)
+        return jsonify({'error': str(e)}), 400
     except IntegrityError as e:
         db.session.rollback()
-        logger.error(f"IntegrityError while creating customer: {str(e)}")
+        logger.error("IntegrityError while creating customer: %s", e)
         return jsonify({'error': 'Customer could not be created. Phone number may already exist.'}), 400
     except KeyError as e:
         db.session.rollback()
-        logger.error(f"KeyError while creating customer: {str(e)}")
+        logger.error("KeyError while creating customer: %s", e)
         return jsonify({'error': f'Missing required field: {str(e)}'}), 400
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Unexpected error creating customer: {str(e)}")
+        logger.error("Unexpected error creating customer: %s", e)
         return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
 
 @bp.route('/api/customers/<int:customer_id>', methods=['PUT'])
 def update_customer(customer_id):
-    logger.info(f"Received PUT request for customer_id: {customer_id}")
+    logger.info("Received PUT request for customer_id: %s", customer_id)
     try:
         customer = Customer.query.get_or_404(customer_id)
         
         # Check if we have form data or JSON
         if request.content_type and 'multipart/form-data' in request.content_type:
             data = request.form.to_dict()
-            logger.debug(f"Updating customer {customer_id} with form data: {data}")
-            
-            # Debug files
-            logger.debug(f"Request files in update: {request.files}")
-            for key in request.files:
-                logger.debug(f"Update file key: {key}, Filename: {request.files[key].filename}")
+            logger.debug("Updating customer %s with form data: %s", customer_id, data)
+            logger.debug("Request files in update: %s", request.files)
         else:
             data = request.json
-            logger.debug(f"Updating customer {customer_id} with JSON data: {data}")
+            logger.debug("Updating customer %s with JSON data: %s", customer_id, data)
 
         if 'first_name' not in data or 'last_name' not in data or 'phone' not in data:
             raise KeyError('Missing required fields')
@@ -511,142 +461,75 @@ def update_customer(customer_id):
         customer.id_number = data.get('id_number')
         
         # Handle photo uploads in update too
-        if request.files:
-            # Use the PIL modules that were imported at the top level
-            logger.debug("Using PIL libraries for image processing in update")
-
-            # Process selfie photo
-            if 'selfie_photo' in request.files and request.files['selfie_photo'].filename:
-                file = request.files['selfie_photo']
-                logger.debug(f"Updating selfie photo: {file.filename}")
-                
-                if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                    logger.debug("Processing HEIC/HEIF selfie image in update")
-                    try:
-                        # Read the file into memory and convert to JPEG
-                        file_data = file.read()
-                        img_io = io.BytesIO(file_data)
-                        img = Image.open(img_io)
-                        
-                        # Convert to JPEG
-                        output_io = io.BytesIO()
-                        img = img.convert('RGB')
-                        img.save(output_io, 'JPEG')
-                        customer.selfie_photo = output_io.getvalue()
-                        logger.debug("Successfully converted HEIC selfie to JPEG in update")
-                    except Exception as e:
-                        logger.error(f"Error converting HEIC selfie image in update: {str(e)}")
-                        # If conversion fails, save the original
-                        file.seek(0)
-                        customer.selfie_photo = file.read()
-                else:
-                    # For other formats, just read the bytes
-                    customer.selfie_photo = file.read()
-                    
-            # Process ID photo
-            if 'id_photo' in request.files and request.files['id_photo'].filename:
-                file = request.files['id_photo']
-                logger.debug(f"Updating ID photo: {file.filename}")
-                
-                if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                    logger.debug("Processing HEIC/HEIF ID image in update")
-                    try:
-                        # Read the file into memory and convert to JPEG
-                        file_data = file.read()
-                        img_io = io.BytesIO(file_data)
-                        img = Image.open(img_io)
-                        
-                        # Convert to JPEG
-                        output_io = io.BytesIO()
-                        img = img.convert('RGB')
-                        img.save(output_io, 'JPEG')
-                        customer.id_photo = output_io.getvalue()
-                        logger.debug("Successfully converted HEIC ID to JPEG in update")
-                    except Exception as e:
-                        logger.error(f"Error converting HEIC ID image in update: {str(e)}")
-                        # If conversion fails, save the original
-                        file.seek(0)
-                        customer.id_photo = file.read()
-                else:
-                    # For other formats, just read the bytes
-                    customer.id_photo = file.read()
-                    
-            # Process bill photo
-            if 'bill_photo' in request.files and request.files['bill_photo'].filename:
-                file = request.files['bill_photo']
-                logger.debug(f"Updating bill photo: {file.filename}")
-                
-                if have_pil and (file.filename.lower().endswith('.heic') or file.filename.lower().endswith('.heif')):
-                    logger.debug("Processing HEIC/HEIF bill image in update")
-                    try:
-                        # Read the file into memory and convert to JPEG
-                        file_data = file.read()
-                        img_io = io.BytesIO(file_data)
-                        img = Image.open(img_io)
-                        
-                        # Convert to JPEG
-                        output_io = io.BytesIO()
-                        img = img.convert('RGB')
-                        img.save(output_io, 'JPEG')
-                        customer.bill_photo = output_io.getvalue()
-                        logger.debug("Successfully converted HEIC bill to JPEG in update")
-                    except Exception as e:
-                        logger.error(f"Error converting HEIC bill image in update: {str(e)}")
-                        # If conversion fails, save the original
-                        file.seek(0)
-                        customer.bill_photo = file.read()
-                else:
-                    # For other formats, just read the bytes
-                    customer.bill_photo = file.read()
-
+        for field in PHOTO_FIELDS:
+            file = request.files.get(field)
+            if file and file.filename:
+                logger.debug("Updating %s: %s", field, file.filename)
+                setattr(customer, field, ingest_photo(file))
+
+        search.index_customer(customer)
+        customer.sync_version = http_cache.invalidate('customers')['customers']
         db.session.commit()
-        logger.info(f"Customer {customer_id} updated successfully")
+        logger.info("Customer %s updated successfully", customer_id)
         return jsonify({'message': 'Customer updated successfully'})
+    except ImagePoolBusy as e:
+        db.session.rollback()
+        logger.warning("Image pool busy while updating customer %s: %s", customer_id, e)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except InvalidImage as e:
+        db.session.rollback()
+        logger.warning("Rejected photo upload while updating customer %s: %s", customer_id, e)
+        return jsonify({'error': str(e)}), 400
     except IntegrityError as e:
         db.session.rollback()
-        logger.error(f"IntegrityError while updating customer {customer_id}: {str(e)}")
+        logger.error("IntegrityError while updating customer %s: %s", customer_id, e)
         return jsonify({'error': 'Phone number already exists'}), 400
     except KeyError as e:
         db.session.rollback()
-        logger.error(f"KeyError while updating customer {customer_id}: {str(e)}")
+        logger.error("KeyError while updating customer %s: %s", customer_id, e)
         return jsonify({'error': f'Missing required field: {str(e)}'}), 400
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Unexpected error while updating customer {customer_id}: {str(e)}")
+        logger.error("Unexpected error while updating customer %s: %s", customer_id, e)
         return jsonify({'error': str(e)}), 500
 
 # Water Sales endpoints
 @bp.route('/api/water-sales', methods=['GET'])
 def get_water_sales():
     try:
-        sales = WaterSale.query.all()
-        sales_list = [{
-            'id': sale.id,
-            'customer_name': f"{sale.customer.first_name} {sale.customer.last_name}",
-            'size': sale.size,
-            'price': sale.price,
-            'sold_at': sale.sold_at.isoformat()
-        } for sale in sales]
-        return jsonify(sales_list)
+        query = loading.water_sale_list()
+        if 'since' in request.args:
+            return _change_feed(query, WaterSale, loading.WATER_SALE_LIST_FIELDS)
+        token = sync.current_token('transactions')
+        page = parse_page_args(request.args)
+        sales, next_cursor = paginate(query, WaterSale, WaterSale.sold_at, page)
+        return _listed({'items': sales, 'next_cursor': next_cursor}, token, loading.WATER_SALE_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting water sales: {str(e)}")
+        logger.error("Error getting water sales: %s", e)
         return jsonify({'error': 'Failed to load water sales'}), 500
 
 @bp.route('/api/water-sales', methods=['POST'])
+@idempotent
 def create_water_sale():
     try:
         data = request.get_json()
-        logger.debug(f"Received water sale data: {data}")
+        logger.debug("Received water sale data: %s", data)
 
         customer = Customer.query.get_or_404(data['customer_id'])
 
+        versions = http_cache.invalidate('transactions')
         water_sale = WaterSale(
             customer_id=customer.id,
             size=data['size'],
-            price=data['price']
+            price=data['price'],
+            sync_version=versions['transactions']
         )
 
         db.session.add(water_sale)
+        db.session.flush()
+        rollups.record('water_sale', water_sale)
         db.session.commit()
 
         return jsonify({
@@ -655,54 +538,96 @@ def create_water_sale():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating water sale: {str(e)}")
+        logger.error("Error creating water sale: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # Internet Access endpoints
 @bp.route('/api/internet-access', methods=['GET'])
 def get_internet_access():
     try:
-        records = InternetAccess.query.all()
-        access_list = [{
-            'id': record.id,
-            'customer_name': f"{record.customer.first_name} {record.customer.last_name}",
-            'purchased_at': record.purchased_at.isoformat(),
-            'expires_at': record.expires_at.isoformat(),
-            'wifi_password': record.wifi_password,
-            'duration_type': record.duration_type,
-            'price': record.price,
-            'status': 'Active' if record.expires_at > datetime.utcnow() else 'Expired'
-        } for record in records]
-        return jsonify(access_list)
+        query = loading.internet_access_list(datetime.utcnow())
+        if 'since' in request.args:
+            return _change_feed(query, InternetAccess, loading.INTERNET_ACCESS_LIST_FIELDS)
+        token = sync.current_token('transactions')
+        page = parse_page_args(request.args)
+        records, next_cursor = paginate(query, InternetAccess, InternetAccess.purchased_at, page)
+        return _listed({'items': records, 'next_cursor': next_cursor}, token, loading.INTERNET_ACCESS_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting internet access records: {str(e)}")
+        logger.error("Error getting internet access records: %s", e)
         return jsonify({'error': 'Failed to load internet access records'}), 500
 
+@bp.route('/api/internet-access/active')
+def get_active_internet_sessions():
+    try:
+        sessions = [{
+            'id': row.id,
+            'customer_id': row.customer_id,
+            'customer_name': f"{row.first_name} {row.last_name}",
+            'wifi_password': row.wifi_password,
+            'duration_type': row.duration_type,
+            'purchased_at': row.purchased_at.isoformat(),
+            'expires_at': row.expires_at.isoformat()
+        } for row in active_session_rows()]
+        return jsonify({'items': sessions})
+    except Exception as e:
+        logger.error("Error getting active internet sessions: %s", e)
+        return jsonify({'error': 'Failed to load active internet sessions'}), 500
+
+# Polled by the captive portal: only the passwords that currently grant access
+@bp.route('/api/internet-access/active/passwords')
+def get_active_wifi_passwords():
+    try:
+        return jsonify({'passwords': [{
+            'wifi_password': row.wifi_password,
+            'expires_at': row.expires_at.isoformat()
+        } for row in active_passwords()]})
+    except Exception as e:
+        logger.error("Error getting active WiFi passwords: %s", e)
+        return jsonify({'error': 'Failed to load active WiFi passwords'}), 500
+
 @bp.route('/api/internet-access', methods=['POST'])
+@idempotent
 def create_internet_access():
     try:
         data = request.get_json()
-        logger.debug(f"Received internet access data: {data}")
+        logger.debug("Received internet access data: %s", data)
 
         customer = Customer.query.get_or_404(data['customer_id'])
 
-        # Generate a random WiFi password
-        wifi_password = generate_wifi_password()
-
         # Calculate expiration date based on duration type
         duration_type = data['duration_type']
         purchased_at = datetime.utcnow()
         expires_at = calculate_expiration_date(purchased_at, duration_type)
 
+        versions = http_cache.invalidate('transactions')
         internet_access = InternetAccess(
             customer_id=customer.id,
-            wifi_password=wifi_password,
             duration_type=duration_type,
             price=data['price'],
-            expires_at=expires_at
+            purchased_at=purchased_at,
+            expires_at=expires_at,
+            sync_version=versions['transactions']
         )
 
-        db.session.add(internet_access)
+        # Take a pre-generated WiFi password; if a live session got the same
+        # one first, the unique index rejects it and the next one is tried
+        for _ in range(PASSWORD_ATTEMPTS):
+            wifi_password = wifi_password_pool.take()
+            internet_access.wifi_password = wifi_password
+            try:
+                with db.session.begin_nested():
+                    db.session.add(internet_access)
+                    db.session.flush()
+                break
+            except IntegrityError:
+                logger.warning("WiFi password already in use by an active session, taking another")
+        else:
+            db.session.rollback()
+            return jsonify({'error': 'No free WiFi password, please try again'}), 503
+
+        rollups.record('internet_access', internet_access)
         db.session.commit()
 
         return jsonify({
@@ -713,191 +638,206 @@ def create_internet_access():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating internet access: {str(e)}")
+        logger.error("Error creating internet access: %s", e)
         return jsonify({'error': str(e)}), 500
 
-def calculate_expiration_date(start_date, duration_type):
-    if duration_type == '24h':
-        return start_date + timedelta(days=1)
-    elif duration_type == '3d':
-        return start_date + timedelta(days=3)
-    elif duration_type == '1w':
-        return start_date + timedelta(weeks=1)
-    elif duration_type == '1m':
-        return start_date + timedelta(days=30)  # Approximating a month as 30 days
-    else:
-        raise ValueError(f"Invalid duration type: {duration_type}")
-
-def generate_wifi_password(length=12):
-    # Define character sets for password
-    alphabet = string.ascii_letters + string.digits
-    # Generate password using secure random choice
-    return ''.join(secrets.choice(alphabet) for i in range(length))
+# Hit rate of the response cache in the process that answers, for tuning
+# HTTP_CACHE_BYTES
+@bp.route('/api/cache/stats')
+def get_cache_stats():
+    return jsonify(response_cache.stats())
 
+# Batch ingestion of offline-queued transactions
+@bp.route('/api/batch', methods=['POST'])
+@idempotent
+def create_batch():
+    try:
+        data = request.get_json()
+        results = process_batch(data.get('items') if isinstance(data, dict) else None)
+        return jsonify({'results': results})
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.error("IntegrityError while processing batch: %s", e)
+        return jsonify({'error': 'Batch conflicts with a concurrent request, please retry'}), 409
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error processing batch: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+# Streaming exports of the ledgers, e.g. /api/exports/rentals.csv?start=2024-01-01&gzip=1
+@bp.route('/api/exports/<name>.<fmt>')
+def export_ledger(name, fmt):
+    try:
+        if fmt not in exports.FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        start = parse_datetime(request.args['start'], 'start') if request.args.get('start') else None
+        end = parse_datetime(request.args['end'], 'end') if request.args.get('end') else None
+        statement = exports.build_export_query(name, start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = f"{name}.{fmt}.gz" if compress else f"{name}.{fmt}"
+    return Response(
+        stream_with_context(exports.stream_export(statement, fmt, compress)),
+        mimetype='application/gzip' if compress else exports.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @bp.route('/api/customers/<int:customer_id>/photos/<photo_type>')
 def get_customer_photo(customer_id, photo_type):
     try:
-        # Use the PIL modules that were imported at the top level
-        logger.debug("Using PIL libraries for processing customer photos")
-        
-        logger.debug(f"Requested photo of type {photo_type} for customer {customer_id}")
+        logger.debug("Requested photo of type %s for customer %s", photo_type, customer_id)
+        variant = request.args.get('size', 'full')
+        if variant not in VARIANT_SIZES:
+            return jsonify({'error': f'Invalid photo size: {variant}'}), 400
+
         customer = Customer.query.get_or_404(customer_id)
-        
-        photo_data = None
-        if photo_type == 'selfie' and customer.selfie_photo:
-            logger.debug(f"Returning selfie photo for customer {customer_id}")
-            photo_data = customer.selfie_photo
-        elif photo_type == 'id' and customer.id_photo:
-            logger.debug(f"Returning ID photo for customer {customer_id}")
-            photo_data = customer.id_photo
-        elif photo_type == 'bill' and customer.bill_photo:
-            logger.debug(f"Returning bill photo for customer {customer_id}")
-            photo_data = customer.bill_photo
-        
-        if not photo_data:
-            logger.warning(f"No {photo_type} photo found for customer {customer_id}")
+
+        photo = None
+        if photo_type == 'selfie':
+            photo = customer.selfie_photo
+        elif photo_type == 'id':
+            photo = customer.id_photo
+        elif photo_type == 'bill':
+            photo = customer.bill_photo
+
+        if photo is None or not photo_store.exists(photo.sha256):
+            logger.warning("No %s photo found for customer %s", photo_type, customer_id)
             return jsonify({'error': 'Photo not found'}), 404
-        
-        # Log the first few bytes of the image to help with debugging
-        try:
-            logger.debug(f"Image data first 20 bytes: {photo_data[:20]}")
-        except Exception:
-            logger.debug("Could not log image data bytes")
-        
-        # Use a more robust approach to handle different image formats
-        try:
-            # Create a byte stream and try to open with PIL
-            img_io = io.BytesIO(photo_data)
-            
-            # Try to determine file format from header bytes
-            file_header = photo_data[:12]
-            header_hex = ' '.join(f'{b:02x}' for b in file_header)
-            logger.debug(f"File header bytes: {header_hex}")
-            
-            # Check for HEIC/HEIF format signatures
-            is_heic = False
-            if (b'ftypheic' in photo_data[:32] or b'ftypmif1' in photo_data[:32] or 
-                b'ftyphevc' in photo_data[:32] or b'ftypheix' in photo_data[:32]):
-                logger.debug("Detected HEIC/HEIF format from header")
-                is_heic = True
-            
-            if is_heic:
-                try:
-                    img = Image.open(img_io)
-                    logger.debug(f"Successfully opened HEIC image with PIL: {img.format} {img.size}")
-                    # We need to convert HEIC to JPEG
-                    output_io = io.BytesIO()
-                    img = img.convert('RGB')
-                    img.save(output_io, 'JPEG')
-                    output_io.seek(0)
-                    logger.debug(f"Successfully converted HEIC to JPEG")
-                    return send_file(output_io, mimetype='image/jpeg', download_name=f"customer_{customer_id}_{photo_type}.jpg")
-                except Exception as heic_error:
-                    logger.error(f"Error processing HEIC image: {str(heic_error)}")
-                    # Fall through to generic handling
-            
-            # Try normal PIL processing for other formats
-            img_io.seek(0)  # Reset to beginning of stream
-            img = Image.open(img_io)
-            logger.debug(f"Successfully opened image with PIL: {img.format} {img.size}")
-            
-            # Convert any image to JPEG for browser compatibility
-            if img.format != 'JPEG':
-                logger.debug(f"Converting {img.format} to JPEG for browser compatibility")
-                output_io = io.BytesIO()
-                img = img.convert('RGB')  # Convert to RGB mode if needed
-                img.save(output_io, 'JPEG')
-                output_io.seek(0)
-                return send_file(output_io, mimetype='image/jpeg', download_name=f"customer_{customer_id}_{photo_type}.jpg")
-            else:
-                # Reset file pointer and return original
-                img_io.seek(0)
-                return send_file(img_io, mimetype='image/jpeg', download_name=f"customer_{customer_id}_{photo_type}.jpg")
-                
-        except Exception as img_error:
-            logger.error(f"Image processing error: {str(img_error)}")
-            # Fallback to sending binary data with appropriate mimetype
-            # Try to guess the mimetype from the first few bytes
-            if photo_data[:3] == b'\xff\xd8\xff':
-                mimetype = 'image/jpeg'
-            elif photo_data[:8] == b'\x89PNG\r\n\x1a\n':
-                mimetype = 'image/png'
-            elif photo_data[:4] == b'GIF8':
-                mimetype = 'image/gif'
-            elif b'ftypheic' in photo_data[:32]:
-                mimetype = 'image/heic'
-            else:
-                mimetype = 'application/octet-stream'
-                
-            logger.debug(f"Using fallback with mimetype: {mimetype}")
-            return send_file(io.BytesIO(photo_data), mimetype=mimetype, download_name=f"customer_{customer_id}_{photo_type}.jpg")
-            
+
+        # The stored bytes never change for a given hash, so the hash plus
+        # the variant name is a strong validator
+        etag = f"{photo.sha256}-{variant}"
+        download_name = f"customer_{customer_id}_{photo_type}.jpg"
+
+        # Full-size images are normalized at upload and streamed straight from disk
+        if variant == 'full' and photo.mime_type in BROWSER_IMAGE_MIMETYPES:
+            response = send_file(photo_store.path(photo.sha256), mimetype=photo.mime_type,
+                                 download_name=download_name, etag=etag, conditional=True)
+            response.cache_control.no_cache = True
+            return response
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response
+
+        if not have_pil:
+            response = send_file(photo_store.path(photo.sha256), mimetype=photo.mime_type,
+                                 download_name=download_name, etag=etag, conditional=True)
+            response.cache_control.no_cache = True
+            return response
+
+        key = (photo.sha256, variant)
+        data = variant_cache.get(key)
+        if data is None:
+            data = image_pool.render_variant(photo_store.path(photo.sha256), variant)
+            variant_cache.put(key, data)
+
+        response = send_file(io.BytesIO(data), mimetype='image/jpeg', download_name=download_name,
+                             etag=etag, conditional=True)
+        response.cache_control.no_cache = True
+        return response
+
+    except ImagePoolBusy as e:
+        logger.warning("Image pool busy while rendering photo: %s", e)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
     except Exception as e:
-        logger.error(f"Error getting customer photo: {str(e)}")
+        logger.error("Error getting customer photo: %s", e)
         return jsonify({'error': 'Failed to load photo'}), 500
 
 @bp.route('/api/customers/<int:customer_id>/details', methods=['GET'])
 def get_customer_details(customer_id):
     try:
-        customer = Customer.query.get_or_404(customer_id)
-        return jsonify({
-            'id': customer.id,
-            'first_name': customer.first_name,
-            'middle_name': customer.middle_name,
-            'last_name': customer.last_name,
-            'second_last_name': customer.second_last_name,
-            'phone': customer.phone,
-            'email': customer.email,
-            'address_line1': customer.address_line1,
-            'address_line2': customer.address_line2,
-            'city': customer.city,
-            'country': customer.country,
-            'state_province': customer.state_province,
-            'postal_code': customer.postal_code,
-            'date_of_birth': customer.date_of_birth,
-            'birth_city': customer.birth_city,
-            'id_type': customer.id_type,
-            'id_number': customer.id_number,
-            'has_selfie': bool(customer.selfie_photo),
-            'has_id_photo': bool(customer.id_photo),
-            'has_bill_photo': bool(customer.bill_photo)
-        })
+        customer = db.session.execute(
+            select(*loading.CUSTOMER_DETAIL_COLUMNS, *loading.CUSTOMER_PHOTO_FLAGS)
+            .where(Customer.id == customer_id)
+        ).mappings().first()
+        if customer is None:
+            return jsonify({'error': 'Customer not found'}), 404
+        return jsonify(dict(customer))
     except Exception as e:
-        logger.error(f"Error getting customer {customer_id}: {str(e)}")
+        logger.error("Error getting customer %s: %s", customer_id, e)
         return jsonify({'error': f'Failed to load customer {customer_id}'}), 500
 
+# Everything one customer has bought or visited for, newest first. The first
+# page also carries the customer and their lifetime totals.
+@bp.route('/api/customers/<int:customer_id>/timeline')
+def get_customer_timeline(customer_id):
+    try:
+        args = request.args.to_dict()
+        cursor = args.pop('cursor', None)
+        page = parse_page_args(args)
+        page['cursor'] = timeline.decode_cursor(cursor) if cursor else None
+
+        result = {}
+        if cursor is None:
+            customer = db.session.execute(
+                select(*loading.CUSTOMER_LIST_COLUMNS).where(Customer.id == customer_id)
+            ).mappings().first()
+            if customer is None:
+                return jsonify({'error': 'Customer not found'}), 404
+            result['customer'] = dict(customer)
+            result['totals'] = timeline.customer_totals(customer_id)
+
+        entries, next_cursor = timeline.customer_timeline(customer_id, page)
+        result['items'] = [{
+            'type': entry['type'],
+            'id': entry['id'],
+            'at': entry['at'].isoformat(),
+            'amount': entry['amount'],
+            'detail': entry['detail'],
+            'until': entry['until'].isoformat() if entry['until'] else None
+        } for entry in entries]
+        result['next_cursor'] = next_cursor
+        return wire.list_response(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Error getting timeline of customer %s: %s", customer_id, e)
+        return jsonify({'error': f'Failed to load timeline of customer {customer_id}'}), 500
+
 # New health access record endpoints
 @bp.route('/api/health-access', methods=['GET'])
 def get_health_records():
     try:
-        records = HealthAccess.query.order_by(HealthAccess.visit_date.desc()).all()
-        return jsonify([{
-            'id': record.id,
-            'customer_name': f"{record.customer.first_name} {record.customer.last_name}",
-            'visit_date': record.visit_date.isoformat(),
-            'symptoms': record.symptoms,
-            'treatments': record.treatments,
-            'notes': record.notes
-        } for record in records])
+        query = loading.health_record_list()
+        if 'since' in request.args:
+            return _change_feed(query, HealthAccess, loading.HEALTH_RECORD_LIST_FIELDS)
+        token = sync.current_token('transactions')
+        page = parse_page_args(request.args)
+        records, next_cursor = paginate(query, HealthAccess, HealthAccess.visit_date, page)
+        return _listed({'items': records, 'next_cursor': next_cursor}, token, loading.HEALTH_RECORD_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting health records: {str(e)}")
+        logger.error("Error getting health records: %s", e)
         return jsonify({'error': 'Failed to load health records'}), 500
 
 @bp.route('/api/health-access', methods=['POST'])
+@idempotent
 def create_health_record():
     try:
         data = request.get_json()
         customer = Customer.query.get_or_404(data['customer_id'])
 
+        versions = http_cache.invalidate('transactions')
         health_record = HealthAccess(
             customer_id=customer.id,
             symptoms=data['symptoms'],
             treatments=data['treatments'],
-            notes=data.get('notes', '')
+            notes=data.get('notes', ''),
+            sync_version=versions['transactions']
         )
 
         db.session.add(health_record)
+        db.session.flush()
+        rollups.record('health_record', health_record)
         db.session.commit()
 
         return jsonify({
@@ -906,7 +846,7 @@ def create_health_record():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating health record: {str(e)}")
+        logger.error("Error creating health record: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/health-access/<int:record_id>', methods=['GET'])
@@ -923,5 +863,5 @@ def get_health_record(record_id):
             'notes': record.notes
         })
     except Exception as e:
-        logger.error(f"Error getting health record {record_id}: {str(e)}")
+        logger.error("Error getting health record %s: %s", record_id, e)
         return jsonify({'error': f'Failed to load health record {record_id}'}), 500
\ No newline at end of file
@@ -0,0 +1,179 @@
+from app import db
+from app.loading import CUSTOMER_LIST_COLUMNS
+from app.models import Customer
+from sqlalchemy import and_, column, func, inspect, literal_column, or_, select, table, text, update
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Columns returned for each match, the same as the customer list
+RESULT_COLUMNS = CUSTOMER_LIST_COLUMNS
+
+# SQLite full-text index over customer.search_text, see SQLITE_FTS_DDL
+customer_fts = table('customer_fts', column('rowid'))
+
+_pg_trgm = None
+
+
+def normalize(value):
+    """Lowercase, strip accents and split on anything that is not a letter or digit.
+
+    'José Peña-Núñez' becomes ['jose', 'pena', 'nunez'], so searches match
+    regardless of accents, case or punctuation.
+    """
+    if not value:
+        return []
+    decomposed = unicodedata.normalize('NFKD', value)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return re.findall(r'[a-z0-9]+', stripped.casefold())
+
+
+def search_text_for(customer):
+    """Build the normalized text a customer is found by."""
+    tokens = []
+    for value in (customer.first_name, customer.middle_name, customer.last_name,
+                  customer.second_last_name):
+        tokens.extend(normalize(value))
+    id_tokens = normalize(customer.id_number)
+    tokens.extend(id_tokens)
+    if len(id_tokens) > 1:
+        # 'AB-12345' is also found as 'ab12345'
+        tokens.append(''.join(id_tokens))
+    digits = re.sub(r'\D', '', customer.phone or '')
+    # The number with and without country and area codes, so typing the
+    # start of the local number matches on prefix-only indexes
+    tokens.extend(digits[start:] for start in range(max(len(digits) - 6, 1)))
+    return ' '.join(tokens)
+
+
+def index_customer(customer):
+    """Refresh a customer's search text; call before committing a create or update."""
+    customer.search_text = search_text_for(customer)
+
+
+def _has_pg_trgm():
+    global _pg_trgm
+    if _pg_trgm is None:
+        _pg_trgm = db.session.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")) is not None
+    return _pg_trgm
+
+
+def search_customers(query, limit=DEFAULT_LIMIT):
+    """Find customers by name, phone or ID number, best matches first.
+
+    Every word of the query must match the start of a word of the customer
+    (SQLite) or appear anywhere in it (PostgreSQL). On PostgreSQL names that
+    are merely close to the query, such as typos, are found as well through
+    trigram similarity and results are ranked by it; on SQLite whole-word
+    matches come before prefix matches. Returns a list of row mappings.
+    """
+    terms = normalize(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        # Whole-word matches first, then prefix matches. Ordering by bm25
+        # would score every match, which for a common surname or a country
+        # code is most of the table; these two lookups stop after limit rows.
+        ids = _fts_ids(' '.join(f'"{term}"' for term in terms), limit, [])
+        if len(ids) < limit:
+            ids += _fts_ids(' '.join(f'"{term}"*' for term in terms), limit - len(ids), ids)
+        rows = {row.id: row for row in db.session.execute(
+            select(*RESULT_COLUMNS).where(Customer.id.in_(ids))
+        ).mappings()}
+        return [rows[customer_id] for customer_id in ids if customer_id in rows]
+
+    contains_all = and_(*(Customer.search_text.ilike(f"%{term}%") for term in terms))
+    if dialect == 'postgresql' and _has_pg_trgm():
+        # Both conditions are served by the trigram GIN index
+        phrase = ' '.join(terms)
+        score = func.word_similarity(phrase, Customer.search_text)
+        statement = select(*RESULT_COLUMNS).where(
+            or_(contains_all, Customer.search_text.op('%>')(phrase))
+        ).order_by(score.desc(), Customer.id).limit(limit)
+    else:
+        statement = select(*RESULT_COLUMNS).where(contains_all).order_by(
+            Customer.last_name, Customer.first_name, Customer.id
+        ).limit(limit)
+    return db.session.execute(statement).mappings().all()
+
+
+def _fts_ids(match, limit, exclude):
+    statement = select(customer_fts.c.rowid).where(
+        literal_column('customer_fts').op('MATCH')(match)
+    ).limit(limit)
+    if exclude:
+        statement = statement.where(customer_fts.c.rowid.not_in(exclude))
+    return list(db.session.scalars(statement))
+
+
+def build_search_index():
+    """Add and fill customer.search_text and create the search index.
+
+    Used by the schema migration; safe to run again. PostgreSQL gets a
+    pg_trgm GIN index on search_text, SQLite an FTS5 table over it that
+    triggers keep in step with the customer table.
+    """
+    columns = {c['name'] for c in inspect(db.engine).get_columns(Customer.__tablename__)}
+    if 'search_text' not in columns:
+        db.session.execute(text("ALTER TABLE customer ADD COLUMN search_text TEXT"))
+
+    # Read only the searched columns, in chunks, and write back by primary key
+    filled = 0
+    result = db.session.execute(
+        select(Customer.id, Customer.first_name, Customer.middle_name, Customer.last_name,
+               Customer.second_last_name, Customer.phone, Customer.id_number)
+        .execution_options(yield_per=1000)
+    )
+    for rows in result.partitions():
+        db.session.execute(update(Customer), [
+            {'id': row.id, 'search_text': search_text_for(row)} for row in rows
+        ])
+        filled += len(rows)
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO customer_fts(customer_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        try:
+            with db.session.begin_nested():
+                db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_customer_search_trgm "
+                "ON customer USING gin (search_text gin_trgm_ops)"
+            ))
+        except Exception as e:
+            logger.warning("pg_trgm is not available, customer search will not be indexed: %s", e)
+    db.session.commit()
+    logger.info("Indexed %s customers for search", filled)
+    return filled
+
+
+# External-content FTS5 table over customer.search_text. The unicode61
+# tokenizer also folds diacritics, and the prefix indexes make 'mar*'
+# style queries as fast as whole-word ones.
+SQLITE_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts USING fts5(
+        search_text, content='customer', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS customer_fts_insert AFTER INSERT ON customer BEGIN
+        INSERT INTO customer_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customer_fts_delete AFTER DELETE ON customer BEGIN
+        INSERT INTO customer_fts(customer_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customer_fts_update AFTER UPDATE OF search_text ON customer BEGIN
+        INSERT INTO customer_fts(customer_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO customer_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+)
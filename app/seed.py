@@ -0,0 +1,69 @@
+from app import db, http_cache
+from app.inventory import add_units
+from app.models import Battery, BatteryType
+from sqlalchemy import insert, select
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATTERY_TYPES = [
+    {
+        'name': 'Phone Charge at Waypoint',
+        'type': 'charging',
+        'capacity': None,
+        'rental_price': 0.28,
+        'delivery_fee': 0.00,
+        'units': 0
+    },
+    {
+        'name': '250 Wh Anker Battery',
+        'type': 'battery',
+        'capacity': '250 Wh',
+        'rental_price': 0.56,
+        'delivery_fee': 0.84,
+        'units': 80
+    },
+    {
+        'name': 'Small Portable Battery',
+        'type': 'battery',
+        'capacity': '100 Wh',
+        'rental_price': 0.28,
+        'delivery_fee': 0.84,
+        'units': 5
+    }
+]
+
+
+def seed_defaults():
+    """Create the default battery types and their units if they are missing.
+
+    Types are matched by name, so existing rows (and any edits made to them)
+    are left alone and running this on every boot costs one query. Units of
+    a new type are inserted with a single multi-row INSERT.
+    """
+    existing = set(db.session.scalars(select(BatteryType.name)))
+    created = 0
+    for battery_type_data in DEFAULT_BATTERY_TYPES:
+        if battery_type_data['name'] in existing:
+            continue
+        battery_type_data = dict(battery_type_data)
+        units = battery_type_data.pop('units')
+        battery_type = BatteryType(**battery_type_data)
+        db.session.add(battery_type)
+        db.session.flush()  # Get the ID of the battery type
+
+        # Create battery units if it's a physical battery
+        if battery_type.type == 'battery' and units:
+            db.session.execute(insert(Battery), [
+                {'battery_type_id': battery_type.id, 'unit_number': i + 1, 'status': 'available'}
+                for i in range(units)
+            ])
+            add_units(battery_type.id, units)
+        created += 1
+
+    if created:
+        http_cache.invalidate('batteries')
+    db.session.commit()
+    if created:
+        logger.info("Created %s default battery types", created)
+    return created
@@ -1,56 +1,97 @@
 // Navigation and page loading functions
 function loadDashboard() {
     const app = document.getElementById('app');
+    const today = new Date().toISOString().slice(0, 10);
+    const monthAgo = new Date(Date.now() - 30 * 24 * 3600 * 1000).toISOString().slice(0, 10);
     app.innerHTML = `
         <h2>Dashboard</h2>
+        <form id="dashboardRangeForm" class="dashboard-range">
+            <div class="form-group">
+                <label for="dashboard_start">From:</label>
+                <input type="date" id="dashboard_start" value="${monthAgo}">
+            </div>
+            <div class="form-group">
+                <label for="dashboard_end">To:</label>
+                <input type="date" id="dashboard_end" value="${today}">
+            </div>
+            <div class="form-group">
+                <label for="dashboard_granularity">Group by:</label>
+                <select id="dashboard_granularity">
+                    <option value="hour">Hour</option>
+                    <option value="day" selected>Day</option>
+                    <option value="week">Week</option>
+                    <option value="month">Month</option>
+                </select>
+            </div>
+            <button type="submit">Update</button>
+        </form>
         <div class="chart-container">
             <canvas id="dashboardChart"></canvas>
         </div>
         <div class="dashboard-stats">
-            <h3>Recent Activity</h3>
+            <h3>Activity in Range</h3>
             <div id="recentActivity"></div>
         </div>
     `;
 
-    // Load dashboard data
-    fetch('/api/dashboard/stats')
+    document.getElementById('dashboardRangeForm').addEventListener('submit', function(e) {
+        e.preventDefault();
+        loadDashboardStats();
+    });
+    loadDashboardStats();
+}
+
+function loadDashboardStats() {
+    const params = new URLSearchParams({
+        start: document.getElementById('dashboard_start').value,
+        // Include the whole last day
+        end: `${document.getElementById('dashboard_end').value}T23:59:59`,
+        granularity: document.getElementById('dashboard_granularity').value
+    });
+
+    fetch(`/api/dashboard/stats?${params}`)
         .then(response => response.json())
         .then(data => {
-            console.log('Dashboard data:', data);
-            
+            if (data.error) {
+                throw new Error(data.error);
+            }
+
             // Always display the fallback stats first
+            const totals = data.totals || {};
+            const card = (title, service) => `
+                <div class="stat-card">
+                    <h4>${title}</h4>
+                    <p class="stat-number">${(totals[service] || {}).count || 0}</p>
+                    <p>$${((totals[service] || {}).revenue || 0).toFixed(2)}</p>
+                </div>
+            `;
             const recentActivity = document.getElementById('recentActivity');
             if (recentActivity) {
                 recentActivity.innerHTML = `
+                    ${card('Battery Rentals', 'rental')}
+                    ${card('Water Sales', 'water_sale')}
+                    ${card('Internet Access', 'internet_access')}
+                    ${card('Health Visits', 'health_record')}
                     <div class="stat-card">
-                        <h4>Battery Rentals</h4>
-                        <p class="stat-number">${data.rentals || 0}</p>
-                    </div>
-                    <div class="stat-card">
-                        <h4>Water Sales</h4>
-                        <p class="stat-number">${data.water_sales || 0}</p>
-                    </div>
-                    <div class="stat-card">
-                        <h4>Internet Access</h4>
-                        <p class="stat-number">${data.internet_accesses || 0}</p>
+                        <h4>Total Revenue</h4>
+                        <p class="stat-number">$${(data.revenue || 0).toFixed(2)}</p>
                     </div>
                 `;
             }
-            
+
             // Then try to create the chart as an enhancement
             try {
-                // Try to create chart, but don't worry if it fails
                 if (!createDashboardChart(data)) {
                     console.log('Using fallback dashboard display');
                 }
             } catch (err) {
                 console.error('Error creating chart:', err);
-                // We already have the fallback display, so no need to show an error
             }
         })
         .catch(error => {
             console.error('Error loading dashboard:', error);
-            app.innerHTML += '<p class="error">Error loading dashboard data</p>';
+            document.getElementById('recentActivity').innerHTML =
+                `<p class="error">Error loading dashboard data: ${error.message}</p>`;
         });
 }
 
@@ -59,6 +100,10 @@ function loadCustomers() {
     app.innerHTML = `
         <h2>Customer Management</h2>
         <button onclick="loadAddCustomerForm()" class="add-button">Add New Customer</button>
+        <a href="/api/exports/customers.csv" class="export-link" download>Export CSV</a>
+        <div class="form-group">
+            <input type="search" id="customerSearch" placeholder="Search by name, phone or ID number" autocomplete="off">
+        </div>
         <div id="customersList">
             <table>
                 <thead>
@@ -76,13 +121,32 @@ function loadCustomers() {
         </div>
     `;
 
-    // Load customers data
-    fetch('/api/customers')
+    // Search as the user types, once they pause
+    let searchTimer = null;
+    document.getElementById('customerSearch').addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        const query = this.value.trim();
+        searchTimer = setTimeout(() => {
+            fetchCustomerRows(query ? `/api/customers/search?q=${encodeURIComponent(query)}` : '/api/customers', query);
+        }, 250);
+    });
+
+    fetchCustomerRows('/api/customers', '');
+}
+
+function fetchCustomerRows(url, query) {
+    fetch(url)
         .then(response => response.json())
-        .then(customers => {
+        .then(data => {
+            // Ignore responses for a query the user has already changed
+            const search = document.getElementById('customerSearch');
+            if (!search || search.value.trim() !== query) {
+                return;
+            }
+            const customers = Array.isArray(data) ? data : data.items;
             const tbody = document.getElementById('customersTableBody');
             if (tbody) {
-                tbody.innerHTML = customers.map(customer => `
+                tbody.innerHTML = customers.length ? customers.map(customer => `
                     <tr>
                         <td>${customer.first_name} ${customer.middle_name || ''} ${customer.last_name} ${customer.second_last_name || ''}</td>
                         <td>${customer.phone}</td>
@@ -92,7 +156,7 @@ function loadCustomers() {
                             <button onclick="editCustomer(${customer.id})">Edit</button>
                         </td>
                     </tr>
-                `).join('');
+                `).join('') : '<tr><td colspan="4">No customers found</td></tr>';
             }
         })
         .catch(error => {
@@ -327,26 +391,46 @@ function viewCustomerDetails(customerId) {
                         ${customer.has_selfie ? `
                             <div class="photo-container">
                                 <h4>Selfie Photo</h4>
-                                <img src="/api/customers/${customer.id}/photos/selfie?cache=${Date.now()}" alt="Selfie Photo" class="customer-photo" style="max-width: 300px; height: auto;">
+                                <img src="/api/customers/${customer.id}/photos/selfie?size=thumb" alt="Selfie Photo" class="customer-photo" style="max-width: 300px; height: auto;">
                             </div>
                         ` : '<div class="photo-container"><h4>No Selfie Photo</h4><p>No selfie photo uploaded</p></div>'}
                         ${customer.has_id_photo ? `
                             <div class="photo-container">
                                 <h4>ID Photo</h4>
-                                <img src="/api/customers/${customer.id}/photos/id?cache=${Date.now()}" alt="ID Photo" class="customer-photo" style="max-width: 300px; height: auto;">
+                                <img src="/api/customers/${customer.id}/photos/id?size=thumb" alt="ID Photo" class="customer-photo" style="max-width: 300px; height: auto;">
                             </div>
                         ` : '<div class="photo-container"><h4>No ID Photo</h4><p>No ID photo uploaded</p></div>'}
                         ${customer.has_bill_photo ? `
                             <div class="photo-container">
                                 <h4>Bill Photo</h4>
-                                <img src="/api/customers/${customer.id}/photos/bill?cache=${Date.now()}" alt="Bill Photo" class="customer-photo" style="max-width: 300px; height: auto;">
+                                <img src="/api/customers/${customer.id}/photos/bill?size=thumb" alt="Bill Photo" class="customer-photo" style="max-width: 300px; height: auto;">
                             </div>
                         ` : '<div class="photo-container"><h4>No Bill Photo</h4><p>No bill photo uploaded</p></div>'}
                     </div>
+
+                    <div class="timeline-section">
+                        <h3>History</h3>
+                        <p id="customerTotals"></p>
+                        <table>
+                            <thead>
+                                <tr>
+                                    <th>Date</th>
+                                    <th>Type</th>
+                                    <th>Details</th>
+                                    <th>Amount</th>
+                                    <th>Until</th>
+                                </tr>
+                            </thead>
+                            <tbody id="customerTimelineBody">
+                                <tr><td colspan="5">Loading history...</td></tr>
+                            </tbody>
+                        </table>
+                    </div>
                 </div>
                 <button onclick="loadCustomers()">Back to Customers</button>
                 <button onclick="editCustomer(${customer.id})">Edit Customer</button>
             `;
+            loadCustomerTimeline(customer.id);
         })
         .catch(error => {
             console.error('Error loading customer details:', error);
@@ -354,6 +438,41 @@ function viewCustomerDetails(customerId) {
         });
 }
 
+const TIMELINE_LABELS = {
+    rental: 'Battery rental',
+    water_sale: 'Water sale',
+    internet_access: 'Internet access',
+    health_record: 'Health visit'
+};
+
+// One request returns the customer's merged history, newest first, and on
+// the first page their lifetime totals
+function loadCustomerTimeline(customerId) {
+    loadPagedRows(`/api/customers/${customerId}/timeline`, 'customerTimelineBody', {
+        colspan: 5,
+        emptyMessage: 'No transactions yet',
+        errorMessage: 'Error loading history',
+        onFirstPage: page => {
+            const totals = document.getElementById('customerTotals');
+            if (totals && page.totals) {
+                totals.textContent = `Lifetime spend: $${page.totals.spent.toFixed(2)} — ` +
+                    Object.keys(TIMELINE_LABELS)
+                        .map(type => `${TIMELINE_LABELS[type]}: ${page.totals[type].count}`)
+                        .join(', ');
+            }
+        },
+        renderRow: entry => `
+            <tr>
+                <td>${new Date(entry.at).toLocaleString()}</td>
+                <td>${TIMELINE_LABELS[entry.type]}</td>
+                <td>${entry.detail || ''}</td>
+                <td>${entry.amount === null ? '' : '$' + entry.amount.toFixed(2)}</td>
+                <td>${entry.until ? new Date(entry.until).toLocaleString() : ''}</td>
+            </tr>
+        `
+    });
+}
+
 async function editCustomer(customerId) {
     try {
         const response = await fetch(`/api/customers/${customerId}/details`);
@@ -445,7 +564,7 @@ async function editCustomer(customerId) {
                     <input type="file" id="selfie_photo" name="selfie_photo" accept="image/*">
                     <div id="selfie_preview" class="photo-preview">
                         ${customer.has_selfie ? 
-                            `<img src="/api/customers/${customer.id}/photos/selfie?cache=${Date.now()}" class="preview-image" alt="Current selfie photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
+                            `<img src="/api/customers/${customer.id}/photos/selfie?size=thumb" class="preview-image" alt="Current selfie photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
                             '<p>No current photo</p>'}
                     </div>
                 </div>
@@ -454,7 +573,7 @@ async function editCustomer(customerId) {
                     <input type="file" id="id_photo" name="id_photo" accept="image/*">
                     <div id="id_preview" class="photo-preview">
                         ${customer.has_id_photo ? 
-                            `<img src="/api/customers/${customer.id}/photos/id?cache=${Date.now()}" class="preview-image" alt="Current ID photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
+                            `<img src="/api/customers/${customer.id}/photos/id?size=thumb" class="preview-image" alt="Current ID photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
                             '<p>No current photo</p>'}
                     </div>
                 </div>
@@ -463,7 +582,7 @@ async function editCustomer(customerId) {
                     <input type="file" id="bill_photo" name="bill_photo" accept="image/*">
                     <div id="bill_preview" class="photo-preview">
                         ${customer.has_bill_photo ? 
-                            `<img src="/api/customers/${customer.id}/photos/bill?cache=${Date.now()}" class="preview-image" alt="Current bill photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
+                            `<img src="/api/customers/${customer.id}/photos/bill?size=thumb" class="preview-image" alt="Current bill photo" style="max-width: 200px; height: auto; display: block; margin: 10px 0;">` : 
                             '<p>No current photo</p>'}
                     </div>
                 </div>
@@ -522,6 +641,57 @@ async function editCustomer(customerId) {
     }
 }
 
+// Load one page of a paginated list endpoint into a table body.
+// The server returns {items, next_cursor}; while a cursor is present a
+// "Load More" row is appended that fetches the next page.
+function loadPagedRows(url, tbodyId, options, cursor = null) {
+    const separator = url.includes('?') ? '&' : '?';
+    const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+
+    fetch(pageUrl)
+        .then(response => response.json())
+        .then(page => {
+            const tbody = document.getElementById(tbodyId);
+            if (!tbody) {
+                return;
+            }
+            if (!cursor) {
+                if (options.onFirstPage) {
+                    options.onFirstPage(page);
+                }
+                tbody.innerHTML = '';
+                if (page.items.length === 0) {
+                    tbody.innerHTML = `<tr><td colspan="${options.colspan}">${options.emptyMessage}</td></tr>`;
+                    return;
+                }
+            }
+
+            const loadMoreRow = tbody.querySelector('.load-more-row');
+            if (loadMoreRow) {
+                loadMoreRow.remove();
+            }
+            tbody.insertAdjacentHTML('beforeend', page.items.map(options.renderRow).join(''));
+
+            if (page.next_cursor) {
+                tbody.insertAdjacentHTML('beforeend', `
+                    <tr class="load-more-row">
+                        <td colspan="${options.colspan}"><button>Load More</button></td>
+                    </tr>
+                `);
+                tbody.querySelector('.load-more-row button').addEventListener('click', () => {
+                    loadPagedRows(url, tbodyId, options, page.next_cursor);
+                });
+            }
+        })
+        .catch(error => {
+            console.error(`Error loading ${url}:`, error);
+            const tbody = document.getElementById(tbodyId);
+            if (tbody) {
+                tbody.innerHTML = `<tr><td colspan="${options.colspan}">${options.errorMessage}</td></tr>`;
+            }
+        });
+}
+
 function loadBatteryRentals() {
     const app = document.getElementById('app');
     app.innerHTML = `
@@ -529,6 +699,7 @@ function loadBatteryRentals() {
         <div class="button-group">
             <button onclick="newRental()" class="add-button">New Rental</button>
             <button onclick="manageBatteries()" class="manage-button">Manage Batteries</button>
+            <a href="/api/exports/rentals.csv" class="export-link" download>Export CSV</a>
         </div>
         <div id="rentalsList">
             <table>
@@ -551,40 +722,27 @@ function loadBatteryRentals() {
         </div>
     `;
 
-    // Load rentals data
-    fetch('/api/rentals')
-        .then(response => response.json())
-        .then(rentals => {
-            const tbody = document.getElementById('rentalsTableBody');
-            if (tbody) {
-                if (rentals.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="8">No rentals found</td></tr>';
-                    return;
-                }
-                tbody.innerHTML = rentals.map(rental => `
-                    <tr>
-                        <td>${rental.customer_name}</td>
-                        <td>${rental.battery_name}</td>
-                        <td>$${rental.rental_price.toFixed(2)}</td>
-                        <td>$${rental.delivery_fee.toFixed(2)}</td>
-                        <td>${new Date(rental.rented_at).toLocaleString()}</td>
-                        <td>${rental.returned_at ? new Date(rental.returned_at).toLocaleString() : 'N/A'}</td>
-                        <td>${rental.returned_at ? 'Returned' : 'Active'}</td>
-                        <td>
-                            <button onclick="viewRental(${rental.id})">View</button>
-                            ${!rental.returned_at ? `<button onclick="returnRental(${rental.id})">Return</button>` : ''}
-                        </td>
-                    </tr>
-                `).join('');
-            }
-        })
-        .catch(error => {
-            console.error('Error loading rentals:', error);
-            const tbody = document.getElementById('rentalsTableBody');
-            if (tbody) {
-                tbody.innerHTML = '<tr><td colspan="8">Error loading rentals</td></tr>';
-            }
-        });
+    // Load rentals data one page at a time
+    loadPagedRows('/api/rentals', 'rentalsTableBody', {
+        colspan: 8,
+        emptyMessage: 'No rentals found',
+        errorMessage: 'Error loading rentals',
+        renderRow: rental => `
+            <tr>
+                <td>${rental.customer_name}</td>
+                <td>${rental.battery_name}</td>
+                <td>$${rental.rental_price.toFixed(2)}</td>
+                <td>$${rental.delivery_fee.toFixed(2)}</td>
+                <td>${new Date(rental.rented_at).toLocaleString()}</td>
+                <td>${rental.returned_at ? new Date(rental.returned_at).toLocaleString() : 'N/A'}</td>
+                <td>${rental.returned_at ? 'Returned' : 'Active'}</td>
+                <td>
+                    <button onclick="viewRental(${rental.id})">View</button>
+                    ${!rental.returned_at ? `<button onclick="returnRental(${rental.id})">Return</button>` : ''}
+                </td>
+            </tr>
+        `
+    });
 }
 
 async function newRental() {
@@ -607,7 +765,7 @@ async function newRental() {
             <div class="form-group" id="batteryUnitGroup" style="display: none;">
                 <label for="battery">Select Battery Unit:</label>
                 <select id="battery" name="battery_id">
-                    <option value="">Select a battery unit</option>
+                    <option value="">Any available unit</option>
                 </select>
             </div>
             <div class="form-group">
@@ -681,7 +839,7 @@ async function newRental() {
                     );
                     console.log('Filtered available batteries:', availableBatteries);
 
-                    batterySelect.innerHTML = '<option value="">Select a battery unit</option>';
+                    batterySelect.innerHTML = '<option value="">Any available unit</option>';
                     availableBatteries.forEach(battery => {
                         const option = document.createElement('option');
                         option.value = battery.id;
@@ -690,7 +848,6 @@ async function newRental() {
                     });
 
                     batteryUnitGroup.style.display = 'block';
-                    batterySelect.required = true;
                 } catch (error) {
                     console.error('Error loading available batteries:', error);
                     alert('Error loading available batteries. Please try again.');
@@ -718,12 +875,9 @@ async function newRental() {
                 delivery_fee: parseFloat(form.delivery_fee.value)
             };
 
-            // Only include battery_id for physical battery rentals
-            if (selectedType && selectedType.type === 'battery') {
-                if (!form.battery_id.value) {
-                    alert('Please select a battery unit');
-                    return;
-                }
+            // Only include battery_id when a specific unit was picked;
+            // otherwise the server allocates any available unit of the type
+            if (selectedType && selectedType.type === 'battery' && form.battery_id.value) {
                 formData.battery_id = parseInt(form.battery_id.value);
             }
 
@@ -741,7 +895,9 @@ async function newRental() {
                 console.log('Server response:', result);
 
                 if (response.ok) {
-                    alert('Rental created successfully!');
+                    alert(result.unit_number
+                        ? `Rental created successfully! Hand out unit #${result.unit_number}.`
+                        : 'Rental created successfully!');
                     loadBatteryRentals();
                 } else {
                     alert(`Failed to create rental: ${result.error}`);
@@ -762,6 +918,7 @@ function loadWaterSales() {
     app.innerHTML = `
         <h2>Water Sales</h2>
         <button onclick="newWaterSale()" class="add-button">New Water Sale</button>
+        <a href="/api/exports/water-sales.csv" class="export-link" download>Export CSV</a>
         <div id="waterSalesList">
             <table>
                 <thead>
@@ -780,36 +937,23 @@ function loadWaterSales() {
         </div>
     `;
 
-    // Load water sales data
-    fetch('/api/water-sales')
-        .then(response => response.json())
-        .then(sales => {
-            const tbody = document.getElementById('waterSalesTableBody');
-            if (tbody) {
-                if (sales.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="5">No water sales found</td></tr>';
-                    return;
-                }
-                tbody.innerHTML = sales.map(sale => `
-                    <tr>
-                        <td>${sale.customer_name}</td>
-                        <td>${sale.size} liters</td>
-                        <td>$${sale.price.toFixed(2)}</td>
-                        <td>${new Date(sale.sold_at).toLocaleString()}</td>
-                        <td>
-                            <button onclick="viewWaterSale(${sale.id})">View</button>
-                        </td>
-                    </tr>
-                `).join('');
-            }
-        })
-        .catch(error => {
-            console.error('Error loading water sales:', error);
-            const tbody = document.getElementById('waterSalesTableBody');
-            if (tbody) {
-                tbody.innerHTML = '<tr><td colspan="5">Error loading water sales</td></tr>';
-            }
-        });
+    // Load water sales data one page at a time
+    loadPagedRows('/api/water-sales', 'waterSalesTableBody', {
+        colspan: 5,
+        emptyMessage: 'No water sales found',
+        errorMessage: 'Error loading water sales',
+        renderRow: sale => `
+            <tr>
+                <td>${sale.customer_name}</td>
+                <td>${sale.size} liters</td>
+                <td>$${sale.price.toFixed(2)}</td>
+                <td>${new Date(sale.sold_at).toLocaleString()}</td>
+                <td>
+                    <button onclick="viewWaterSale(${sale.id})">View</button>
+                </td>
+            </tr>
+        `
+    });
 }
 
 function newWaterSale() {
@@ -929,6 +1073,7 @@ function loadInternetAccess() {
     app.innerHTML = `
         <h2>Internet Access</h2>
         <button onclick="newInternetAccess()" class="add-button">New Internet Access</button>
+        <a href="/api/exports/internet-access.csv" class="export-link" download>Export CSV</a>
         <div id="internetAccessList">
             <table>
                 <thead>
@@ -947,36 +1092,23 @@ function loadInternetAccess() {
         </div>
     `;
 
-    // Load internet access data
-    fetch('/api/internet-access')
-        .then(response => response.json())
-        .then(records => {
-            const tbody = document.getElementById('internetAccessTableBody');
-            if (tbody) {
-                if (records.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="5">No internet access records found</td></tr>';
-                    return;
-                }
-                tbody.innerHTML = records.map(record => `
-                    <tr>
-                        <td>${record.customer_name}</td>
-                        <td>${new Date(record.purchased_at).toLocaleString()}</td>
-                        <td><code>${record.wifi_password}</code></td>
-                        <td>${record.status}</td>
-                        <td>
-                            <button onclick="viewInternetAccess(${record.id})">View Details</button>
-                        </td>
-                    </tr>
-                `).join('');
-            }
-        })
-        .catch(error => {
-            console.error('Error loading internet access records:', error);
-            const tbody = document.getElementById('internetAccessTableBody');
-            if (tbody) {
-                tbody.innerHTML = '<tr><td colspan="5">Error loading internet access records</td></tr>';
-            }
-        });
+    // Load internet access data one page at a time
+    loadPagedRows('/api/internet-access', 'internetAccessTableBody', {
+        colspan: 5,
+        emptyMessage: 'No internet access records found',
+        errorMessage: 'Error loading internet access records',
+        renderRow: record => `
+            <tr>
+                <td>${record.customer_name}</td>
+                <td>${new Date(record.purchased_at).toLocaleString()}</td>
+                <td><code>${record.wifi_password}</code></td>
+                <td>${record.status}</td>
+                <td>
+                    <button onclick="viewInternetAccess(${record.id})">View Details</button>
+                </td>
+            </tr>
+        `
+    });
 }
 
 function newInternetAccess() {
@@ -1264,40 +1396,6 @@ function addBattery() {
     });
 }
 
-// Initialize charts
-function createDashboardChart(data) {
-    const ctx = document.getElementById('dashboardChart').getContext('2d');
-
-    new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: ['Battery Rentals', 'Water Sales', 'Internet Access'],
-            datasets: [{
-                label: 'Last 30 Days',
-                data: [data.rentals, data.water_sales, data.internet_accesses],
-                backgroundColor: [
-                    'rgba(255, 99, 132, 0.2)',
-                    'rgba(54, 162, 235, 0.2)',
-                    'rgba(255, 206, 86, 0.2)'
-                ],
-                borderColor: [
-                    'rgba(255, 99, 132, 1)',
-                    'rgba(54, 162, 235, 1)',
-                    'rgba(255, 206, 86, 1)'
-                ],
-                borderWidth: 1
-            }]
-        },
-        options: {
-            scales: {
-                y: {
-                    beginAtZero: true
-                }
-            }
-        }
-    });
-}
-
 // Event listener for navigation
 document.addEventListener('DOMContentLoaded', function() {
     // Initial page load
@@ -1341,6 +1439,7 @@ function loadHealthAccess() {
     app.innerHTML = `
         <h2>Health Access</h2>
         <button onclick="newHealthRecord()" class="add-button">New Health Record</button>
+        <a href="/api/exports/health-access.csv" class="export-link" download>Export CSV</a>
         <div id="healthRecordsList">
             <table>
                 <thead>
@@ -1359,36 +1458,23 @@ function loadHealthAccess() {
         </div>
     `;
 
-    // Load health records
-    fetch('/api/health-access')
-        .then(response => response.json())
-        .then(records => {
-            const tbody = document.getElementById('healthRecordsTableBody');
-            if (tbody) {
-                if (records.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="5">No health records found</td></tr>';
-                    return;
-                }
-                tbody.innerHTML = records.map(record => `
-                    <tr>
-                        <td>${record.customer_name}</td>
-                        <td>${new Date(record.visit_date).toLocaleString()}</td>
-                        <td>${record.symptoms}</td>
-                        <td>${record.treatments}</td>
-                        <td>
-                            <button onclick="viewHealthRecord(${record.id})">View Details</button>
-                        </td>
-                    </tr>
-                `).join('');
-            }
-        })
-        .catch(error => {
-            console.error('Error loading health records:', error);
-            const tbody = document.getElementById('healthRecordsTableBody');
-            if (tbody) {
-                tbody.innerHTML = '<tr><td colspan="5">Error loading health records</td></tr>';
-            }
-        });
+    // Load health records one page at a time
+    loadPagedRows('/api/health-access', 'healthRecordsTableBody', {
+        colspan: 5,
+        emptyMessage: 'No health records found',
+        errorMessage: 'Error loading health records',
+        renderRow: record => `
+            <tr>
+                <td>${record.customer_name}</td>
+                <td>${new Date(record.visit_date).toLocaleString()}</td>
+                <td>${record.symptoms}</td>
+                <td>${record.treatments}</td>
+                <td>
+                    <button onclick="viewHealthRecord(${record.id})">View Details</button>
+                </td>
+            </tr>
+        `
+    });
 }
 
 function newHealthRecord() {
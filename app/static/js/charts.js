@@ -1,3 +1,26 @@
+// Colors per service, shared by the revenue bars and the legend
+const SERVICE_CHART_STYLES = {
+    rental: { label: 'Battery Rentals', color: '255, 99, 132' },
+    water_sale: { label: 'Water Sales', color: '54, 162, 235' },
+    internet_access: { label: 'Internet Access', color: '255, 206, 86' },
+    health_record: { label: 'Health Visits', color: '75, 192, 192' }
+};
+
+let dashboardChart = null;
+
+function formatBucketLabel(start, granularity) {
+    const date = new Date(start);
+    if (granularity === 'hour') {
+        return `${start.slice(5, 10)} ${start.slice(11, 16)}`;
+    }
+    if (granularity === 'month') {
+        return date.toLocaleDateString(undefined, { year: 'numeric', month: 'short' });
+    }
+    return start.slice(0, 10);
+}
+
+// Draws revenue per service as stacked bars and the number of transactions
+// as a line, one point per bucket of the /api/dashboard/stats series
 function createDashboardChart(data) {
     try {
         // Check if Chart class is available
@@ -5,60 +28,81 @@ function createDashboardChart(data) {
             console.error('Chart.js is not available');
             return false;
         }
-        
+
         // Check if canvas context is available
         const canvas = document.getElementById('dashboardChart');
         if (!canvas) {
             console.error('Canvas element not found');
             return false;
         }
-        
+
         const ctx = canvas.getContext('2d');
         if (!ctx) {
             console.error('Canvas context is not available');
             return false;
         }
-        
-        // Make sure data values are numbers, not strings
-        const rentals = parseInt(data.rentals || 0, 10);
-        const waterSales = parseInt(data.water_sales || 0, 10);
-        const internetAccesses = parseInt(data.internet_accesses || 0, 10);
-        
-        // Create the chart
-        new Chart(ctx, {
+
+        const buckets = data.buckets || [];
+        const services = Object.keys(data.totals || {}).filter(service => SERVICE_CHART_STYLES[service]);
+
+        const datasets = services.map(service => ({
             type: 'bar',
+            label: `${SERVICE_CHART_STYLES[service].label} revenue`,
+            data: buckets.map(bucket => Number(bucket.services[service].revenue.toFixed(2))),
+            backgroundColor: `rgba(${SERVICE_CHART_STYLES[service].color}, 0.2)`,
+            borderColor: `rgba(${SERVICE_CHART_STYLES[service].color}, 1)`,
+            borderWidth: 1,
+            stack: 'revenue',
+            yAxisID: 'revenue'
+        }));
+        datasets.push({
+            type: 'line',
+            label: '# of Transactions',
+            data: buckets.map(bucket => services.reduce((sum, service) => sum + bucket.services[service].count, 0)),
+            borderColor: 'rgba(102, 102, 102, 1)',
+            backgroundColor: 'rgba(102, 102, 102, 0.2)',
+            tension: 0.2,
+            yAxisID: 'count'
+        });
+
+        // Redrawing for a new range reuses the same canvas
+        if (dashboardChart) {
+            dashboardChart.destroy();
+        }
+        dashboardChart = new Chart(ctx, {
             data: {
-                labels: ['Battery Rentals', 'Water Sales', 'Internet Access'],
-                datasets: [{
-                    label: '# of Transactions',
-                    data: [rentals, waterSales, internetAccesses],
-                    backgroundColor: [
-                        'rgba(255, 99, 132, 0.2)',
-                        'rgba(54, 162, 235, 0.2)',
-                        'rgba(255, 206, 86, 0.2)'
-                    ],
-                    borderColor: [
-                        'rgba(255, 99, 132, 1)',
-                        'rgba(54, 162, 235, 1)',
-                        'rgba(255, 206, 86, 1)'
-                    ],
-                    borderWidth: 1
-                }]
+                labels: buckets.map(bucket => formatBucketLabel(bucket.start, data.granularity)),
+                datasets: datasets
             },
             options: {
                 scales: {
-                    y: {
+                    revenue: {
+                        type: 'linear',
+                        position: 'left',
+                        stacked: true,
+                        beginAtZero: true,
+                        title: { display: true, text: 'Revenue ($)' }
+                    },
+                    count: {
+                        type: 'linear',
+                        position: 'right',
                         beginAtZero: true,
-                        ticks: {
-                            precision: 0
-                        }
+                        grid: { drawOnChartArea: false },
+                        ticks: { precision: 0 },
+                        title: { display: true, text: 'Transactions' }
+                    },
+                    x: {
+                        stacked: true
                     }
                 },
-                responsive: true,
-                maintainAspectRatio: false
+                interaction: {
+                    mode: 'index',
+                    intersect: false
+                },
+                responsive: true
             }
         });
-        
+
         return true;
     } catch (error) {
         console.error('Error creating chart:', error);
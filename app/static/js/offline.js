@@ -10,58 +10,271 @@ function updateOnlineStatus() {
 window.addEventListener('online', updateOnlineStatus);
 window.addEventListener('offline', updateOnlineStatus);
 
-// Function to store data locally when offline
-function storeDataLocally(key, data) {
-    localStorage.setItem(key, JSON.stringify(data));
+// Outbox: POST requests made while offline are stored in IndexedDB with an
+// idempotency key and replayed when the connection comes back. Transactions
+// are sent in batches to /api/batch; everything else is replayed one by one
+// with an Idempotency-Key header, so a replay never creates a duplicate.
+const OUTBOX_DB = 'offgrid-outbox';
+const OUTBOX_STORE = 'requests';
+const BATCH_SIZE = 50;
+const RETRY_BASE_DELAY = 2000;
+const RETRY_MAX_DELAY = 5 * 60 * 1000;
+
+// Endpoints whose POSTs can be replayed through the batch endpoint
+const BATCH_TYPES = {
+    '/api/rentals': 'rental',
+    '/api/water-sales': 'water_sale',
+    '/api/internet-access': 'internet_access',
+    '/api/health-access': 'health_record'
+};
+
+// Timestamp field of each batch type, set to when the item was queued
+const BATCH_TIMESTAMP_FIELDS = {
+    rental: 'rented_at',
+    water_sale: 'sold_at',
+    internet_access: 'purchased_at',
+    health_record: 'visit_date'
+};
+
+let outboxDb = null;
+let syncInProgress = false;
+let retryAttempt = 0;
+let retryTimer = null;
+
+function openOutbox() {
+    if (outboxDb) {
+        return Promise.resolve(outboxDb);
+    }
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(OUTBOX_DB, 1);
+        request.onupgradeneeded = () => {
+            const store = request.result.createObjectStore(OUTBOX_STORE, { keyPath: 'idempotencyKey' });
+            store.createIndex('createdAt', 'createdAt');
+        };
+        request.onsuccess = () => {
+            outboxDb = request.result;
+            resolve(outboxDb);
+        };
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function outboxTransaction(mode, callback) {
+    const db = await openOutbox();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(OUTBOX_STORE, mode);
+        const result = callback(tx.objectStore(OUTBOX_STORE));
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+function addToOutbox(entry) {
+    return outboxTransaction('readwrite', store => store.put(entry));
+}
+
+function removeFromOutbox(keys) {
+    return outboxTransaction('readwrite', store => keys.forEach(key => store.delete(key)));
+}
+
+function readOutbox() {
+    return outboxTransaction('readonly', store => store.index('createdAt').getAll());
+}
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// FormData cannot be stored directly; keep its entries (Files are cloneable)
+function serializeBody(body) {
+    if (body instanceof FormData) {
+        return { kind: 'form', entries: Array.from(body.entries()) };
+    }
+    return { kind: 'raw', value: body };
+}
+
+function deserializeBody(body) {
+    if (body.kind === 'form') {
+        const formData = new FormData();
+        body.entries.forEach(([name, value]) => formData.append(name, value));
+        return formData;
+    }
+    return body.value;
+}
+
+async function queueRequest(url, config, idempotencyKey) {
+    const headers = Object.assign({}, config.headers || {});
+    delete headers['Idempotency-Key'];
+    await addToOutbox({
+        idempotencyKey,
+        url,
+        headers,
+        body: serializeBody(config.body),
+        createdAt: Date.now()
+    });
+    console.log(`Queued ${url} for sync (${idempotencyKey})`);
+    return new Response(JSON.stringify({ message: 'Stored locally, will sync when online', queued: true }), {
+        status: 202,
+        headers: { 'Content-Type': 'application/json' }
+    });
 }
 
-// Function to retrieve locally stored data
-function getLocalData(key) {
-    const data = localStorage.getItem(key);
-    return data ? JSON.parse(data) : null;
+function scheduleRetry() {
+    // Exponential backoff with jitter, so many kiosks reconnecting at once
+    // do not all hit the server at the same moment
+    const delay = Math.min(RETRY_BASE_DELAY * 2 ** retryAttempt, RETRY_MAX_DELAY) * (0.5 + Math.random() / 2);
+    retryAttempt += 1;
+    clearTimeout(retryTimer);
+    retryTimer = setTimeout(syncDataWithServer, delay);
+    console.log(`Outbox sync failed, retrying in ${Math.round(delay / 1000)}s`);
 }
 
-// Function to sync local data with server when back online
+async function sendBatch(entries) {
+    const response = await originalFetch('/api/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            items: entries.map(entry => {
+                const type = BATCH_TYPES[entry.url];
+                const data = JSON.parse(entry.body.value);
+                // The server stores naive UTC timestamps
+                data[BATCH_TIMESTAMP_FIELDS[type]] = data[BATCH_TIMESTAMP_FIELDS[type]] ||
+                    new Date(entry.createdAt).toISOString().replace('Z', '');
+                return { type, idempotency_key: entry.idempotencyKey, data };
+            })
+        })
+    });
+    if (!response.ok) {
+        throw new Error(`Batch sync failed with status ${response.status}`);
+    }
+    const { results } = await response.json();
+    results.filter(result => result.status === 'error' && !result.retryable).forEach(result => {
+        console.error(`Queued item ${result.idempotency_key} was rejected: ${result.error}`);
+    });
+    // Created, duplicate and rejected items are settled; retryable ones
+    // (another request still holds their key) stay queued for the next attempt
+    const retryable = new Set(results.filter(result => result.retryable).map(result => result.idempotency_key));
+    await removeFromOutbox(entries.map(entry => entry.idempotencyKey).filter(key => !retryable.has(key)));
+    if (retryable.size > 0) {
+        throw new Error(`${retryable.size} queued items are still in progress on the server`);
+    }
+}
+
+async function sendSingle(entry) {
+    const response = await originalFetch(entry.url, {
+        method: 'POST',
+        headers: Object.assign({}, entry.headers, { 'Idempotency-Key': entry.idempotencyKey }),
+        body: deserializeBody(entry.body)
+    });
+    if (response.status >= 500 || response.status === 409) {
+        throw new Error(`Sync of ${entry.url} failed with status ${response.status}`);
+    }
+    if (!response.ok) {
+        console.error(`Queued request to ${entry.url} was rejected with status ${response.status}`);
+    }
+    await removeFromOutbox([entry.idempotencyKey]);
+}
+
+// Replay the outbox in order, sending runs of transactions as batches
 async function syncDataWithServer() {
-    if (navigator.onLine) {
-        const localCustomers = getLocalData('offlineCustomers');
-        if (localCustomers) {
-            for (const customer of localCustomers) {
-                try {
-                    await fetch('/api/customers', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify(customer),
-                    });
-                } catch (error) {
-                    console.error('Error syncing customer:', error);
+    if (!navigator.onLine || syncInProgress) {
+        return;
+    }
+    syncInProgress = true;
+    try {
+        const entries = await readOutbox();
+        let i = 0;
+        while (i < entries.length) {
+            if (BATCH_TYPES[entries[i].url] && entries[i].body.kind === 'raw') {
+                const batch = [];
+                while (i < entries.length && batch.length < BATCH_SIZE &&
+                       BATCH_TYPES[entries[i].url] && entries[i].body.kind === 'raw') {
+                    batch.push(entries[i]);
+                    i += 1;
                 }
+                await sendBatch(batch);
+            } else {
+                await sendSingle(entries[i]);
+                i += 1;
             }
-            localStorage.removeItem('offlineCustomers');
         }
+        retryAttempt = 0;
+        if (entries.length > 0) {
+            console.log(`Synced ${entries.length} queued requests`);
+        }
+    } catch (error) {
+        console.error('Error syncing outbox:', error);
+        scheduleRetry();
+    } finally {
+        syncInProgress = false;
+    }
+}
 
-        // Sync other data types (rentals, water sales, internet access) similarly
+// Move anything left in the old localStorage queue into the outbox
+async function migrateLocalStorageQueue() {
+    const data = localStorage.getItem('offlineCustomers');
+    if (!data) {
+        return;
     }
+    for (const customer of JSON.parse(data)) {
+        await addToOutbox({
+            idempotencyKey: newIdempotencyKey(),
+            url: '/api/customers',
+            headers: { 'Content-Type': 'application/json' },
+            body: { kind: 'raw', value: JSON.stringify(customer) },
+            createdAt: Date.now()
+        });
+    }
+    localStorage.removeItem('offlineCustomers');
 }
 
 // Listen for online event to trigger sync
-window.addEventListener('online', syncDataWithServer);
+window.addEventListener('online', () => {
+    retryAttempt = 0;
+    syncDataWithServer().then(refreshCachedReads);
+});
+
+// The service worker caches the app shell and API reads. After a reconnect
+// it brings the cached lists up to date through their change feeds.
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/service-worker.js')
+        .catch(error => console.error('Service worker registration failed:', error));
+}
+
+function refreshCachedReads() {
+    if (navigator.serviceWorker && navigator.serviceWorker.controller) {
+        navigator.serviceWorker.controller.postMessage({ type: 'sync' });
+    }
+}
 
-// Modify fetch requests to handle offline scenarios
+// Every POST carries an Idempotency-Key, so retrying it is always safe.
+// POSTs that cannot reach the server are queued in the outbox.
 const originalFetch = window.fetch;
-window.fetch = async function(...args) {
+window.fetch = async function(resource, config = {}) {
+    const method = (config.method || 'GET').toUpperCase();
+    if (method !== 'POST' || typeof resource !== 'string' || !resource.startsWith('/api/')) {
+        return originalFetch.call(this, resource, config);
+    }
+
+    const headers = Object.assign({}, config.headers || {});
+    const idempotencyKey = headers['Idempotency-Key'] || newIdempotencyKey();
+    headers['Idempotency-Key'] = idempotencyKey;
+
     if (!navigator.onLine) {
-        const [resource, config] = args;
-        if (resource === '/api/customers' && config.method === 'POST') {
-            const customer = JSON.parse(config.body);
-            const offlineCustomers = getLocalData('offlineCustomers') || [];
-            offlineCustomers.push(customer);
-            storeDataLocally('offlineCustomers', offlineCustomers);
-            return new Response(JSON.stringify({ message: 'Customer stored locally' }), { status: 200 });
-        }
-        // Handle other API endpoints similarly for offline storage
+        return queueRequest(resource, config, idempotencyKey);
+    }
+    try {
+        return await originalFetch.call(this, resource, Object.assign({}, config, { headers }));
+    } catch (error) {
+        // Network failure: the request may or may not have arrived, the
+        // idempotency key makes the later replay safe either way
+        return queueRequest(resource, config, idempotencyKey);
     }
-    return originalFetch.apply(this, args);
 };
+
+migrateLocalStorageQueue()
+    .then(syncDataWithServer)
+    .catch(error => console.error('Error starting outbox sync:', error));
@@ -0,0 +1,229 @@
+// Service Worker for Offline Support
+//
+// Requests are handled by route class:
+//  - the app shell (html, css, js, images) is cache-first from a versioned
+//    cache; bump STATIC_CACHE with every release that changes these files
+//  - API reads are stale-while-revalidate from a cache holding at most
+//    MAX_API_ENTRIES responses, least recently used evicted first. The
+//    transaction and customer lists revalidate through their ?since=
+//    change feed, so after a reconnect only the changed rows come over
+//    the link
+//  - writes go to the network only, and a successful write refreshes the
+//    cached API reads before the next one is answered
+const STATIC_CACHE = 'offgrid-static-v2';
+const API_CACHE = 'offgrid-api-v1';
+const MAX_API_ENTRIES = 100;
+
+// A merged first page that grows past this is downloaded again instead
+const MAX_MERGED_ITEMS = 500;
+const MAX_FEED_PAGES = 5;
+
+const STATIC_ASSETS = [
+  '/',
+  '/index.html',
+  '/css/styles.css',
+  '/js/chart.min.js',
+  '/js/app.js',
+  '/js/charts.js',
+  '/js/offline.js',
+  '/images/logo.svg'
+];
+
+// Lists with a change feed -> timestamp field the list is ordered by
+// (newest first, paginated), or null for the full customer list ordered by id
+const FEED_LISTS = {
+  '/api/rentals': 'rented_at',
+  '/api/water-sales': 'sold_at',
+  '/api/internet-access': 'purchased_at',
+  '/api/health-access': 'visit_date',
+  '/api/customers': null
+};
+
+// Reads that are never cached: downloads, photos (cached by the browser
+// with their own ETags) and live data
+const UNCACHED_API = [/^\/api\/exports\//, /\/photos\//, /^\/api\/cache\//, /^\/api\/internet-access\/active/];
+
+let refreshing = null;
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then(cache => cache.addAll(STATIC_ASSETS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  const current = [STATIC_CACHE, API_CACHE];
+  event.waitUntil(
+    caches.keys()
+      .then(cacheNames => Promise.all(
+        cacheNames.filter(cacheName => !current.includes(cacheName)).map(cacheName => caches.delete(cacheName))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+  if (!url.pathname.startsWith('/api/')) {
+    if (event.request.method === 'GET') {
+      event.respondWith(cacheFirst(event.request));
+    }
+    return;
+  }
+  if (event.request.method !== 'GET') {
+    event.respondWith(networkOnly(event));
+  } else if (!UNCACHED_API.some(pattern => pattern.test(url.pathname))) {
+    event.respondWith(staleWhileRevalidate(event, url));
+  }
+});
+
+// The page posts 'sync' when the connection comes back
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'sync') {
+    event.waitUntil(refreshApiCache());
+  }
+});
+
+async function cacheFirst(request) {
+  const cached = await caches.match(request, { cacheName: STATIC_CACHE });
+  if (cached) {
+    return cached;
+  }
+  const response = await fetch(request);
+  if (response.ok && response.type === 'basic') {
+    const cache = await caches.open(STATIC_CACHE);
+    await cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function networkOnly(event) {
+  const response = await fetch(event.request);
+  if (response.ok) {
+    refreshing = refreshApiCache().finally(() => {
+      refreshing = null;
+    });
+    event.waitUntil(refreshing);
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event, url) {
+  if (refreshing) {
+    await refreshing.catch(() => {});
+  }
+  const cache = await caches.open(API_CACHE);
+  const cached = await cache.match(event.request);
+  const update = revalidate(cache, event.request, url, cached);
+  if (cached) {
+    event.waitUntil(update.catch(error => console.log(`Revalidating ${url.pathname} failed:`, error)));
+    await touch(cache, event.request, cached);
+    return cached.clone();
+  }
+  try {
+    return await update;
+  } catch (error) {
+    return new Response(JSON.stringify({ error: 'You are offline and this data has not been loaded before' }), {
+      status: 503,
+      headers: { 'Content-Type': 'application/json' }
+    });
+  }
+}
+
+// Cache.keys() lists entries in insertion order, so re-inserting an entry
+// on every hit keeps the oldest key the least recently used one
+async function touch(cache, request, response) {
+  await cache.put(request, response.clone());
+}
+
+async function store(cache, request, response) {
+  await cache.put(request, response.clone());
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(keys.length - MAX_API_ENTRIES, 0)).map(key => cache.delete(key)));
+}
+
+async function revalidate(cache, request, url, cached) {
+  if (url.search === '' && url.pathname in FEED_LISTS && cached && cached.headers.get('X-Sync-Token')) {
+    const merged = await applyChanges(url.pathname, cached);
+    if (merged) {
+      await store(cache, request, merged);
+      return merged;
+    }
+  }
+  const response = await fetch(request);
+  if (response.ok) {
+    await store(cache, request, response);
+  }
+  return response;
+}
+
+// Fetch the rows changed since the cached copy and merge them into it.
+// Returns null when a full download is cheaper.
+async function applyChanges(path, cached) {
+  let body = await cached.clone().json();
+  let token = cached.headers.get('X-Sync-Token');
+  for (let page = 0; page < MAX_FEED_PAGES; page++) {
+    const response = await fetch(`${path}?since=${encodeURIComponent(token)}`);
+    if (!response.ok) {
+      return null;
+    }
+    const feed = await response.json();
+    body = mergeItems(FEED_LISTS[path], body, feed.items);
+    token = feed.sync_token;
+    if (!feed.has_more) {
+      const items = Array.isArray(body) ? body : body.items;
+      if (items.length > MAX_MERGED_ITEMS) {
+        return null;
+      }
+      return new Response(JSON.stringify(body), {
+        headers: { 'Content-Type': 'application/json', 'X-Sync-Token': token }
+      });
+    }
+  }
+  return null;
+}
+
+function mergeItems(timestampField, body, changed) {
+  if (timestampField === null) {
+    const byId = new Map(body.map(item => [item.id, item]));
+    changed.forEach(item => byId.set(item.id, item));
+    return Array.from(byId.values()).sort((a, b) => a.id - b.id);
+  }
+
+  // A cached first page keeps its next_cursor, so it only takes rows that
+  // sort before its last one; older rows belong to the following pages
+  const items = body.items;
+  const last = items[items.length - 1];
+  const newer = item => !body.next_cursor || !last || item[timestampField] > last[timestampField] ||
+    (item[timestampField] === last[timestampField] && item.id >= last.id);
+  const byId = new Map(items.map(item => [item.id, item]));
+  changed.filter(newer).forEach(item => byId.set(item.id, item));
+  const merged = Array.from(byId.values()).sort((a, b) =>
+    a[timestampField] === b[timestampField] ? b.id - a.id : (a[timestampField] < b[timestampField] ? 1 : -1)
+  );
+  return Object.assign({}, body, { items: merged });
+}
+
+// Bring every cached read up to date: lists through their change feed,
+// everything else is dropped and loaded again on its next use
+async function refreshApiCache() {
+  const cache = await caches.open(API_CACHE);
+  const keys = await cache.keys();
+  await Promise.all(keys.map(async request => {
+    const url = new URL(request.url);
+    if (url.search !== '' || !(url.pathname in FEED_LISTS)) {
+      await cache.delete(request);
+      return;
+    }
+    try {
+      await revalidate(cache, request, url, await cache.match(request));
+    } catch (error) {
+      await cache.delete(request);
+    }
+  }));
+}
@@ -0,0 +1,51 @@
+from app.http_cache import current_versions
+from sqlalchemy import and_, or_
+
+# Change feed for the list endpoints. Every write stamps the rows it
+# changes with the version it got from http_cache.invalidate(), and those
+# versions are handed out in commit order, so "everything stamped after
+# version v" never misses a row that committed late. Clients keep the
+# token from the X-Sync-Token header (or the last feed response) and ask
+# for ?since=<token> after reconnecting instead of downloading the lists
+# again.
+#
+# Tokens are "<version>" (everything up to that version has been seen) or
+# "<version>.<id>" in the middle of a version that did not fit in one
+# response. An empty token starts from the beginning.
+
+
+def parse_token(token):
+    if not token:
+        # Rows written before the feed existed carry version 0
+        return -1, None
+    try:
+        version, _, row_id = token.partition('.')
+        return int(version), int(row_id) if row_id else None
+    except ValueError:
+        raise ValueError(f"Invalid since token: {token}")
+
+
+def current_token(scope):
+    """Token for a list read now: the scope's version before the list query."""
+    return str(current_versions((scope,))[0])
+
+
+def changes(query, model, token, limit):
+    """Return (rows changed after token, next token, whether more are waiting)."""
+    version, row_id = parse_token(token)
+    if row_id is None:
+        after = model.sync_version > version
+    else:
+        after = or_(model.sync_version > version, and_(model.sync_version == version, model.id > row_id))
+    rows = query.filter(after).order_by(model.sync_version, model.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return rows, token or '0', False
+    last = rows[-1]
+    # A version belongs to one committed transaction, so once its last row
+    # is sent the whole version has been
+    next_token = f"{last.sync_version}.{last.id}" if has_more else str(last.sync_version)
+    return rows, next_token, has_more
+
@@ -0,0 +1,116 @@
+from app import db
+from app.models import BatteryRental, BatteryType, WaterSale, InternetAccess, HealthAccess
+from sqlalchemy import DateTime, Float, String, and_, cast, func, literal, null, or_, select, union_all
+from datetime import datetime
+import base64
+import json
+
+# Entry type -> (model, timestamp column). The type names match the
+# usage rollup services.
+SOURCES = {
+    'rental': (BatteryRental, BatteryRental.rented_at),
+    'water_sale': (WaterSale, WaterSale.sold_at),
+    'internet_access': (InternetAccess, InternetAccess.purchased_at),
+    'health_record': (HealthAccess, HealthAccess.visit_date),
+}
+
+
+def _entry_columns(entry_type):
+    """Columns shared by every branch: amount paid, a short detail and an end time."""
+    if entry_type == 'rental':
+        return (
+            func.coalesce(BatteryRental.rental_price, 0) + func.coalesce(BatteryRental.delivery_fee, 0),
+            BatteryType.name,
+            BatteryRental.returned_at,
+        )
+    if entry_type == 'water_sale':
+        return WaterSale.price, cast(WaterSale.size, String), cast(null(), DateTime)
+    if entry_type == 'internet_access':
+        return InternetAccess.price, InternetAccess.duration_type, InternetAccess.expires_at
+    return cast(null(), Float), HealthAccess.symptoms, cast(null(), DateTime)
+
+
+def _encode_cursor(entry):
+    payload = json.dumps({'ts': entry['at'].isoformat(), 'type': entry['type'], 'id': entry['id']})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['type'] not in SOURCES:
+            raise ValueError
+        return datetime.fromisoformat(payload['ts']), payload['type'], int(payload['id'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _after(entry_type, timestamp, model, cursor):
+    # Entries are ordered by (at, type, id) descending; within one branch
+    # the type is constant, so the keyset reduces to the branch's own index
+    cursor_ts, cursor_type, cursor_id = cursor
+    if entry_type < cursor_type:
+        return timestamp <= cursor_ts
+    if entry_type > cursor_type:
+        return timestamp < cursor_ts
+    return or_(timestamp < cursor_ts, and_(timestamp == cursor_ts, model.id < cursor_id))
+
+
+def _branch(entry_type, customer_id, page):
+    model, timestamp = SOURCES[entry_type]
+    amount, detail, until = _entry_columns(entry_type)
+    statement = select(
+        literal(entry_type).label('type'), model.id.label('id'), timestamp.label('at'),
+        amount.label('amount'), detail.label('detail'), until.label('until'),
+    ).where(model.customer_id == customer_id)
+    if entry_type == 'rental':
+        statement = statement.join(BatteryType, BatteryType.id == BatteryRental.battery_type_id)
+    if page['start'] is not None:
+        statement = statement.where(timestamp >= page['start'])
+    if page['end'] is not None:
+        statement = statement.where(timestamp <= page['end'])
+    if page['cursor'] is not None:
+        statement = statement.where(_after(entry_type, timestamp, model, page['cursor']))
+    # Each branch reads at most one page from its (customer_id, timestamp, id) index
+    branch = statement.order_by(timestamp.desc(), model.id.desc()).limit(page['limit'] + 1)
+    return select(branch.subquery())
+
+
+def customer_timeline(customer_id, page):
+    """Return one page of a customer's transactions, newest first, and the next cursor.
+
+    All four transaction tables are read in a single UNION ALL statement.
+    page has the limit, start and end of parse_page_args() and a cursor
+    from decode_cursor().
+    """
+    entries = union_all(*(_branch(entry_type, customer_id, page) for entry_type in SOURCES)).subquery()
+    rows = db.session.execute(
+        select(entries)
+        .order_by(entries.c.at.desc(), entries.c.type.desc(), entries.c.id.desc())
+        .limit(page['limit'] + 1)
+    ).mappings().all()
+
+    next_cursor = None
+    if len(rows) > page['limit']:
+        rows = rows[:page['limit']]
+        next_cursor = _encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def customer_totals(customer_id):
+    """Lifetime transaction counts and spend per type, in one statement."""
+    columns = []
+    for entry_type, (model, _) in SOURCES.items():
+        owned = model.customer_id == customer_id
+        amount = _entry_columns(entry_type)[0]
+        columns.append(select(func.count()).select_from(model).where(owned)
+                       .scalar_subquery().label(f'{entry_type}_count'))
+        columns.append(select(func.coalesce(func.sum(amount), 0)).select_from(model).where(owned)
+                       .scalar_subquery().label(f'{entry_type}_spent'))
+    row = db.session.execute(select(*columns)).mappings().one()
+
+    totals = {entry_type: {'count': row[f'{entry_type}_count'], 'spent': float(row[f'{entry_type}_spent'])}
+              for entry_type in SOURCES}
+    totals['spent'] = sum(total['spent'] for total in totals.values())
+    return totals
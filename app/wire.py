@@ -0,0 +1,231 @@
+from flask import current_app, request, Response
+from flask.json.provider import DefaultJSONProvider
+from datetime import date
+from itertools import repeat
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    have_msgpack = True
+except ImportError:
+    msgpack = None
+    have_msgpack = False
+
+try:
+    import orjson
+    have_orjson = True
+except ImportError:
+    orjson = None
+    have_orjson = False
+
+try:
+    import brotli
+    have_brotli = True
+except ImportError:
+    brotli = None
+    have_brotli = False
+
+# Response encodings a client can ask for with its Accept header. MessagePack
+# is only offered when the msgpack package is installed.
+MIMETYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+}
+
+LAYOUTS = ('rows', 'columns')
+
+# Response bodies worth compressing; static files are sent as files and
+# left to the front-end server
+COMPRESSIBLE_MIMETYPES = set(MIMETYPES.values())
+
+
+def _isoformat(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, writing dates and datetimes as ISO 8601.
+
+    Handlers can hand timestamps over as they come from the database
+    instead of formatting every one of them first. Keys are not sorted.
+    """
+
+    sort_keys = False
+    default = staticmethod(_isoformat)
+
+    def encode(self, obj):
+        """Compact UTF-8 JSON bytes of obj."""
+        return self.dumps(obj, separators=(',', ':')).encode()
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """JSON provider backed by orjson, which writes datetimes the same way.
+
+    Calls that pass json.dumps() arguments (indent, ...) still go through
+    the standard library.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def encode(self, obj):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+    def response(self, *args, **kwargs):
+        if self._app.debug or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj), mimetype=self.mimetype)
+
+
+def json_provider(app):
+    """The JSON provider selected by JSON_ENCODER: 'orjson' (when installed) or 'stdlib'."""
+    encoder = app.config.setdefault('JSON_ENCODER', 'orjson')
+    if encoder not in ('orjson', 'stdlib'):
+        raise ValueError(f"Unknown JSON_ENCODER: {encoder}")
+    if encoder == 'orjson' and not have_orjson:
+        logger.info("orjson not installed, encoding JSON with the standard library")
+        encoder = 'stdlib'
+    return (OrjsonProvider if encoder == 'orjson' else StdlibJSONProvider)(app)
+
+
+def response_format():
+    """The encoding the current request prefers: 'msgpack' or 'json'."""
+    if have_msgpack:
+        best = request.accept_mimetypes.best_match((MIMETYPES['json'], MIMETYPES['msgpack']))
+        if best == MIMETYPES['msgpack']:
+            return 'msgpack'
+    return 'json'
+
+
+def encode(body, fmt):
+    """Serialize a response body to bytes in the given format."""
+    if fmt == 'msgpack':
+        return msgpack.packb(body, default=_isoformat)
+    return current_app.json.encode(body)
+
+
+def render(body):
+    """Encode a response body as JSON or, when negotiated, MessagePack."""
+    fmt = response_format()
+    response = Response(encode(body, fmt), mimetype=MIMETYPES[fmt])
+    response.vary.add('Accept')
+    return response
+
+
+def to_columns(items, fields=None):
+    """Turn rows into one list per field.
+
+    Rows are dicts, in the first row's field order, or tuples such as
+    SQLAlchemy Rows with their field names given; trailing values beyond
+    the named fields are dropped.
+    """
+    if fields is not None:
+        if not items:
+            return {field: [] for field in fields}
+        return dict(zip(fields, map(list, zip(*items))))
+    if not items:
+        return {}
+    return {field: [item[field] for item in items] for field in items[0]}
+
+
+def to_rows(items, fields):
+    """Turn result tuples (SQLAlchemy Rows) into one dict per row, keyed by fields.
+
+    This is still a dict per row: the rows layout is a list of JSON
+    objects, and orjson writes objects natively only from dicts and
+    dataclasses. A dict is the cheaper of the two, and Row._asdict() is
+    slower still. Only the columns layout (to_columns) serializes the
+    tuples without a per-row object.
+    """
+    return list(map(dict, map(zip, repeat(fields), items)))
+
+
+def list_response(body, fields=None):
+    """Render the body of a list endpoint: a list of rows, or a dict with one under 'items'.
+
+    With fields, the rows are result tuples (SQLAlchemy Rows) loaded
+    without building an entity per row. The default rows layout still
+    turns each one into a dict (to_rows) to write it as a JSON object.
+    With ?layout=columns the tuples are transposed into
+    {'columns': {field: [values]}, 'count': n} instead, with no per-row
+    object and field names not repeated for every row. Other keys of the
+    body (next_cursor, sync_token, ...) are kept.
+    """
+    layout = request.args.get('layout', 'rows')
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    items = body if isinstance(body, list) else body['items']
+    if layout == 'columns':
+        rest = {} if isinstance(body, list) else {key: value for key, value in body.items() if key != 'items'}
+        return render(dict(rest, columns=to_columns(items, fields), count=len(items)))
+    if fields is not None:
+        items = to_rows(items, fields)
+    return render(items if isinstance(body, list) else dict(body, items=items))
+
+
+class ResponseCompressor:
+    """Compress API responses with brotli or gzip, as the client accepts.
+
+    Brotli is used when the brotli package is installed and the client
+    lists it. Streamed responses (exports compress themselves) and bodies
+    under COMPRESS_MIN_BYTES are sent as they are. Compressed responses get
+    a weak ETag, since their bytes differ from the uncompressed ones.
+    """
+
+    def __init__(self, app=None):
+        self.encodings = ()
+        self.min_bytes = 0
+        self.gzip_level = 6
+        self.brotli_quality = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        enabled = [encoding.strip() for encoding in app.config.setdefault('RESPONSE_COMPRESSION', 'br,gzip').split(',')]
+        if 'br' in enabled and not have_brotli:
+            logger.info("brotli not installed, compressing responses with gzip only")
+        self.encodings = tuple(encoding for encoding in ('br', 'gzip')
+                               if encoding in enabled and (encoding != 'br' or have_brotli))
+        self.min_bytes = app.config.setdefault('COMPRESS_MIN_BYTES', 1024)
+        self.gzip_level = app.config.setdefault('GZIP_LEVEL', 6)
+        self.brotli_quality = app.config.setdefault('BROTLI_QUALITY', 5)
+        app.extensions['response_compressor'] = self
+        if self.encodings:
+            app.after_request(self.compress)
+
+    def compress(self, response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        data = response.get_data()
+        if encoding is None or len(data) < self.min_bytes:
+            return response
+
+        if encoding == 'br':
+            data = brotli.compress(data, quality=self.brotli_quality)
+        else:
+            data = gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+response_compressor = ResponseCompressor()
@@ -0,0 +1,42 @@
+# Gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every setting can be overridden from the environment. Requests mostly wait
+# on the database, so each worker process runs WEB_THREADS threads; the
+# database pool in create_app() is sized from the same variable.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = 'gthread'
+workers = int(os.environ.get("WEB_WORKERS", min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get("WEB_THREADS", 4))
+
+# Photo uploads are decoded in the image pool and may take a while
+timeout = int(os.environ.get("WEB_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Restart workers now and then so slow leaks cannot grow without bound
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+# Build the app once in the master so migrations run exactly once per
+# deploy, then give each worker fresh database connections (post_fork).
+# The sweeper and WiFi password pool threads start lazily per process.
+preload_app = True
+
+accesslog = os.environ.get("WEB_ACCESS_LOG", "-")
+errorlog = '-'
+loglevel = os.environ.get("WEB_LOG_LEVEL", "info")
+
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def post_fork(server, worker):
+    from app import db
+    from wsgi import app
+
+    # Connections opened by the master must not be shared across processes
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -2,8 +2,6 @@
 from app import create_app
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = create_app()
@@ -0,0 +1,142 @@
+"""Check that a database from the first release upgrades to the current schema.
+
+Creates a SQLite database with the schema and a few rows as the first
+release left them, starts the application on it (which applies every
+migration), and compares each table's columns and indexes with a database
+created fresh from the current models. Exits non-zero on any difference:
+
+    python scripts/check_upgrade.py
+
+Run it after adding a migration; a migration that reads the current models
+instead of naming what it adds fails here.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Schema of the first release, as its create_all() wrote it on SQLite
+BASELINE_SCHEMA = """
+CREATE TABLE customer (
+    id INTEGER NOT NULL, first_name VARCHAR(50) NOT NULL, middle_name VARCHAR(50),
+    last_name VARCHAR(50) NOT NULL, second_last_name VARCHAR(50), phone VARCHAR(20) NOT NULL,
+    email VARCHAR(120), address_line1 VARCHAR(200) NOT NULL, address_line2 VARCHAR(200),
+    city VARCHAR(100) NOT NULL, country VARCHAR(100) NOT NULL, state_province VARCHAR(100),
+    postal_code VARCHAR(20), pin VARCHAR(6) NOT NULL, date_of_birth VARCHAR(10) NOT NULL,
+    birth_city VARCHAR(100) NOT NULL, id_type VARCHAR(50), id_number VARCHAR(50),
+    selfie_photo BLOB, id_photo BLOB, bill_photo BLOB,
+    created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id), UNIQUE (phone), UNIQUE (email)
+);
+CREATE TABLE battery_type (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, type VARCHAR(50) NOT NULL,
+    capacity VARCHAR(50), rental_price FLOAT NOT NULL, delivery_fee FLOAT NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE battery (
+    id INTEGER NOT NULL, battery_type_id INTEGER NOT NULL, unit_number INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(battery_type_id) REFERENCES battery_type (id)
+);
+CREATE TABLE water_sale (
+    id INTEGER NOT NULL, customer_id INTEGER NOT NULL, size FLOAT NOT NULL, price FLOAT NOT NULL,
+    sold_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customer (id)
+);
+CREATE TABLE internet_access (
+    id INTEGER NOT NULL, customer_id INTEGER NOT NULL, purchased_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL, wifi_password VARCHAR(20) NOT NULL,
+    duration_type VARCHAR(20) NOT NULL, price FLOAT NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customer (id)
+);
+CREATE TABLE health_access (
+    id INTEGER NOT NULL, customer_id INTEGER NOT NULL, visit_date DATETIME NOT NULL,
+    symptoms TEXT NOT NULL, treatments TEXT NOT NULL, notes TEXT, created_at DATETIME NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customer (id)
+);
+CREATE TABLE battery_rental (
+    id INTEGER NOT NULL, customer_id INTEGER NOT NULL, battery_id INTEGER,
+    battery_type_id INTEGER NOT NULL, rental_price FLOAT NOT NULL, delivery_fee FLOAT NOT NULL,
+    rented_at DATETIME NOT NULL, returned_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customer (id),
+    FOREIGN KEY(battery_id) REFERENCES battery (id), FOREIGN KEY(battery_type_id) REFERENCES battery_type (id)
+);
+INSERT INTO customer VALUES (1, 'Ana', NULL, 'Garcia', NULL, '+15550001', NULL, '1 Main Street', NULL,
+    'Waypoint', 'Nowhere', NULL, NULL, '1234', '01/01/1990', 'Waypoint', NULL, NULL, NULL, NULL, NULL,
+    '2024-01-01 00:00:00', '2024-01-01 00:00:00');
+INSERT INTO battery_type VALUES (1, '250 Wh Anker Battery', 'battery', '250 Wh', 0.56, 0.84);
+INSERT INTO battery VALUES (1, 1, 1, 'rented'), (2, 1, 2, 'available');
+INSERT INTO battery_rental VALUES (1, 1, 1, 1, 0.56, 0.84, '2024-01-02 10:00:00', NULL);
+INSERT INTO water_sale VALUES (1, 1, 20, 1.5, '2024-01-02 11:00:00');
+INSERT INTO internet_access VALUES (1, 1, '2024-01-02 12:00:00', '2024-01-02 13:00:00', 'abcdefghijkl', 'hour', 1.0);
+INSERT INTO health_access VALUES (1, 1, '2024-01-02 14:00:00', 'cough', 'rest', NULL, '2024-01-02 14:00:00');
+"""
+
+# Started in a child process per database, so each gets a fresh engine
+START_APP = """
+from app import create_app
+create_app()
+"""
+
+
+def start_app(path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", LOG_LEVEL='WARNING',
+               INTERNET_SWEEP_INTERVAL='0', WIFI_PASSWORD_POOL_SIZE='0',
+               PHOTO_STORAGE_PATH=os.path.join(os.path.dirname(path), 'photos'))
+    result = subprocess.run([sys.executable, '-c', START_APP], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Starting the application on {os.path.basename(path)} failed:\n{result.stderr}")
+
+
+def schema(path):
+    connection = sqlite3.connect(path)
+    tables = [name for (name,) in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '%_fts%'"
+    )]
+    result = {}
+    for table in tables:
+        columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        indexes = {row[1] for row in connection.execute(f"PRAGMA index_list({table})")
+                   if not row[1].startswith('sqlite_autoindex')}
+        result[table] = (columns, indexes)
+    connection.close()
+    return result
+
+
+def main():
+    scratch = tempfile.mkdtemp()
+    upgraded = os.path.join(scratch, 'upgraded.db')
+    fresh = os.path.join(scratch, 'fresh.db')
+
+    connection = sqlite3.connect(upgraded)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.close()
+    start_app(upgraded)
+    start_app(fresh)
+
+    expected, actual = schema(fresh), schema(upgraded)
+    problems = []
+    for table, (columns, indexes) in sorted(expected.items()):
+        if table not in actual:
+            problems.append(f"{table}: table missing")
+            continue
+        upgraded_columns, upgraded_indexes = actual[table]
+        for column in sorted(columns - upgraded_columns):
+            problems.append(f"{table}: column {column} missing")
+        for index in sorted(indexes - upgraded_indexes):
+            problems.append(f"{table}: index {index} missing")
+        for index in sorted(upgraded_indexes - indexes):
+            problems.append(f"{table}: unexpected index {index}")
+
+    if problems:
+        print("Upgraded schema differs from a fresh one:")
+        print('\n'.join(f"  {problem}" for problem in problems))
+        sys.exit(1)
+    print(f"Upgrade from the first release matches a fresh database ({len(expected)} tables)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Measure how many bytes the database returns for the customer endpoints.
+
+Fills a scratch SQLite database with --rows customers, requests the
+customer list, detail, details and search endpoints (response cache off),
+captures the SELECTs each one sends and runs them again on the raw
+connection to add up the size of every value returned. For comparison it
+does the same for loading whole Customer entities, which is what the
+endpoints used to do:
+
+    python scripts/customerbench.py --rows 200
+
+Sizes count text and binary values by their encoded length and numbers as
+8 bytes, so they compare what is read rather than match a wire protocol.
+"""
+from datetime import datetime
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, datetime):
+        return len(value.isoformat())
+    return 8
+
+
+def returned_bytes(connection, statements):
+    """Run captured statements again and add up the rows they return."""
+    total = 0
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith('SELECT'):
+            continue
+        for row in connection.exec_driver_sql(statement, parameters):
+            total += sum(_value_bytes(value) for value in row)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'customerbench.db')}"
+    os.environ['HTTP_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from types import SimpleNamespace
+    from sqlalchemy import event, insert, select
+    from sqlalchemy.orm import undefer
+    from app import create_app, db, search
+    from app.models import Customer
+
+    app = create_app()
+    client = app.test_client()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        customers = []
+        for i in range(args.rows):
+            customer = {
+                'first_name': f'First{i}', 'middle_name': 'Maria', 'last_name': f'Last{i}',
+                'second_last_name': 'Lopez', 'phone': f'+1555{i:07d}', 'email': f'customer{i}@example.com',
+                'address_line1': f'{i} Main Street', 'address_line2': 'Near the water tower',
+                'city': 'Waypoint', 'country': 'Nowhere', 'state_province': 'North', 'postal_code': '12345',
+                'pin': '123456', 'date_of_birth': '01/01/1990', 'birth_city': 'Waypoint',
+                'id_type': 'national_id', 'id_number': f'AB-{i:07d}',
+            }
+            customer['search_text'] = search.search_text_for(SimpleNamespace(**customer))
+            customers.append(customer)
+        db.session.execute(insert(Customer), customers)
+        db.session.commit()
+        engine = db.engine
+
+        # Whole entities, search_text included, as the endpoints once loaded them
+        baselines = {}
+        for name, statement in (
+            ('list', select(Customer).options(undefer(Customer.search_text))),
+            ('one', select(Customer).options(undefer(Customer.search_text)).where(Customer.id == 1)),
+        ):
+            statements.clear()
+            event.listen(engine, 'before_cursor_execute', record)
+            try:
+                db.session.execute(statement).all()
+            finally:
+                event.remove(engine, 'before_cursor_execute', record)
+            baselines[name] = returned_bytes(db.session.connection(), list(statements))
+        db.session.rollback()
+
+    cases = (
+        ('/api/customers', 'list'),
+        ('/api/customers/1', 'one'),
+        ('/api/customers/1/details', 'one'),
+        ('/api/customers/search?q=last1', None),
+    )
+    print(f"{args.rows} customers")
+    print(f"{'path':32} {'statements':>10} {'bytes':>9} {'entities':>9}")
+    for path, baseline in cases:
+        statements.clear()
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(path)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        if response.status_code != 200:
+            sys.exit(f"GET {path} failed with {response.status_code}: {response.get_data(as_text=True)}")
+        with app.app_context():
+            returned = returned_bytes(db.session.connection(), list(statements))
+        entities = f"{baselines[baseline]:>9}" if baseline else f"{'-':>9}"
+        print(f"{path:32} {len(statements):>10} {returned:>9} {entities}")
+
+
+if __name__ == '__main__':
+    main()
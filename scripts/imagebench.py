@@ -0,0 +1,121 @@
+"""Measure peak memory and time of the photo processing paths.
+
+Writes a synthetic --width x --height JPEG (a 12 MP phone photo by
+default) and runs each case in a fresh Python process, so peak resident
+memory (ru_maxrss) belongs to that case alone:
+
+  decode-full     read the upload, decode at full size and re-encode
+                  (how uploads were handled before normalize_image)
+  upload-bytes    normalize_image on the upload held in memory
+  upload-spooled  normalize_image on a spooled file path, the path
+                  ingest_photo takes above IMAGE_SPOOL_THRESHOLD
+  variant-thumb   render_variant for the 'thumb' size
+  variant-avatar  render_variant for the 'avatar' size
+
+and prints how far peak RSS rose above the size of the process before
+the case ran, the time and the output size:
+
+    python scripts/imagebench.py
+    python scripts/imagebench.py --width 8000 --height 6000
+
+Pillow must be installed.
+"""
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CASES = ('decode-full', 'upload-bytes', 'upload-spooled', 'variant-thumb', 'variant-avatar')
+
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _current_rss():
+    # Imports may have peaked above where the process settled; measure
+    # from the current size where /proc tells it
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return _peak_rss()
+
+
+def write_image(path, width, height):
+    from PIL import Image
+    # Noise compresses like a photo does, a flat image would not
+    img = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    img.save(path, 'JPEG', quality=90)
+
+
+def run_case(case, path, max_dimension, quality):
+    from PIL import Image
+    from app.images import normalize_image, render_variant, VARIANT_SIZES
+
+    baseline = _current_rss()
+    started = time.perf_counter()
+    if case == 'decode-full':
+        with open(path, 'rb') as f:
+            data = f.read()
+        output = io.BytesIO()
+        Image.open(io.BytesIO(data)).convert('RGB').save(output, 'JPEG', quality=quality)
+        result = output.getvalue()
+    elif case == 'upload-bytes':
+        with open(path, 'rb') as f:
+            result = normalize_image(f.read(), max_dimension, quality)
+    elif case == 'upload-spooled':
+        result = normalize_image(path, max_dimension, quality)
+    else:
+        result = render_variant(path, VARIANT_SIZES[case.split('-', 1)[1]], quality)
+    elapsed = time.perf_counter() - started
+    print(f"{(_peak_rss() - baseline) / 2 ** 20:.1f} {elapsed * 1000:.1f} {len(result)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--max-dimension', type=int, default=2048, help='IMAGE_MAX_DIMENSION')
+    parser.add_argument('--quality', type=int, default=85, help='IMAGE_JPEG_QUALITY')
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument('--image', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # Child process: measure one case
+        run_case(args.case, args.image, args.max_dimension, args.quality)
+        return
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("Pillow is not installed")
+
+    path = os.path.join(tempfile.mkdtemp(), 'upload.jpg')
+    write_image(path, args.width, args.height)
+    print(f"{args.width}x{args.height} JPEG of {os.path.getsize(path) / 2 ** 20:.1f} MB, "
+          f"IMAGE_MAX_DIMENSION {args.max_dimension}")
+    print(f"{'case':16} {'peak RSS MB':>12} {'ms':>8} {'output bytes':>13}")
+    for case in CASES:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--case', case, '--image', path,
+             '--max-dimension', str(args.max_dimension), '--quality', str(args.quality)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            sys.exit(f"{case} failed:\n{result.stderr}")
+        peak, elapsed, size = result.stdout.split()[-3:]
+        print(f"{case:16} {float(peak):>12.1f} {float(elapsed):>8.1f} {int(size):>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Compare JSON serialization paths for the rental and customer lists.
+
+Fills a scratch SQLite database with --rows customers and rentals, then
+times one --limit row page of GET /api/rentals and the full GET
+/api/customers body three ways:
+
+  entities  ORM entities turned into dicts with isoformat(), encoded by
+            Flask's default provider (how the lists used to be built)
+  stdlib    Row tuples from the loading projections, a dict per row
+            (wire.to_rows), StdlibJSONProvider
+  orjson    the same Row tuples and dicts, OrjsonProvider
+
+and prints the time per body split into query and encode, and rows per
+second overall:
+
+    python scripts/jsonbench.py --rows 20000
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=500, help='rentals per page, PAGE_SIZE_MAX by default')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the fastest is kept')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'jsonbench.db')}"
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy import insert, select
+    from sqlalchemy.orm import joinedload
+    from app import create_app, db, loading, wire
+    from app.models import Battery, BatteryRental, BatteryType, Customer
+
+    app = create_app()
+    with app.app_context():
+        battery_type = db.session.scalars(select(BatteryType).where(BatteryType.type == 'battery')).first()
+        batteries = db.session.scalars(select(Battery.id).where(Battery.battery_type_id == battery_type.id)).all()
+        db.session.execute(insert(Customer), [{
+            'first_name': f'First{i}', 'last_name': f'Last{i}', 'phone': f'+1555{i:07d}',
+            'address_line1': f'{i} Main Street', 'city': 'Waypoint', 'country': 'Nowhere', 'pin': '1234',
+            'date_of_birth': '01/01/1990', 'birth_city': 'Waypoint',
+        } for i in range(args.rows)])
+        start = datetime(2024, 1, 1)
+        db.session.execute(insert(BatteryRental), [{
+            'customer_id': i % args.rows + 1, 'battery_type_id': battery_type.id,
+            'battery_id': batteries[i % len(batteries)] if i % 3 else None,
+            'rental_price': 0.56, 'delivery_fee': 0.84, 'rented_at': start + timedelta(minutes=10 * i),
+            'returned_at': start + timedelta(minutes=10 * i + 90) if i % 10 else None,
+        } for i in range(args.rows)])
+        db.session.commit()
+
+        flask_default = DefaultJSONProvider(app)
+        providers = {'stdlib': wire.StdlibJSONProvider(app)}
+        if wire.have_orjson:
+            providers['orjson'] = wire.OrjsonProvider(app)
+
+        def rental_entities():
+            return (BatteryRental.query.options(
+                joinedload(BatteryRental.customer).load_only(Customer.first_name, Customer.last_name),
+                joinedload(BatteryRental.battery).joinedload(Battery.battery_type),
+                joinedload(BatteryRental.battery_type),
+            ).order_by(BatteryRental.rented_at.desc(), BatteryRental.id.desc()).limit(args.limit).all())
+
+        def rental_dicts(rentals):
+            return {'items': [{
+                'id': rental.id,
+                'customer_name': f"{rental.customer.first_name} {rental.customer.last_name}",
+                'battery_name': f"{rental.battery.battery_type.name} (Unit #{rental.battery.unit_number})" if rental.battery else rental.battery_type.name,
+                'rental_price': rental.rental_price,
+                'delivery_fee': rental.delivery_fee,
+                'rented_at': rental.rented_at.isoformat(),
+                'returned_at': rental.returned_at.isoformat() if rental.returned_at else None
+            } for rental in rentals], 'next_cursor': None}
+
+        def rental_rows():
+            return loading.rental_list().order_by(BatteryRental.rented_at.desc(), BatteryRental.id.desc()).limit(args.limit).all()
+
+        def customer_mappings():
+            return db.session.execute(select(*loading.CUSTOMER_LIST_COLUMNS).order_by(Customer.id)).mappings().all()
+
+        def customer_rows():
+            return db.session.execute(select(*loading.CUSTOMER_LIST_COLUMNS).order_by(Customer.id)).all()
+
+        cases = [
+            ('rentals', 'entities', rental_entities,
+             lambda rentals: flask_default.dumps(rental_dicts(rentals), separators=(',', ':')).encode()),
+            ('customers', 'entities', customer_mappings,
+             lambda rows: flask_default.dumps([dict(row) for row in rows], separators=(',', ':')).encode()),
+        ]
+        for name, provider in providers.items():
+            cases.append(('rentals', name, rental_rows, lambda rows, provider=provider: provider.encode(
+                {'items': wire.to_rows(rows, loading.RENTAL_LIST_FIELDS), 'next_cursor': None})))
+            cases.append(('customers', name, customer_rows, lambda rows, provider=provider: provider.encode(
+                wire.to_rows(rows, loading.CUSTOMER_LIST_FIELDS))))
+
+        print(f"{args.rows} customers and rentals, rental page of {args.limit}; "
+              f"orjson {'on' if wire.have_orjson else 'not installed'}")
+        print(f"{'payload':10} {'path':9} {'rows':>6} {'query ms':>9} {'encode ms':>10} {'bytes':>9} {'rows/s':>10}")
+        for payload, path, query, encode in sorted(cases, key=lambda case: case[0], reverse=True):
+            rows, query_s = timed(query, args.repeat)
+            db.session.expunge_all()
+            body, encode_s = timed(lambda: encode(rows), args.repeat)
+            print(f"{payload:10} {path:9} {len(rows):>6} {query_s * 1000:>9.1f} {encode_s * 1000:>10.1f} "
+                  f"{len(body):>9} {len(rows) / (query_s + encode_s):>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Closed-loop HTTP load test for a running OffGrid Rental Manager server.
+
+Each of --concurrency client threads keeps one keep-alive connection and
+requests the given paths round-robin for --duration seconds, then the
+script prints requests per second and latency percentiles. Only the
+standard library is used, so it runs anywhere the server does:
+
+    python scripts/loadtest.py --url http://127.0.0.1:5000 --concurrency 16
+    python scripts/loadtest.py --path /api/rentals --path /api/dashboard/stats
+
+To compare server settings, restart gunicorn with different WEB_WORKERS,
+WEB_THREADS or DB_POOL_* values and run the same command against it.
+"""
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import threading
+import time
+
+DEFAULT_PATHS = (
+    '/api/battery-types',
+    '/api/rentals',
+    '/api/customers',
+    '/api/dashboard/stats',
+    '/api/internet-access/active',
+)
+
+
+def _client(url, paths, deadline, results, errors):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.hostname, parts.port, timeout=30)
+    latencies = []
+    failed = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    results.extend(latencies)
+    errors.append(failed)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(url, paths, concurrency, duration):
+    results, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_client, args=(url, paths, deadline, results, errors))
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results.sort()
+    if not results:
+        print(f"c={concurrency}: no successful requests ({sum(errors)} errors)")
+        return
+    print(
+        f"c={concurrency}: {len(results) / elapsed:.0f} req/s, "
+        f"p50 {_percentile(results, 0.5) * 1000:.1f} ms, "
+        f"p95 {_percentile(results, 0.95) * 1000:.1f} ms, "
+        f"p99 {_percentile(results, 0.99) * 1000:.1f} ms, "
+        f"{len(results)} ok, {sum(errors)} errors"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='path to request, may be repeated (default: a mix of list endpoints)')
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='client threads, may be repeated to run one round per value (default: 1, 8, 32)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per round')
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency or (1, 8, 32):
+        run(args.url, args.paths or DEFAULT_PATHS, concurrency, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Measure the per-request cost of logging at each level.
+
+Starts the application on an in-memory SQLite database with --format log
+lines sent to /dev/null (records are still filtered, redacted and
+formatted, only the write is skipped) and times --requests of each of
+these at every --level:
+
+  create customer   multipart form with PIN and ID number (redacted)
+  create rental     JSON payload logged at DEBUG
+  water sale        JSON payload logged at DEBUG
+  list rentals      a read without per-request logging
+
+The level is switched on the root logger between runs, and the levels
+take turns --repeat times, keeping the fastest run of each, so drift in
+the machine's speed does not end up in one level's numbers. It prints
+microseconds per request and the overhead over the first level given,
+WARNING by default:
+
+    python scripts/logbench.py
+    python scripts/logbench.py --level INFO --level DEBUG --format json
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CASES = ('create customer', 'create rental', 'water sale', 'list rentals')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--level', action='append', help='LOG_LEVEL, WARNING, INFO and DEBUG by default')
+    parser.add_argument('--format', choices=('text', 'json'), default='text', help='LOG_FORMAT')
+    parser.add_argument('--requests', type=int, default=100, help='requests per case and run')
+    parser.add_argument('--repeat', type=int, default=7, help='runs per case and level, the fastest is kept')
+    args = parser.parse_args()
+    levels = [level.upper() for level in args.level or ['WARNING', 'INFO', 'DEBUG']]
+
+    # In memory, so commit fsyncs do not drown the microseconds measured
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    os.environ['PHOTO_STORAGE_PATH'] = os.path.join(tempfile.mkdtemp(), 'photos')
+    os.environ['LOG_FORMAT'] = args.format
+    os.environ['LOG_LEVEL'] = levels[0]
+    os.environ['LOG_LEVELS'] = ''
+    os.environ['HTTP_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from sqlalchemy import select
+    from app import create_app, db
+    from app.models import BatteryType
+
+    app = create_app()
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(open(os.devnull, 'w'))
+    with app.app_context():
+        charging_type_id = db.session.scalars(select(BatteryType.id).where(BatteryType.type == 'charging')).first()
+
+    client = app.test_client()
+    counter = iter(range(10 ** 9))
+
+    def create_customer():
+        i = next(counter)
+        return client.post('/api/customers', data={
+            'first_name': 'Ana', 'last_name': 'Diaz', 'phone': f'+1555{i:07d}', 'address_line1': '1 Main Street',
+            'city': 'Waypoint', 'country': 'Nowhere', 'pin': '123456', 'date_of_birth': '01/01/1990',
+            'birth_city': 'Waypoint', 'id_type': 'passport', 'id_number': f'X{i:07d}',
+        })
+
+    customer_id = create_customer().get_json()['customer_id']
+    cases = {
+        'create customer': create_customer,
+        'create rental': lambda: client.post('/api/rentals', json={
+            'customer_id': customer_id, 'battery_type_id': charging_type_id, 'rental_price': 0.28}),
+        'water sale': lambda: client.post('/api/water-sales', json={
+            'customer_id': customer_id, 'size': 20, 'price': 1.5}),
+        'list rentals': lambda: client.get('/api/rentals'),
+    }
+
+    best = {}
+    for _ in range(args.repeat):
+        for level in levels:
+            root.setLevel(level)
+            for name in CASES:
+                started = time.perf_counter()
+                for _ in range(args.requests):
+                    response = cases[name]()
+                    if response.status_code >= 400:
+                        sys.exit(f"{name} failed with {response.status_code}: {response.get_data(as_text=True)}")
+                elapsed = (time.perf_counter() - started) / args.requests * 10 ** 6
+                best[level, name] = min(best.get((level, name), elapsed), elapsed)
+
+    print(f"{args.requests} requests per case, best of {args.repeat}, {args.format} log lines, "
+          f"microseconds per request (overhead over {levels[0]})")
+    print(f"{'level':8} " + ' '.join(f"{name:>22}" for name in CASES))
+    for level in levels:
+        print(f"{level:8} " + ' '.join(
+            f"{best[level, name]:>12.0f} ({best[level, name] - best[levels[0], name]:>+6.0f})" for name in CASES
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Check that list endpoints run a fixed number of SQL statements.
+
+Fills a scratch SQLite database to each of --sizes rows per table
+(customers, rentals, water sales, internet sessions and health records),
+requests every list endpoint at each size, and counts the statements it
+sends with a before_cursor_execute listener. A count that grows with the
+row count means a query per row (an N+1) crept back in; the script prints
+the counts and exits non-zero when any endpoint's count is not the same
+at every size:
+
+    python scripts/querycount.py --sizes 10 100 1000
+
+The response cache is turned off so every request reaches the database.
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Pages are requested at PAGE_SIZE_MAX, so a per-row query shows up as
+# clearly as it can
+PATHS = (
+    '/api/battery-types',
+    '/api/batteries',
+    '/api/customers',
+    '/api/rentals?limit=500',
+    '/api/water-sales?limit=500',
+    '/api/internet-access?limit=500',
+    '/api/internet-access/active',
+    '/api/health-access?limit=500',
+    '/api/dashboard/stats',
+)
+
+
+def fill(db, models, start, stop, battery_type_id, battery_ids):
+    """Add rows start..stop-1 to every table, one multi-row INSERT each."""
+    from sqlalchemy import insert
+    Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess = models
+    now = datetime.utcnow()
+    rows = range(start, stop)
+    db.session.execute(insert(Customer), [{
+        'first_name': f'First{i}', 'last_name': f'Last{i}', 'phone': f'+1555{i:07d}',
+        'address_line1': f'{i} Main Street', 'city': 'Waypoint', 'country': 'Nowhere', 'pin': '1234',
+        'date_of_birth': '01/01/1990', 'birth_city': 'Waypoint',
+    } for i in rows])
+    db.session.execute(insert(BatteryRental), [{
+        'customer_id': i + 1, 'battery_type_id': battery_type_id,
+        'battery_id': battery_ids[i % len(battery_ids)] if i % 2 else None,
+        'rental_price': 0.56, 'delivery_fee': 0.84, 'rented_at': now - timedelta(minutes=i),
+        'returned_at': now - timedelta(minutes=i - 30),
+    } for i in rows])
+    db.session.execute(insert(WaterSale), [{
+        'customer_id': i + 1, 'size': 20, 'price': 1.5, 'sold_at': now - timedelta(minutes=i),
+    } for i in rows])
+    db.session.execute(insert(InternetAccess), [{
+        'customer_id': i + 1, 'wifi_password': f'pw{i:010d}', 'duration_type': 'day', 'price': 1.0,
+        'purchased_at': now - timedelta(minutes=i), 'expires_at': now + timedelta(days=1, minutes=-i),
+    } for i in rows])
+    db.session.execute(insert(HealthAccess), [{
+        'customer_id': i + 1, 'symptoms': 'cough', 'treatments': 'rest', 'notes': '',
+        'visit_date': now - timedelta(minutes=i),
+    } for i in rows])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='rows per table, ascending')
+    parser.add_argument('--verbose', action='store_true', help='print the statements of the largest size')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'querycount.db')}"
+    os.environ['HTTP_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from sqlalchemy import event, select
+    from app import create_app, db
+    from app.models import Battery, BatteryType, BatteryRental, Customer, HealthAccess, InternetAccess, WaterSale
+
+    app = create_app()
+    client = app.test_client()
+    counts = {path: [] for path in PATHS}
+    statements = []
+    with app.app_context():
+        battery_type = db.session.scalars(select(BatteryType).where(BatteryType.type == 'battery')).first()
+        battery_ids = db.session.scalars(select(Battery.id).where(Battery.battery_type_id == battery_type.id)).all()
+        battery_type_id = battery_type.id
+        engine = db.engine
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    filled = 0
+    for size in sorted(args.sizes):
+        with app.app_context():
+            fill(db, (Customer, BatteryRental, WaterSale, InternetAccess, HealthAccess),
+                 filled, size, battery_type_id, battery_ids)
+        filled = size
+        for path in PATHS:
+            statements.clear()
+            event.listen(engine, 'before_cursor_execute', count)
+            try:
+                response = client.get(path)
+            finally:
+                event.remove(engine, 'before_cursor_execute', count)
+            if response.status_code != 200:
+                sys.exit(f"GET {path} failed with {response.status_code}: {response.get_data(as_text=True)}")
+            counts[path].append(len(statements))
+            if args.verbose and size == max(args.sizes):
+                print(f"GET {path}")
+                print('\n'.join(f"  {' '.join(statement.split())[:160]}" for statement in statements))
+
+    print(f"{'path':34} " + ' '.join(f"{size:>7}" for size in sorted(args.sizes)))
+    growing = []
+    for path, per_size in counts.items():
+        flag = '' if len(set(per_size)) == 1 else '  <- grows with rows'
+        print(f"{path:34} " + ' '.join(f"{n:>7}" for n in per_size) + flag)
+        if flag:
+            growing.append(path)
+    if growing:
+        sys.exit(f"Statement count depends on the row count for {', '.join(growing)}")
+    print("OK: every list endpoint runs the same number of statements at every size")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Check that the hot transaction queries are served by their indexes.
+
+Fills a scratch SQLite database with --rows rows per transaction table,
+runs ANALYZE, then records the statements of each query below and runs
+EXPLAIN QUERY PLAN on them:
+
+  the newest-first keyset lists of rentals, water sales, internet
+  sessions and health records (rented_at, sold_at, purchased_at,
+  visit_date), first and second page, with and without ?customer_id=
+  the rental history lookup by battery_id in delete_battery
+  the (battery_type_id, status) probe in inventory.claim_any_battery
+  open rentals newest first (the returned_at IS NULL partial index)
+
+A step that reads a whole table ('SCAN <table>' without an index) fails
+the check, and so does sorting the result ('USE TEMP B-TREE FOR ORDER
+BY') in the newest-first queries, whose indexes exist to give that order.
+'SCAN <table> USING INDEX' is an index walk in the requested order that
+stops at the page size, which is what the list indexes are for. The claim
+probe may sort: it orders one type's available units by unit number:
+
+    python scripts/queryplan.py --rows 5000
+    python scripts/queryplan.py --verbose
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LIST_PATHS = ('/api/rentals', '/api/water-sales', '/api/internet-access', '/api/health-access')
+
+# A whole-table read has no index after the table name
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+SORT = re.compile(r'^USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+CUSTOMERS = 200
+
+
+def fill(db, rows, battery_type_id, battery_ids):
+    from sqlalchemy import insert
+    from app.models import BatteryRental, Customer, HealthAccess, InternetAccess, WaterSale
+
+    now = datetime.utcnow()
+    db.session.execute(insert(Customer), [{
+        'first_name': f'First{i}', 'last_name': f'Last{i}', 'phone': f'+1555{i:07d}',
+        'address_line1': f'{i} Main Street', 'city': 'Waypoint', 'country': 'Nowhere', 'pin': '1234',
+        'date_of_birth': '01/01/1990', 'birth_city': 'Waypoint',
+    } for i in range(CUSTOMERS)])
+    db.session.execute(insert(BatteryRental), [{
+        'customer_id': i % CUSTOMERS + 1, 'battery_type_id': battery_type_id,
+        'battery_id': battery_ids[i % len(battery_ids)] if i % 2 else None,
+        'rental_price': 0.56, 'delivery_fee': 0.84, 'rented_at': now - timedelta(minutes=i),
+        # Only the most recent few are still out
+        'returned_at': None if i < 20 else now - timedelta(minutes=i - 30),
+    } for i in range(rows)])
+    db.session.execute(insert(WaterSale), [{
+        'customer_id': i % CUSTOMERS + 1, 'size': 20, 'price': 1.5, 'sold_at': now - timedelta(minutes=i),
+    } for i in range(rows)])
+    db.session.execute(insert(InternetAccess), [{
+        'customer_id': i % CUSTOMERS + 1, 'wifi_password': f'pw{i:010d}', 'duration_type': '24h', 'price': 1.0,
+        'purchased_at': now - timedelta(minutes=i), 'expires_at': now + timedelta(days=1, minutes=-i),
+        'status': 'active' if i < 1440 else 'expired',
+    } for i in range(rows)])
+    db.session.execute(insert(HealthAccess), [{
+        'customer_id': i % CUSTOMERS + 1, 'symptoms': 'cough', 'treatments': 'rest', 'notes': '',
+        'visit_date': now - timedelta(minutes=i),
+    } for i in range(rows)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000, help='rows per transaction table')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'queryplan.db')}"
+    os.environ['HTTP_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from sqlalchemy import event, select, text
+    from app import create_app, db, inventory
+    from app.models import Battery, BatteryRental, BatteryType
+
+    app = create_app()
+    client = app.test_client()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    def captured(fn):
+        statements.clear()
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return list(statements)
+
+    def get(path):
+        response = client.get(path)
+        if response.status_code != 200:
+            sys.exit(f"GET {path} failed with {response.status_code}: {response.get_data(as_text=True)}")
+        return response.get_json()
+
+    with app.app_context():
+        battery_type = db.session.scalars(select(BatteryType).where(BatteryType.type == 'battery')).first()
+        battery_ids = db.session.scalars(select(Battery.id).where(Battery.battery_type_id == battery_type.id)).all()
+        fill(db, args.rows, battery_type.id, battery_ids)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+        checks = []
+        for path in LIST_PATHS:
+            for query in ('?limit=10', '?limit=10&customer_id=7'):
+                first = {}
+                checks.append((f"{path}{query}", True, captured(lambda: first.update(get(f"{path}{query}")))))
+                if not first.get('next_cursor'):
+                    sys.exit(f"GET {path}{query} returned a single page, --rows is too small")
+                checks.append((f"{path}{query} page 2", True, captured(
+                    lambda: get(f"{path}{query}&cursor={first['next_cursor']}")
+                )))
+
+        # delete_battery's history check, on a unit with rentals
+        checks.append(('delete_battery history', False, captured(
+            lambda: BatteryRental.query.filter_by(battery_id=battery_ids[1]).first()
+        )))
+
+        def claim():
+            inventory.claim_any_battery(battery_type.id)
+            db.session.rollback()
+        checks.append(('claim_any_battery', False, captured(claim)))
+
+        checks.append(('open rentals', True, captured(lambda: db.session.execute(
+            select(BatteryRental.id).where(BatteryRental.returned_at.is_(None))
+            .order_by(BatteryRental.rented_at.desc(), BatteryRental.id.desc()).limit(50)
+        ).all())))
+
+        connection = db.session.connection()
+        failures = []
+        for name, ordered, executed in checks:
+            steps = []
+            for statement, parameters in executed:
+                steps += [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            bad = [step for step in steps if FULL_SCAN.search(step) or (ordered and SORT.search(step))]
+            indexes = sorted(set(re.findall(r'INDEX (ix_\w+)', ' '.join(steps))))
+            print(f"{name:50} {'SCAN/SORT' if bad else 'indexed':10} {', '.join(indexes)}")
+            if args.verbose or bad:
+                print('\n'.join(f"    {step}" for step in steps))
+            if bad or not executed:
+                failures.append(name)
+        db.session.rollback()
+
+    if failures:
+        sys.exit(f"Queries fell back to a table scan or a sort: {', '.join(failures)}")
+    print("OK: every hot query is served by an index")
+
+
+if __name__ == '__main__':
+    main()
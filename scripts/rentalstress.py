@@ -0,0 +1,135 @@
+"""Check that concurrent rentals never hand out a battery twice.
+
+Starts the application on a scratch file-backed SQLite database (or the
+one given with --database-url) and lets --threads client threads rent
+batteries of one type at once, some asking for any unit and some for a
+specific one, and return about half of what they get. Afterwards it
+checks that no unit has more than one open rental, that unit statuses
+agree with the open rentals, and that the inventory counters match the
+units. Exits non-zero if any of that fails:
+
+    python scripts/rentalstress.py --threads 16 --attempts 20
+    python scripts/rentalstress.py --database-url postgresql://localhost/offgrid_stress
+
+The default type, 'Small Portable Battery', has only 5 units, so nearly
+every attempt contends for the same rows. Requests that fail with 400 lost
+the race and are expected; 5xx responses (e.g. SQLite's 'database is
+locked') are counted separately and do not fail the check.
+"""
+from collections import Counter
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _client(app, battery_type_id, unit_ids, customer_id, attempts, return_fraction, seed, outcomes):
+    rng = random.Random(seed)
+    client = app.test_client()
+    counts = Counter()
+    for _ in range(attempts):
+        body = {'customer_id': customer_id}
+        if rng.random() < 0.5:
+            body['battery_id'] = rng.choice(unit_ids)
+        else:
+            body['battery_type_id'] = battery_type_id
+        response = client.post('/api/rentals', json=body)
+        counts[f"rent {response.status_code}"] += 1
+        if response.status_code == 201 and rng.random() < return_fraction:
+            response = client.post(f"/api/rentals/{response.get_json()['rental_id']}/return")
+            counts[f"return {response.status_code}"] += 1
+    outcomes.append(counts)
+
+
+def check(db, battery_type_id):
+    from sqlalchemy import func, select
+    from app.models import Battery, BatteryInventory, BatteryRental
+
+    problems = []
+    open_rentals = dict(db.session.execute(
+        select(BatteryRental.battery_id, func.count())
+        .where(BatteryRental.battery_type_id == battery_type_id, BatteryRental.returned_at.is_(None))
+        .group_by(BatteryRental.battery_id)
+    ).all())
+    for battery_id, count in open_rentals.items():
+        if count > 1:
+            problems.append(f"battery {battery_id} has {count} open rentals")
+
+    statuses = dict(db.session.execute(
+        select(Battery.id, Battery.status).where(Battery.battery_type_id == battery_type_id)
+    ).all())
+    for battery_id, status in statuses.items():
+        rented = battery_id in open_rentals
+        if (status == 'rented') != rented:
+            problems.append(f"battery {battery_id} is {status} with {open_rentals.get(battery_id, 0)} open rentals")
+
+    counters = db.session.get(BatteryInventory, battery_type_id)
+    actual = Counter(statuses.values())
+    for status in ('available', 'rented', 'maintenance'):
+        if getattr(counters, status) != actual[status]:
+            problems.append(f"inventory counter {status} is {getattr(counters, status)}, units say {actual[status]}")
+    return problems, len(statuses), sum(open_rentals.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=20, help='rentals each thread tries')
+    parser.add_argument('--return-fraction', type=float, default=0.5, help='share of successful rentals returned again')
+    parser.add_argument('--battery-type', default='Small Portable Battery')
+    parser.add_argument('--database-url', help='database to run against, a scratch SQLite file by default')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'rentalstress.db')}"
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads))
+
+    from sqlalchemy import select
+    from app import create_app, db
+    from app.models import Battery, BatteryType, Customer
+
+    app = create_app()
+    with app.app_context():
+        battery_type = db.session.scalars(select(BatteryType).where(BatteryType.name == args.battery_type)).one()
+        unit_ids = db.session.scalars(select(Battery.id).where(Battery.battery_type_id == battery_type.id)).all()
+        customer = Customer(first_name='Stress', last_name='Test', phone=f'+1555{time.time_ns() % 10 ** 7:07d}',
+                            address_line1='1 Main Street', city='Waypoint', country='Nowhere', pin='1234',
+                            date_of_birth='01/01/1990', birth_city='Waypoint')
+        db.session.add(customer)
+        db.session.commit()
+        battery_type_id, customer_id = battery_type.id, customer.id
+
+    outcomes = []
+    threads = [
+        threading.Thread(target=_client, args=(app, battery_type_id, unit_ids, customer_id, args.attempts,
+                                               args.return_fraction, seed, outcomes))
+        for seed in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    totals = sum(outcomes, Counter())
+    print(f"{args.threads} threads x {args.attempts} rentals of {len(unit_ids)} units in {elapsed:.1f} s: "
+          + ', '.join(f"{outcome} x{count}" for outcome, count in sorted(totals.items())))
+    with app.app_context():
+        problems, units, still_open = check(db, battery_type_id)
+    if problems:
+        print("Oversold:")
+        print('\n'.join(f"  {problem}" for problem in problems))
+        sys.exit(1)
+    print(f"OK: {still_open} of {units} units out on rent, no unit rented twice, counters match")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Measure internet sale latency under concurrent purchases.
+
+For each --pool-size (0 generates every WiFi password inline, as sales
+used to) a fresh process starts the application on a scratch SQLite
+database (or --database-url) and --threads client threads each post
+--sales internet purchases to /api/internet-access at once. It prints
+sales per second, latency percentiles, the time wifi_password_pool.take()
+itself costs, and how many active sessions share a password (always 0):
+
+    python scripts/salebench.py --threads 8 --sales 100
+    python scripts/salebench.py --pool-size 0 --pool-size 1024
+
+On SQLite writes are serialized, so sale latency there is mostly commit
+time; run against PostgreSQL to see the pool's share under real
+concurrency.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _client(app, customer_id, sales, latencies, errors):
+    client = app.test_client()
+    body = {'customer_id': customer_id, 'duration_type': '24h', 'price': 1.0}
+    for _ in range(sales):
+        started = time.perf_counter()
+        response = client.post('/api/internet-access', json=body)
+        if response.status_code == 201:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(response.status_code)
+
+
+def run(threads, sales):
+    """Child process: start the app, run the purchases and print the results as JSON."""
+    from sqlalchemy import func, select
+    from app import create_app, db
+    from app.internet import wifi_password_pool
+    from app.models import Customer, InternetAccess
+
+    app = create_app()
+    with app.app_context():
+        customer = Customer(first_name='Sale', last_name='Bench', phone=f'+1555{time.time_ns() % 10 ** 7:07d}',
+                            address_line1='1 Main Street', city='Waypoint', country='Nowhere', pin='1234',
+                            date_of_birth='01/01/1990', birth_city='Waypoint')
+        db.session.add(customer)
+        db.session.commit()
+        customer_id = customer.id
+
+    # Let the refill thread fill the pool first, as it would be between sales
+    wifi_password_pool.take()
+    time.sleep(0.5)
+    # Fewer takes than the pool holds, so none falls back to inline generation
+    takes = wifi_password_pool.size // 2 or 1000
+    started = time.perf_counter()
+    for _ in range(takes):
+        wifi_password_pool.take()
+    take_us = (time.perf_counter() - started) / takes * 10 ** 6
+    time.sleep(0.5)
+
+    latencies, errors = [], []
+    workers = [threading.Thread(target=_client, args=(app, customer_id, sales, latencies, errors))
+               for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        shared = db.session.scalar(select(func.count()).select_from(
+            select(InternetAccess.wifi_password).where(InternetAccess.status == 'active')
+            .group_by(InternetAccess.wifi_password).having(func.count() > 1).subquery()
+        ))
+    latencies.sort()
+    print(json.dumps({
+        'sales_per_second': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 0.5) * 1000 if latencies else None,
+        'p95_ms': _percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': _percentile(latencies, 0.99) * 1000 if latencies else None,
+        'take_us': take_us,
+        'errors': len(errors),
+        'shared_passwords': shared,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--sales', type=int, default=100, help='purchases per thread')
+    parser.add_argument('--pool-size', type=int, action='append', help='WIFI_PASSWORD_POOL_SIZE, 0 and 256 by default')
+    parser.add_argument('--database-url', help='database to run against, a scratch SQLite file per run by default')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run(args.threads, args.sales)
+        return
+
+    print(f"{args.threads} threads x {args.sales} internet sales")
+    print(f"{'pool':>6} {'sales/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'take us':>8} {'errors':>6} {'shared':>6}")
+    for pool_size in args.pool_size or [0, 256]:
+        env = dict(os.environ, WIFI_PASSWORD_POOL_SIZE=str(pool_size), LOG_LEVEL='CRITICAL',
+                   INTERNET_SWEEP_INTERVAL='0', DB_POOL_SIZE=str(args.threads))
+        env['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'salebench.db')}"
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child',
+             '--threads', str(args.threads), '--sales', str(args.sales)],
+            env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            sys.exit(f"Run with a pool of {pool_size} failed:\n{result.stderr}")
+        r = json.loads(result.stdout.splitlines()[-1])
+        if r['p50_ms'] is None:
+            sys.exit(f"No sale succeeded with a pool of {pool_size} ({r['errors']} errors)")
+        print(f"{pool_size:>6} {r['sales_per_second']:>8.0f} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f} "
+              f"{r['p99_ms']:>7.1f} {r['take_us']:>8.1f} {r['errors']:>6} {r['shared_passwords']:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Check that customer search never falls back to scanning a table.
+
+Fills a scratch SQLite database with --rows customers, runs a set of
+searches (whole words, prefixes, several words, phone digits, ID numbers)
+through app.search, records the statements each one sends and runs
+EXPLAIN QUERY PLAN on them. Every step must use the full-text index
+(customer_fts) or an index or primary key lookup; a 'SCAN <table>' step
+fails the check:
+
+    python scripts/searchplan.py --rows 5000
+    python scripts/searchplan.py --query "maria lop" --verbose
+
+Only SQLite is covered; on PostgreSQL use EXPLAIN on the trigram index
+(ix_customer_search_trgm) instead.
+"""
+from types import SimpleNamespace
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_NAMES = ('Ana', 'Luis', 'María', 'José', 'Carmen', 'Pedro', 'Lucía', 'Miguel')
+LAST_NAMES = ('García', 'Rodríguez', 'López', 'Hernández', 'González', 'Pérez', 'Sánchez')
+
+QUERIES = (
+    'garcia',            # whole word
+    'gar',               # prefix
+    'maria lopez',       # several words
+    'jose per',          # word and prefix
+    '5550000123',        # phone number
+    '0000123',           # end of a phone number
+    'AB-0000123',        # ID number
+)
+
+# A table read row by row; virtual tables (the FTS index) report
+# 'SCAN customer_fts VIRTUAL TABLE INDEX ...', which is an index lookup
+FULL_SCAN = re.compile(r'\bSCAN (?!\w+ VIRTUAL TABLE)(\w+)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--query', action='append', help='search to check, the built-in set by default')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'searchplan.db')}"
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('INTERNET_SWEEP_INTERVAL', '0')
+    os.environ.setdefault('WIFI_PASSWORD_POOL_SIZE', '0')
+
+    from sqlalchemy import event, insert
+    from app import create_app, db, search
+    from app.models import Customer
+
+    app = create_app()
+    with app.app_context():
+        customers = []
+        for i in range(args.rows):
+            customer = {
+                'first_name': FIRST_NAMES[i % len(FIRST_NAMES)], 'last_name': LAST_NAMES[i % len(LAST_NAMES)],
+                'phone': f'+1555{i:07d}', 'id_number': f'AB-{i:07d}',
+                'address_line1': f'{i} Main Street', 'city': 'Waypoint', 'country': 'Nowhere', 'pin': '1234',
+                'date_of_birth': '01/01/1990', 'birth_city': 'Waypoint',
+            }
+            customer['search_text'] = search.search_text_for(SimpleNamespace(middle_name=None, second_last_name=None, **customer))
+            customers.append(customer)
+        db.session.execute(insert(Customer), customers)
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        failures = []
+        for query in args.query or QUERIES:
+            statements.clear()
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                results = search.search_customers(query)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+            connection = db.session.connection()
+            steps = []
+            for statement, parameters in statements:
+                steps += [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            scans = [step for step in steps if FULL_SCAN.search(step)]
+            print(f"{query!r:16} {len(results):>3} results, {len(statements)} statements: "
+                  + ('full scan' if scans else 'indexed'))
+            if args.verbose or scans:
+                print('\n'.join(f"    {step}" for step in steps))
+            if scans:
+                failures.append(query)
+
+    if failures:
+        sys.exit(f"Searches fell back to a table scan: {', '.join(map(repr, failures))}")
+    print("OK: every search used the full-text index or an index lookup")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compare list response encodings on a synthetic rental history.
+
+Builds --rows rental list items shaped like GET /api/rentals returns them
+and, for each layout (rows, columns) and encoding (JSON, MessagePack when
+installed), prints the body size and encode time, and the size and time
+of gzip and brotli (when installed) at the server's default levels:
+
+    python scripts/wirebench.py --rows 50000
+
+No database or server is needed; encoding goes through app.wire with the
+JSON provider selected by JSON_ENCODER, as a request would.
+"""
+from datetime import datetime, timedelta
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from app import wire
+
+FIRST_NAMES = ('Ana', 'Luis', 'Maria', 'Jose', 'Carmen', 'Pedro', 'Lucia', 'Miguel')
+LAST_NAMES = ('Garcia', 'Rodriguez', 'Lopez', 'Hernandez', 'Gonzalez', 'Perez', 'Sanchez')
+BATTERIES = (('250 Wh Anker Battery', 80), ('Small Portable Battery', 5), ('Phone Charge at Waypoint', 0))
+
+
+def rental_items(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    items = []
+    for i in range(count, 0, -1):
+        rented_at = start + timedelta(seconds=i * 600 + rng.randrange(600), microseconds=rng.randrange(10 ** 6))
+        name, units = rng.choice(BATTERIES)
+        items.append({
+            'id': i,
+            'customer_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'battery_name': f"{name} (Unit #{rng.randint(1, units)})" if units else name,
+            'rental_price': 0.56 if units else 0.28,
+            'delivery_fee': rng.choice((0.0, 0.84)),
+            'rented_at': rented_at.isoformat(),
+            'returned_at': (rented_at + timedelta(hours=rng.randint(1, 72))).isoformat() if rng.random() < 0.9 else None,
+        })
+    return items
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest is kept')
+    args = parser.parse_args()
+
+    items = rental_items(args.rows)
+    formats = ['json'] + (['msgpack'] if wire.have_msgpack else [])
+    compressor = wire.ResponseCompressor()
+    print(f"{args.rows} rentals; msgpack {'on' if wire.have_msgpack else 'not installed'}, "
+          f"brotli {'on' if wire.have_brotli else 'not installed'}")
+    print(f"{'layout':8} {'format':8} {'bytes':>10} {'encode ms':>10} {'gzip':>10} {'gzip ms':>8} {'br':>10} {'br ms':>8}")
+
+    flask_app = Flask(__name__)
+    flask_app.config['JSON_ENCODER'] = os.environ.get('JSON_ENCODER', 'orjson')
+    flask_app.json = wire.json_provider(flask_app)
+    with flask_app.app_context():
+        for layout in wire.LAYOUTS:
+            def build():
+                if layout == 'columns':
+                    return {'columns': wire.to_columns(items), 'count': len(items), 'next_cursor': None}
+                return {'items': items, 'next_cursor': None}
+
+            for fmt in formats:
+                body, encode_ms = timed(lambda: wire.encode(build(), fmt), args.repeat)
+                gzipped, gzip_ms = timed(lambda: gzip.compress(body, compresslevel=compressor.gzip_level, mtime=0), args.repeat)
+                row = f"{layout:8} {fmt:8} {len(body):>10} {encode_ms:>10.1f} {len(gzipped):>10} {gzip_ms:>8.1f}"
+                if wire.have_brotli:
+                    compressed, br_ms = timed(lambda: wire.brotli.compress(body, quality=compressor.brotli_quality), args.repeat)
+                    row += f" {len(compressed):>10} {br_ms:>8.1f}"
+                print(row)
+
+
+if __name__ == '__main__':
+    main()
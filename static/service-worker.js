@@ -1,77 +0,0 @@
-
-// Service Worker for Offline Support
-const CACHE_NAME = 'offgrid-cache-v1';
-const urlsToCache = [
-  '/',
-  '/index.html',
-  '/css/styles.css',
-  '/js/app.js',
-  '/js/charts.js',
-  '/js/offline.js',
-  '/images/logo.svg'
-];
-
-self.addEventListener('install', event => {
-  event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(cache => {
-        return cache.addAll(urlsToCache);
-      })
-  );
-});
-
-self.addEventListener('fetch', event => {
-  event.respondWith(
-    caches.match(event.request)
-      .then(response => {
-        // Return the cached response if found
-        if (response) {
-          return response;
-        }
-
-        // Try fetching from the network
-        return fetch(event.request)
-          .then(response => {
-            // Check if we received a valid response
-            if (!response || response.status !== 200 || response.type !== 'basic') {
-              return response;
-            }
-
-            // Clone the response as it can only be consumed once
-            var responseToCache = response.clone();
-
-            // Store the successful response in the cache for future offline access
-            caches.open(CACHE_NAME)
-              .then(cache => {
-                cache.put(event.request, responseToCache);
-              });
-
-            return response;
-          })
-          .catch(() => {
-            // If network request fails and it's for an API call, return offline data
-            if (event.request.url.includes('/api/')) {
-              return new Response(JSON.stringify({ offline: true }), {
-                headers: { 'Content-Type': 'application/json' }
-              });
-            }
-          });
-      })
-  );
-});
-
-self.addEventListener('activate', event => {
-  const cacheWhitelist = [CACHE_NAME];
-
-  event.waitUntil(
-    caches.keys().then(cacheNames => {
-      return Promise.all(
-        cacheNames.map(cacheName => {
-          if (cacheWhitelist.indexOf(cacheName) === -1) {
-            return caches.delete(cacheName);
-          }
-        })
-      );
-    })
-  );
-});
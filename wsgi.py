@@ -0,0 +1,6 @@
+from app import create_app
+
+# Entry point for production WSGI servers:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#   waitress-serve --port=5000 --threads=8 wsgi:app
+app = create_app()